@@ -0,0 +1,96 @@
+"""
+Cancellation and concurrency of chat requests (services.request_scheduler)
+against a scripted streaming model; nothing calls DashScope.
+
+    python -m benchmarks.bench_cancel --requests 20 --max-concurrent 2 --token-latency 0.02
+
+Every request is stopped part-way through its answer, then a burst of
+superseding requests is sent. The report shows the cancellation latency
+(cancel() until the task has finished and the model stream is closed), how
+many streams are still open and how many tasks are left behind.
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import time
+
+from services.fakes import HashingEmbeddings, ScriptedChatModel
+from services.rag_service import RagService
+
+
+async def run(args, base_path):
+    chat_model = ScriptedChatModel(
+        responses=[" ".join(f"token{i}" for i in range(args.answer_tokens))],
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+    )
+    service = RagService("bench", embeddings=HashingEmbeddings(), chat_model=chat_model,
+                         base_path=base_path, max_concurrent_queries=args.max_concurrent)
+    service.start()
+    await service.wait_ready()
+    await service.add_document("doc", "some text about the scheduler. " * 50, "bench")
+    baseline_tasks = len(asyncio.all_tasks())
+    rng = random.Random(0)
+
+    # 1. Stop each request after a random number of tokens
+    async def stop_after(request, n):
+        received = 0
+        async for _ in request.stream():
+            received += 1
+            if received >= n:
+                request.cancel()
+        return received
+
+    requests = [service.submit_query(f"question {i}?") for i in range(args.requests)]
+    peak_running = service.request_stats()["running"]
+    consumers = [asyncio.ensure_future(stop_after(r, rng.randint(1, args.answer_tokens // 2))) for r in requests]
+    while not all(c.done() for c in consumers):
+        peak_running = max(peak_running, service.request_stats()["running"])
+        await asyncio.sleep(args.token_latency / 2)
+    await asyncio.gather(*consumers)
+
+    # 2. Each new question supersedes the previous one
+    superseding = []
+    for i in range(args.requests):
+        superseding.append(service.submit_query(f"rapid {i}?", key="chat", supersede=True))
+        await asyncio.sleep(args.token_latency * 3)
+    answers = await asyncio.gather(*(r.wait() for r in superseding))
+
+    await asyncio.sleep(0)
+    leaked = len(asyncio.all_tasks()) - baseline_tasks
+    stats = service.request_stats()
+    return {
+        "requests": args.requests,
+        "max_concurrent": args.max_concurrent,
+        "peak_running": peak_running,
+        "scheduler": stats,
+        "last_superseding_complete": superseding[-1].state == "done" and len(answers[-1]) > 0,
+        "open_model_streams": chat_model.open_streams,
+        "leaked_tasks": leaked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--max-concurrent", type=int, default=2)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    base_path = tempfile.mkdtemp(prefix="bench_cancel_")
+    started = time.perf_counter()
+    try:
+        report = asyncio.run(run(args, base_path))
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
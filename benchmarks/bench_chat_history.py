@@ -0,0 +1,134 @@
+"""
+Persistent chat history (services.chat_history, ui.chat_model) on synthetic
+conversations; nothing calls DashScope.
+
+    python -m benchmarks.bench_chat_history --sizes 1000 10000 100000
+
+For each conversation length the report compares opening it in ChatModel
+(the latest window of messages) against reading every message, in time and
+tracemalloc peak, and times one fetchMore of older messages. A simulated
+answer is then streamed token by token to show how many DB writes the
+batched flushes make.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.bench_markdown_stream import synthetic_answer_tokens
+from services.chat_history import ChatHistory
+
+
+def fill(history, messages):
+    # Bulk insert; append_message() commits per message, which is what the
+    # UI wants but too slow for 100k rows of setup
+    conversation_id = history.create_conversation(f"{messages} messages")
+    rows = []
+    for i in range(messages):
+        tokens = synthetic_answer_tokens(random.Random(i).randint(20, 400), seed=i)
+        rows.append((conversation_id, "user" if i % 2 == 0 else "ai", "".join(tokens), 1, time.time()))
+    with history.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, role, content, complete, created_at) VALUES (?, ?, ?, ?, ?)", rows
+        )
+    return conversation_id
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, round(elapsed, 2), round(peak / 1024, 1)
+
+
+def bench_open(history, sizes, window):
+    from ui.chat_model import ChatModel
+
+    report = []
+    for size in sizes:
+        conversation_id = fill(history, size)
+        model = ChatModel(history, window=window)
+        _, open_ms, open_kib = measure(lambda: model.load_conversation(conversation_id))
+        model.set_top_visible(True)
+        _, fetch_ms, _ = measure(model.fetchMore)
+        _, all_ms, all_kib = measure(lambda: history.messages(conversation_id, limit=size))
+        report.append({
+            "messages": size,
+            "open_ms": open_ms,
+            "open_peak_kib": open_kib,
+            "fetch_older_ms": fetch_ms,
+            "loaded_after_fetch": model.rowCount(),
+            "read_all_ms": all_ms,
+            "read_all_peak_kib": all_kib,
+        })
+    return report
+
+
+def bench_stream(history, tokens, token_interval):
+    from ui.chat_model import ChatModel
+
+    model = ChatModel(history)
+    model.add_message("user", "question")
+    message_id = model.add_message("ai", "Thinking...", streaming=True)
+    history.updates = history.flushes = history.parts_written = 0
+    text = ""
+    update_ms = []
+    for token in synthetic_answer_tokens(tokens, seed=7):
+        text += token
+        started = time.perf_counter()
+        model.update_message(message_id, text)
+        update_ms.append((time.perf_counter() - started) * 1000)
+        time.sleep(token_interval)
+    started = time.perf_counter()
+    model.finish_message(message_id)
+    finish_ms = (time.perf_counter() - started) * 1000
+    stored, _ = history.messages(model.conversation_id)
+    update_ms.sort()
+    return {
+        "tokens": tokens,
+        "token_interval_ms": token_interval * 1000,
+        "flush_interval_ms": history.flush_interval * 1000,
+        "db_writes": history.parts_written,
+        "update_ms_p50": round(update_ms[len(update_ms) // 2], 4),
+        "update_ms_max": round(update_ms[-1], 3),
+        "finish_ms": round(finish_ms, 3),
+        "stored_complete": stored[-1]["content"] == text and bool(stored[-1]["complete"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--window", type=int, default=50)
+    parser.add_argument("--stream-tokens", type=int, default=1000)
+    parser.add_argument("--token-interval", type=float, default=0.005, help="seconds between streamed tokens")
+    args = parser.parse_args()
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+
+    base_path = tempfile.mkdtemp(prefix="bench_chat_history_")
+    try:
+        history = ChatHistory(os.path.join(base_path, "chat_history.sqlite3"))
+        report = {
+            "window": args.window,
+            "open": bench_open(history, args.sizes, args.window),
+            "stream": bench_stream(history, args.stream_tokens, args.token_interval),
+        }
+        history.close()
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Filtered retrieval (services.retrieval_filter) on synthetic text and the
+hashing embedder; nothing calls DashScope.
+
+    python -m benchmarks.bench_filters --chunks 20000
+
+Documents get one of 20 sources and one of four file types. For filters of
+different selectivity the report shows, per strategy, the vector-search
+latency and how many of the k results satisfy the filter and are among the
+exact filtered top k:
+- `post_filter`: unfiltered search, non-matching hits dropped afterwards
+- `hnsw_where`: the HNSW search with the filter as a Chroma `where` clause
+- `exact`: brute-force scoring of the filtered chunks (the fast path taken
+  below RagService.exact_search_limit chunks), filtered vectors cached
+- `exact_uncached`: the same, reading the filtered vectors every time (the
+  first query with a filter, or after a write)
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.bench_suite import percentiles, synthetic_document, synthetic_query
+from services.fakes import HashingEmbeddings, ScriptedChatModel
+from services.rag_service import RagService
+from services.retrieval_filter import RetrievalFilter
+
+FILE_TYPES = ["application/pdf", "text/markdown", "text/plain",
+              "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
+
+
+async def fill(service, chunks, chunks_per_doc):
+    rng = random.Random(1)
+    written = docs = 0
+    while written < chunks:
+        title, text, _ = synthetic_document(rng, docs, chunks_per_doc)
+        written += await service.add_document(title, text, f"team-{docs % 20}",
+                                              mime_type=FILE_TYPES[docs % len(FILE_TYPES)])
+        docs += 1
+    return docs
+
+
+def run_strategy(base, strategy, embedding, k, retrieval_filter):
+    where = retrieval_filter.where()
+    if strategy == "exact_uncached":
+        base.changed()
+        strategy = "exact"
+    if strategy == "exact":
+        return base.exact_search(embedding, k, where)
+    if strategy == "hnsw_where":
+        return base.vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k, filter=where)
+    hits = base.vector_store.similarity_search_by_vector_with_relevance_scores(embedding, k)
+    doc_ids, _ = base.catalog.match_filter(retrieval_filter)
+    allowed = set(doc_ids)
+    return [(doc, distance) for doc, distance in hits if doc.metadata.get("doc_id") in allowed]
+
+
+async def run(args, base_path):
+    service = RagService("bench", embeddings=HashingEmbeddings(), chat_model=ScriptedChatModel(),
+                         base_path=base_path)
+    service.start()
+    await service.wait_ready()
+    started = time.perf_counter()
+    docs = await fill(service, args.chunks, args.chunks_per_doc)
+    build_seconds = time.perf_counter() - started
+    base = await service._kb()
+
+    rng = random.Random(0)
+    queries = [synthetic_query(rng) for _ in range(args.queries)]
+    embeddings = [await service._embed_query(q) for q in queries]
+    filters = {
+        "one_document": RetrievalFilter(titles=["doc-000007"]),
+        "one_source": RetrievalFilter(sources=["team-3"]),
+        "file_type": RetrievalFilter(file_types=["pdf"]),
+        "two_file_types": RetrievalFilter(file_types=["pdf", "md"]),
+    }
+    report = {}
+    for name, retrieval_filter in filters.items():
+        _, filtered_chunks = base.catalog.match_filter(retrieval_filter)
+        truth = [{doc.id for doc, _ in base.exact_search(e, args.k, retrieval_filter.where())} for e in embeddings]
+        entry = {"filtered_chunks": filtered_chunks}
+        for strategy in ("post_filter", "hnsw_where", "exact", "exact_uncached"):
+            run_strategy(base, strategy, embeddings[0], args.k, retrieval_filter)  # warm-up
+            latencies, returned, recall = [], 0, 0
+            for embedding, expected in zip(embeddings, truth):
+                t = time.perf_counter()
+                hits = run_strategy(base, strategy, embedding, args.k, retrieval_filter)
+                latencies.append((time.perf_counter() - t) * 1000)
+                returned += len(hits)
+                recall += len({doc.id for doc, _ in hits} & expected) / max(1, len(expected))
+            entry[strategy] = {"ms": percentiles(latencies)["p50"],
+                               "results_per_query": round(returned / len(queries), 1),
+                               "recall": round(recall / len(queries), 3)}
+        # The whole retrieval as RagService runs it (lexical + vector + fusion)
+        latencies = []
+        for query, embedding in zip(queries, embeddings):
+            t = time.perf_counter()
+            await service._retrieve(query, embedding, k=args.k, filters=retrieval_filter)
+            latencies.append((time.perf_counter() - t) * 1000)
+        entry["retrieve_ms_p50"] = percentiles(latencies)["p50"]
+        entry["path"] = "exact" if filtered_chunks <= service.exact_search_limit else "hnsw_where"
+        report[name] = entry
+    return {"chunks": args.chunks, "documents": docs, "k": args.k, "build_seconds": round(build_seconds, 1),
+            "exact_search_limit": service.exact_search_limit, "filters": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--k", type=int, default=12)
+    args = parser.parse_args()
+
+    base_path = tempfile.mkdtemp(prefix="bench_filters_")
+    try:
+        report = asyncio.run(run(args, base_path))
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Ingestion pipeline throughput against a fake embedder with artificial latency.
+
+    python -m benchmarks.bench_ingest --chunks 2000 --latency 0.05 --batch-size 25 --in-flight 8
+
+With N batches, latency L and C requests in flight, the provider-bound
+ideal is ceil(N / C) * L; the report shows how close the pipeline gets.
+"""
+import argparse
+import asyncio
+import math
+import time
+import uuid
+
+import chromadb
+
+from services.fakes import HashingEmbeddings
+from services.ingest_pipeline import IngestPipeline
+
+
+async def run(chunks: int, latency: float, batch_size: int, in_flight: int):
+    embeddings = HashingEmbeddings(latency=latency)
+    collection = chromadb.EphemeralClient().get_or_create_collection(f"bench_{uuid.uuid4().hex[:8]}")
+    pipeline = IngestPipeline(embeddings, collection, batch_size=batch_size, max_in_flight=in_flight)
+
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 15 for i in range(chunks)]
+    ids = [str(i) for i in range(chunks)]
+    metadatas = [{"i": i} for i in range(chunks)]
+
+    start = time.perf_counter()
+    written = await pipeline.run(ids, texts, metadatas)
+    elapsed = time.perf_counter() - start
+
+    batches = math.ceil(chunks / batch_size)
+    ideal = math.ceil(batches / in_flight) * latency
+    print(f"chunks={written} batches={batches} in_flight={in_flight} latency={latency}s")
+    print(f"elapsed={elapsed:.2f}s ideal={ideal:.2f}s efficiency={ideal / elapsed:.0%} "
+          f"throughput={written / elapsed:.0f} chunks/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--in-flight", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(run(args.chunks, args.latency, args.batch_size, args.in_flight))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Search latency with separate knowledge bases versus one shared collection,
+on synthetic text and the hashing embedder; nothing calls DashScope.
+
+    python -m benchmarks.bench_knowledge_bases --archive-chunks 20000 --team-chunks 1000
+
+A large "archive" base and a small "team" base are built, plus a "default"
+base holding both corpora (the single-collection layout). The report shows
+retrieval latency for the team base alone, the archive alone, a fan-out over
+both, and the combined collection; the per-base statistics; and which bases
+a service that only selects "team" has loaded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.bench_suite import percentiles, synthetic_document, synthetic_query
+from services.fakes import HashingEmbeddings, ScriptedChatModel
+from services.rag_service import RagService
+
+
+async def fill(service, kb, chunks, chunks_per_doc, seed, also_default=False):
+    rng = random.Random(seed)
+    written = docs = 0
+    while written < chunks:
+        title, text, source = synthetic_document(rng, docs, chunks_per_doc)
+        title = f"{kb}-{title}"
+        written += await service.add_document(title, text, source, kb=kb)
+        if also_default:
+            await service.add_document(title, text, source)
+        docs += 1
+    return written
+
+
+async def time_retrieval(service, queries, bases):
+    embeddings = [await service._embed_query(q) for q in queries[:1]]
+    await service._retrieve(queries[0], embeddings[0], k=12, bases=bases)  # builds the BM25 indexes
+    latencies = []
+    for query in queries:
+        embedding = await service._embed_query(query)
+        started = time.perf_counter()
+        await service._retrieve(query, embedding, k=12, bases=bases)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return percentiles(latencies)
+
+
+def new_service(base_path, bases=None):
+    service = RagService("bench", embeddings=HashingEmbeddings(), chat_model=ScriptedChatModel(),
+                         base_path=base_path)
+    if bases:
+        service.default_bases = bases
+    return service
+
+
+async def run(args, base_path):
+    service = new_service(base_path)
+    service.start()
+    await service.wait_ready()
+    service.create_knowledge_base("archive")
+    service.create_knowledge_base("team")
+    started = time.perf_counter()
+    await fill(service, "archive", args.archive_chunks, args.chunks_per_doc, seed=1, also_default=True)
+    await fill(service, "team", args.team_chunks, args.chunks_per_doc, seed=2, also_default=True)
+    build_seconds = time.perf_counter() - started
+
+    rng = random.Random(0)
+    queries = [synthetic_query(rng) for _ in range(args.queries)]
+    latency = {
+        "team": await time_retrieval(service, queries, ["team"]),
+        "archive": await time_retrieval(service, queries, ["archive"]),
+        "team+archive": await time_retrieval(service, queries, ["team", "archive"]),
+        "combined_collection": await time_retrieval(service, queries, ["default"]),
+    }
+    stats = service.knowledge_base_stats()
+
+    # A fresh service that only selects the team base
+    team_only = new_service(base_path, ["team"])
+    team_only.start()
+    await team_only.wait_ready()
+    await time_retrieval(team_only, queries[:5], None)
+    return {
+        "archive_chunks": args.archive_chunks,
+        "team_chunks": args.team_chunks,
+        "build_seconds": round(build_seconds, 1),
+        "retrieve_ms": latency,
+        "knowledge_bases": stats,
+        "team_only_service_loaded": team_only.loaded_knowledge_bases(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive-chunks", type=int, default=20000)
+    parser.add_argument("--team-chunks", type=int, default=1000)
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    base_path = tempfile.mkdtemp(prefix="bench_kb_")
+    try:
+        report = asyncio.run(run(args, base_path))
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Peak memory of ingesting one large file through the streaming path
+(RagService.ingest_file), for growing file sizes, with local fakes.
+
+    python -m benchmarks.bench_large_file --sizes-mb 2 8 --compare
+
+A text file of the given size is generated, parsed into a spool, split and
+embedded. Parsing runs on a thread here (not a worker process) so that
+tracemalloc sees it too. The working set (peak minus what stays allocated:
+the knowledge base's own BM25 postings and embedding LRU) should stay
+roughly flat as the file grows. --compare also measures the whole-text path
+(the file read into one string + add_document, as after extract_text) on
+the same files.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_lexical import synthetic_chunk
+from services.fakes import HashingEmbeddings, ScriptedChatModel
+from services.rag_service import RagService
+
+
+def generate_file(path, size_bytes, seed=0):
+    rng = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < size_bytes:
+            paragraph = synthetic_chunk(rng, 400) + "\n\n"
+            f.write(paragraph)
+            written += len(paragraph.encode("utf-8"))
+
+
+def read_text(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+async def measure(service, path, title, compare):
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+    tracemalloc.start()
+    started = time.perf_counter()
+    if compare:
+        content = await loop.run_in_executor(executor, read_text, path)
+        chunks = await service.add_document(title, content, source=path)
+        del content
+    else:
+        chunks = await service.ingest_file(path, title, executor=executor)
+    seconds = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    executor.shutdown()
+    return {
+        "chunks": chunks,
+        "seconds": round(seconds, 2),
+        "peak_mb": round(peak / 2 ** 20, 2),
+        # What stays allocated afterwards belongs to the knowledge base (BM25
+        # postings, embedding LRU), not to this ingest
+        "retained_mb": round(retained / 2 ** 20, 2),
+        "working_mb": round((peak - retained) / 2 ** 20, 2),
+    }
+
+
+async def run(args, tmp_root):
+    service = RagService("bench", embeddings=HashingEmbeddings(), chat_model=ScriptedChatModel(),
+                         base_path=os.path.join(tmp_root, "kb"))
+    service.start()
+    await service.wait_ready()
+    results = []
+    for size_mb in args.sizes_mb:
+        path = os.path.join(tmp_root, f"large_{size_mb}mb.txt")
+        generate_file(path, int(size_mb * 2 ** 20))
+        print(f"{size_mb} MB...", file=sys.stderr)
+        entry = {"size_mb": size_mb, "streaming": await measure(service, path, f"stream {size_mb}", False)}
+        if args.compare:
+            entry["whole_text"] = await measure(service, path, f"whole {size_mb}", True)
+        results.append(entry)
+        os.remove(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[2, 8])
+    parser.add_argument("--compare", action="store_true", help="also measure the whole-text add_document path")
+    args = parser.parse_args()
+
+    tmp_root = tempfile.mkdtemp(prefix="bench_large_file_")
+    try:
+        results = asyncio.run(run(args, tmp_root))
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
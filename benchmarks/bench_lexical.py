@@ -0,0 +1,79 @@
+"""
+BM25 index build and query time on a synthetic mixed Chinese/English corpus.
+
+    python -m benchmarks.bench_lexical --chunks 100000 --queries 500
+"""
+import argparse
+import random
+import statistics
+import time
+import resource
+
+from services.lexical_index import BM25Index
+
+_EN_WORDS = ("router error timeout config deploy cluster token latency index cache "
+             "release backup invoice refund account password network driver kernel").split()
+_ZH_CHARS = "路由器错误超时配置部署集群令牌延迟索引缓存发布备份发票退款账户密码网络驱动内核"
+
+
+def synthetic_chunk(rng: random.Random, i: int, length: int = 500) -> str:
+    parts = []
+    size = 0
+    while size < length:
+        if rng.random() < 0.5:
+            piece = "".join(rng.choice(_ZH_CHARS) for _ in range(rng.randint(4, 20)))
+        else:
+            piece = " ".join(rng.choice(_EN_WORDS) for _ in range(rng.randint(3, 10)))
+        if rng.random() < 0.05:
+            piece += f" ERR-{rng.randint(100, 999)} v{i % 10}.{rng.randint(0, 9)}"
+        parts.append(piece)
+        size += len(piece)
+    return "。".join(parts)[:length]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [synthetic_chunk(rng, i) for i in range(args.chunks)]
+    ids = [f"chunk-{i}" for i in range(args.chunks)]
+
+    # ru_maxrss is KiB on Linux (tracemalloc would distort the build time)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = BM25Index()
+    start = time.perf_counter()
+    for i in range(0, args.chunks, 1000):
+        index.add_many(ids[i:i + 1000], texts[i:i + 1000])
+    build = time.perf_counter() - start
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+    queries = []
+    for _ in range(args.queries):
+        if rng.random() < 0.5:
+            queries.append("".join(rng.choice(_ZH_CHARS) for _ in range(rng.randint(2, 8))))
+        else:
+            queries.append(" ".join(rng.choice(_EN_WORDS) for _ in range(rng.randint(1, 4)))
+                           + f" ERR-{rng.randint(100, 999)}")
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search(q, k=12)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    print(f"chunks={args.chunks} terms={len(index._postings)}")
+    print(f"build={build:.2f}s ({args.chunks / build:.0f} chunks/s) peak_rss_growth={rss_growth / 1024:.0f} MiB")
+    print(f"query_ms p50={statistics.median(latencies):.2f} p95={percentile(latencies, 0.95):.2f} "
+          f"p99={percentile(latencies, 0.99):.2f}")
+
+
+if __name__ == "__main__":
+    main()
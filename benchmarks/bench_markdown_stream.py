@@ -0,0 +1,90 @@
+"""
+Per-update render cost of a growing streamed answer: full re-render through
+QTextDocument.setMarkdown versus the incremental renderer used for the
+streaming chat row. Runs headless on the offscreen Qt platform.
+
+    python -m benchmarks.bench_markdown_stream --tokens 3000 --tokens-per-update 10
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtGui import QFont, QTextDocument
+from PyQt5.QtWidgets import QApplication
+
+from ui.markdown_stream import IncrementalMarkdownDocument
+
+
+def synthetic_answer_tokens(n, seed=3):
+    rng = random.Random(seed)
+    words = "the index cache query retrieval chunk embedding answer latency token model document".split()
+    tokens = []
+    while len(tokens) < n:
+        kind = rng.random()
+        if kind < 0.6:
+            tokens += [rng.choice(words) + " " for _ in range(rng.randint(20, 60))] + ["\n\n"]
+        elif kind < 0.8:
+            for _ in range(rng.randint(2, 5)):
+                tokens += ["- "] + [rng.choice(words) + " " for _ in range(rng.randint(3, 10))] + ["\n"]
+            tokens.append("\n")
+        else:
+            tokens.append("```python\n")
+            for _ in range(rng.randint(3, 8)):
+                tokens += ["x = ", rng.choice(words), "()\n"]
+            tokens.append("```\n\n")
+    return tokens[:n]
+
+
+def run(render, tokens, step):
+    text = ""
+    costs = []
+    for i in range(0, len(tokens), step):
+        text += "".join(tokens[i:i + step])
+        start = time.perf_counter()
+        render(text)
+        costs.append((time.perf_counter() - start) * 1000)
+    return costs
+
+
+def decile_means(costs):
+    n = max(1, len(costs) // 10)
+    return sum(costs[:n]) / n, sum(costs[-n:]) / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=3000)
+    parser.add_argument("--tokens-per-update", type=int, default=10)
+    parser.add_argument("--width", type=int, default=480)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    font = QFont()
+    tokens = synthetic_answer_tokens(args.tokens)
+
+    def full_render(text):
+        doc = QTextDocument()
+        doc.setDefaultFont(font)
+        doc.setMarkdown(text)
+        doc.setTextWidth(args.width)
+        doc.size()
+
+    incremental = IncrementalMarkdownDocument(font, args.width)
+
+    def incremental_render(text):
+        incremental.set_text(text)
+        incremental.size()
+
+    for name, render in (("full", full_render), ("incremental", incremental_render)):
+        costs = run(render, tokens, args.tokens_per_update)
+        first, last = decile_means(costs)
+        print(f"{name:12s} updates={len(costs)} total={sum(costs):.0f}ms "
+              f"first10%={first:.3f}ms/update last10%={last:.3f}ms/update")
+    app.quit()
+
+
+if __name__ == "__main__":
+    main()
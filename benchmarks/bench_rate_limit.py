@@ -0,0 +1,114 @@
+"""
+Throttling behaviour (services.rate_limiter) against a fake provider that
+answers 429s and adds latency (services.fakes.FakeProviderServer); nothing
+calls DashScope.
+
+    python -m benchmarks.bench_rate_limit --chunks 2000 --questions 20 --server-rps 20
+    python -m benchmarks.bench_rate_limit --no-limiter     # same load, no limiter
+
+A large document is ingested in the background while questions are asked
+every `--interval` seconds, all against one server. The report shows whether
+the ingest and the answers completed, the answer latencies, how many
+requests the server rejected and where the adaptive concurrency limit
+settled.
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import tempfile
+import time
+
+from services.fakes import FakeProviderServer, HashingEmbeddings, ScriptedChatModel
+from services.rag_service import RagService
+from services.rate_limiter import RateLimiter
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3) if ordered else None
+
+
+async def run(args, base_path):
+    server = FakeProviderServer(requests_per_second=args.server_rps, max_concurrent=args.server_concurrency,
+                                latency=args.latency, jitter=args.latency, throttle_rate=args.throttle_rate)
+    limiter = None
+    if not args.no_limiter:
+        limiter = RateLimiter(requests_per_minute=args.server_rps * 60, initial_concurrency=args.server_concurrency,
+                              base_delay=0.1, max_delay=2.0)
+    chat_model = ScriptedChatModel(first_token_latency=0.0, token_latency=0.005, server=server)
+    service = RagService("bench", embeddings=HashingEmbeddings(server=server), chat_model=chat_model,
+                         base_path=base_path, rate_limiter=limiter)
+    service.start()
+    await service.wait_ready()
+    service.query_cache_size = 0
+
+    # ~500-character chunks, each distinct so none is served from the cache
+    text = "\n\n".join(f"Section {i}: " + f"fact{i} " * 80 for i in range(args.chunks))
+
+    async def ingest():
+        started = time.perf_counter()
+        try:
+            await service.add_document("big", text, "bench")
+            return time.perf_counter() - started, None
+        except Exception as e:
+            return time.perf_counter() - started, f"{type(e).__name__}: {e}"
+
+    async def ask(i):
+        started = time.perf_counter()
+        first = None
+        try:
+            async for _ in service.stream_query(f"what is fact{i * 7}?"):
+                first = first or time.perf_counter()
+            return first - started, time.perf_counter() - started, None
+        except Exception as e:
+            return None, None, f"{type(e).__name__}: {e}"
+
+    ingest_task = asyncio.ensure_future(ingest())
+    await asyncio.sleep(args.interval)
+    questions = []
+    for i in range(args.questions):
+        questions.append(asyncio.ensure_future(ask(i)))
+        await asyncio.sleep(args.interval)
+    answers = await asyncio.gather(*questions)
+    ingest_seconds, ingest_error = await ingest_task
+
+    failed = [a[2] for a in answers if a[2]]
+    return {
+        "limiter": not args.no_limiter,
+        "ingest_seconds": round(ingest_seconds, 2),
+        "ingest_error": ingest_error,
+        "questions": args.questions,
+        "question_errors": len(failed),
+        "first_token_p50": percentile([a[0] for a in answers if a[0] is not None], 0.5),
+        "first_token_p95": percentile([a[0] for a in answers if a[0] is not None], 0.95),
+        "answer_p95": percentile([a[1] for a in answers if a[1] is not None], 0.95),
+        "server": {"served": server.served, "rejected": server.rejected, "peak_in_flight": server.peak_in_flight},
+        "rate_limiter": service.rate_limit_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between questions")
+    parser.add_argument("--server-rps", type=float, default=20)
+    parser.add_argument("--server-concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="server latency per request (s)")
+    parser.add_argument("--throttle-rate", type=float, default=0.02, help="fraction of requests answered 429 at random")
+    parser.add_argument("--no-limiter", action="store_true")
+    args = parser.parse_args()
+
+    base_path = tempfile.mkdtemp(prefix="bench_rate_limit_")
+    started = time.perf_counter()
+    try:
+        report = asyncio.run(run(args, base_path))
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
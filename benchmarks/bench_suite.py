@@ -0,0 +1,280 @@
+"""
+End-to-end benchmark of RagService with local fakes (hashing embedder,
+scripted streaming chat model); nothing calls DashScope. For each corpus size
+it measures add_document throughput, get_all_documents latency and memory,
+retrieval latency percentiles and stream_query time-to-first-token, then the
+chat / knowledge delegate render cost on the offscreen Qt platform.
+
+    python -m benchmarks.bench_suite --sizes 1000 10000 100000 --output bench.json
+
+Results are written as JSON so runs can be compared over time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from benchmarks.bench_lexical import synthetic_chunk, _EN_WORDS, _ZH_CHARS
+from benchmarks.bench_markdown_stream import synthetic_answer_tokens
+from services.fakes import HashingEmbeddings, ScriptedChatModel
+from services.rag_service import RagService
+
+
+def percentiles(values_ms):
+    values = sorted(values_ms)
+    if not values:
+        return {}
+
+    def at(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))], 3)
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99),
+            "mean": round(statistics.fmean(values), 3), "max": round(values[-1], 3), "n": len(values)}
+
+
+def synthetic_query(rng):
+    if rng.random() < 0.5:
+        return " ".join(rng.choice(_EN_WORDS) for _ in range(rng.randint(2, 5)))
+    return "".join(rng.choice(_ZH_CHARS) for _ in range(rng.randint(3, 8)))
+
+
+def synthetic_document(rng, index, chunks_per_doc):
+    # Chunks are split at 500 chars with 50 overlap, so ~450 new chars per chunk
+    text = "\n\n".join(synthetic_chunk(rng, index * chunks_per_doc + i, 440) for i in range(chunks_per_doc))
+    return f"doc-{index:06d}", text, f"/bench/{index % 50}/doc-{index:06d}.txt"
+
+
+async def measure_memory(coro_factory):
+    """
+    Runs the coroutine under tracemalloc; returns (result, elapsed ms, peak KiB).
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = await coro_factory()
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, round(elapsed, 3), round(peak / 1024, 1)
+
+
+async def bench_ingest(service, rng, target_chunks, chunks_per_doc):
+    chunks = docs = 0
+    doc_ms = []
+    while chunks < target_chunks:
+        # Generating the text is not part of the measurement
+        title, text, source = synthetic_document(rng, docs, chunks_per_doc)
+        t = time.perf_counter()
+        chunks += await service.add_document(title, text, source)
+        doc_ms.append((time.perf_counter() - t) * 1000)
+        docs += 1
+    elapsed = sum(doc_ms) / 1000
+    return {
+        "documents": docs,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "documents_per_s": round(docs / elapsed, 2),
+        "add_document_ms": percentiles(doc_ms),
+    }
+
+
+async def bench_listing(service, documents, repeats):
+    results = {}
+    cases = {
+        "first_page": dict(offset=0, limit=50),
+        "last_page": dict(offset=max(0, documents - 50), limit=50),
+        "search_page": dict(offset=0, limit=50, query="doc-0001"),
+        "all_rows": dict(offset=0, limit=None),
+    }
+    for name, kwargs in cases.items():
+        latencies = []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            await service.get_all_documents(**kwargs)
+            latencies.append((time.perf_counter() - t) * 1000)
+        rows, _, peak_kib = await measure_memory(lambda: service.get_all_documents(**kwargs))
+        results[name] = {"rows": len(rows), "latency_ms": percentiles(latencies), "peak_kib": peak_kib}
+    return results
+
+
+async def bench_retrieval(service, rng, queries):
+    # The first query builds the lexical index from the collection
+    t = time.perf_counter()
+    embedding = await service._embed_query(synthetic_query(rng))
+    await service._retrieve("warm up", embedding)
+    first_ms = (time.perf_counter() - t) * 1000
+
+    embed_ms, retrieve_ms = [], []
+    for _ in range(queries):
+        query = synthetic_query(rng)
+        t0 = time.perf_counter()
+        embedding = await service._embed_query(query)
+        t1 = time.perf_counter()
+        await service._retrieve(query, embedding)
+        t2 = time.perf_counter()
+        embed_ms.append((t1 - t0) * 1000)
+        retrieve_ms.append((t2 - t1) * 1000)
+    return {"first_query_ms": round(first_ms, 3), "embed_ms": percentiles(embed_ms),
+            "retrieve_ms": percentiles(retrieve_ms)}
+
+
+async def bench_stream(service, rng, queries):
+    async def one(query):
+        start = time.perf_counter()
+        ttft = None
+        async for _ in service.stream_query(query):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        return ttft * 1000, (time.perf_counter() - start) * 1000
+
+    asked = [f"{synthetic_query(rng)} #{i}" for i in range(queries)]
+    miss_ttft, miss_total, hit_ttft = [], [], []
+    for query in asked:
+        ttft, total = await one(query)
+        miss_ttft.append(ttft)
+        miss_total.append(total)
+    for query in asked:
+        hit_ttft.append((await one(query))[0])  # answered from the query cache
+    return {"ttft_ms": percentiles(miss_ttft), "total_ms": percentiles(miss_total),
+            "cached_ttft_ms": percentiles(hit_ttft)}
+
+
+async def bench_corpus(size, args, tmp_root):
+    rng = random.Random(args.seed)
+    embeddings = HashingEmbeddings(latency=args.embed_latency)
+    chat_model = ScriptedChatModel(
+        responses=["".join(synthetic_answer_tokens(args.answer_tokens, seed=s)) for s in range(4)],
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+    )
+    service = RagService("bench", embeddings=embeddings, chat_model=chat_model,
+                         base_path=os.path.join(tmp_root, f"corpus_{size}"))
+
+    t = time.perf_counter()
+    await service.wait_ready()
+    result = {"chunks_target": size, "startup_s": round(time.perf_counter() - t, 3)}
+
+    result["ingest"] = await bench_ingest(service, rng, size, args.chunks_per_doc)
+    result["listing"] = await bench_listing(service, result["ingest"]["documents"], args.repeats)
+    result["retrieval"] = await bench_retrieval(service, rng, args.queries)
+    result["stream_query"] = await bench_stream(service, rng, args.stream_queries)
+    result["embedding_calls"] = embeddings.calls
+    result["embedding_cache"] = service.embedding_cache_stats()
+    return result
+
+
+def bench_render(rows, width):
+    from PyQt5.QtCore import QRect
+    from PyQt5.QtGui import QImage, QPainter, QStandardItem, QStandardItemModel
+    from PyQt5.QtWidgets import QApplication, QStyleOptionViewItem
+    from ui.chat_model import ChatModel, ChatDelegate
+    from ui.knowledge_model import KnowledgeDelegate, SourceRole, SummaryRole
+
+    app = QApplication.instance() or QApplication([])
+    image = QImage(width, 1000, QImage.Format_ARGB32)
+
+    def paint_pass(delegate, model):
+        painter = QPainter(image)
+        option = QStyleOptionViewItem()
+        option.font = app.font()
+        costs = []
+        for row in range(model.rowCount()):
+            index = model.index(row, 0)
+            start = time.perf_counter()
+            option.rect = QRect(0, 0, width, 1000)
+            height = delegate.sizeHint(option, index).height()
+            option.rect = QRect(0, 0, width, height)
+            delegate.paint(painter, option, index)
+            costs.append((time.perf_counter() - start) * 1000)
+        painter.end()
+        return percentiles(costs)
+
+    chat = ChatModel()
+    for i in range(rows):
+        tokens = synthetic_answer_tokens(random.Random(i).randint(20, 400), seed=i)
+        chat.add_message("user" if i % 2 == 0 else "ai", "".join(tokens))
+    chat_delegate = ChatDelegate()
+
+    rng = random.Random(1)
+    knowledge = QStandardItemModel()
+    for i in range(rows):
+        item = QStandardItem(f"doc-{i:06d}")
+        item.setData(f"/bench/{i % 50}/doc-{i:06d}.txt", SourceRole)
+        item.setData(synthetic_chunk(rng, i, 200) + "...", SummaryRole)
+        knowledge.appendRow(item)
+    knowledge_delegate = KnowledgeDelegate()
+
+    result = {
+        "rows": rows,
+        "width": width,
+        "chat_cold_ms": paint_pass(chat_delegate, chat),   # parse + layout + paint
+        "chat_warm_ms": paint_pass(chat_delegate, chat),   # cached layouts
+        "knowledge_ms": paint_pass(knowledge_delegate, knowledge),
+    }
+    result["chat_cache_hits"] = chat_delegate.cache_hits
+    result["chat_cache_misses"] = chat_delegate.cache_misses
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="corpus sizes in chunks")
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per embedding call")
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--stream-queries", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--render-rows", type=int, default=300)
+    parser.add_argument("--render-width", type=int, default=700)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "args": vars(args), "corpora": []}
+    tmp_root = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        for size in args.sizes:
+            print(f"corpus {size} chunks...", file=sys.stderr)
+            report["corpora"].append(asyncio.run(bench_corpus(size, args, tmp_root)))
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+    print("delegate render...", file=sys.stderr)
+    report["render"] = bench_render(args.render_rows, args.render_width)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"wrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,134 @@
 import sys
 import os
 import asyncio
+import argparse
+
+# Imported first so startup phases are timed from (almost) process start
+from services.startup_profile import startup_profile
+
 from PyQt5.QtWidgets import QApplication, QInputDialog, QMessageBox
 from qasync import QEventLoop
 
-from services.rag_service import RagService
-from ui.mainwindow import MainWindow
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Tongyi RAG Desktop")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print a per-phase startup timing breakdown")
+    parser.add_argument("--perf-panel", action="store_true",
+                        help="show the per-stage latency panel at startup")
+    parser.add_argument("--otel", action="store_true",
+                        help="also export spans through OpenTelemetry (needs opentelemetry-api)")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="retrieve for the question being typed before it is sent")
+    parser.add_argument("--max-concurrent", type=int, default=2,
+                        help="answers generated at the same time; further questions wait (default 2)")
+    parser.add_argument("--supersede", action="store_true",
+                        help="a new question stops the answers still in progress")
+    parser.add_argument("--kb", action="append",
+                        help="knowledge base searched by the chat (repeatable; default: default)")
+    parser.add_argument("--rpm", type=float, default=600,
+                        help="DashScope requests per minute, shared by embeddings and chat (0: no limiter)")
+    parser.add_argument("--tpm", type=float, default=None,
+                        help="DashScope tokens per minute (estimated; default: no token limit)")
+    parser.add_argument("--embeddings", default=os.environ.get("RAG_EMBEDDINGS", "dashscope"),
+                        help="embedding provider: dashscope (default), onnx, sentence-transformers")
+    parser.add_argument("--embedding-model", default=os.environ.get("RAG_EMBEDDING_MODEL"),
+                        help="local model directory for the onnx / sentence-transformers providers")
+    parser.add_argument("--embedding-threads", type=int, default=None,
+                        help="CPU threads for a local embedding model")
+    # Qt consumes its own options (-style, -platform, ...)
+    args, _ = parser.parse_known_args(argv[1:])
+    return args
+
+async def warm_up(app, rag_service, profile):
+    """
+    Opens the service in the background once the window is up. Queries and
+    ingests issued before this finishes simply wait for it.
+    """
+    try:
+        await rag_service.wait_ready()
+    except Exception as e:
+        QMessageBox.critical(None, "Initialization Error", f"Failed to initialize services:\n{str(e)}")
+        app.exit(1)
+        return
+    startup_profile.finish("service.ready")
+    if profile:
+        print(startup_profile.report(), file=sys.stderr)
 
 def main():
-    app = QApplication(sys.argv)
-    loop = QEventLoop(app)
-    asyncio.set_event_loop(loop)
-    
+    args = parse_args(sys.argv)
+
+    with startup_profile.phase("qt.application"):
+        app = QApplication(sys.argv)
+        loop = QEventLoop(app)
+        asyncio.set_event_loop(loop)
+
     # Default API Key (Replace 'sk-...' with your actual key if you want to skip input)
-    DEFAULT_API_KEY = "。。。sk-..." 
-    
+    DEFAULT_API_KEY = "。。。sk-..."
+
     # Check API Key
     api_key = os.environ.get("DASHSCOPE_API_KEY") or DEFAULT_API_KEY
-    
+
     if not api_key or api_key.startswith("sk-...") and len(api_key) < 10:
         key, ok = QInputDialog.getText(
-            None, "API Key Required", 
-            "Please enter your Alibaba DashScope API Key:\n(Starts with sk-...)", 
+            None, "API Key Required",
+            "Please enter your Alibaba DashScope API Key:\n(Starts with sk-...)",
         )
         if ok and key:
             api_key = key.strip()
         else:
             QMessageBox.critical(None, "Error", "API Key is required to run this application.")
             sys.exit(1)
-            
-    # Initialize Service
-    try:
-        rag_service = RagService(api_key)
-    except Exception as e:
-        QMessageBox.critical(None, "Initialization Error", f"Failed to initialize services:\n{str(e)}")
-        sys.exit(1)
-        
+
+    # Constructing the service is cheap; LangChain / Chroma are loaded by
+    # rag_service.start() on a background thread after the window is shown.
+    with startup_profile.phase("import.app_modules"):
+        from services.rag_service import RagService
+        from services.telemetry import tracer, RingBufferSink, JsonlSink, OpenTelemetrySink
+        from ui.mainwindow import MainWindow
+        from services.chat_history import ChatHistory
+    rag_service = RagService(
+        api_key,
+        embedding_provider=args.embeddings,
+        embedding_options={"model_path": args.embedding_model, "threads": args.embedding_threads},
+        max_concurrent_queries=args.max_concurrent,
+    )
+    if args.kb:
+        rag_service.default_bases = args.kb
+    rag_service.rate_limits = (
+        {"requests_per_minute": args.rpm, "tokens_per_minute": args.tpm} if args.rpm > 0 else None
+    )
+
+    # Per-stage latency spans: kept in memory for the performance panel and
+    # appended to a rotating log next to the data directory
+    span_buffer = RingBufferSink()
+    tracer.add_sink(span_buffer)
+    tracer.add_sink(JsonlSink(os.path.join(rag_service.base_path, "logs", "spans.jsonl")))
+    if args.otel:
+        try:
+            tracer.add_sink(OpenTelemetrySink())
+        except ImportError as e:
+            print(f"OpenTelemetry export disabled: {e}", file=sys.stderr)
+
+    # Conversations: one small SQLite file, read a page at a time
+    with startup_profile.phase("open.chat_history"):
+        os.makedirs(rag_service.base_path, exist_ok=True)
+        history = ChatHistory(os.path.join(rag_service.base_path, "chat_history.sqlite3"))
+
     # Show Window
-    window = MainWindow(rag_service)
-    window.show()
-    
+    with startup_profile.phase("ui.build"):
+        window = MainWindow(rag_service, span_buffer, show_perf_panel=args.perf_panel,
+                            prefetch=args.prefetch, supersede=args.supersede, history=history)
+    with startup_profile.phase("ui.show"):
+        window.show()
+        app.processEvents()  # get the first frame on screen before warming up
+    startup_profile.mark("window.shown")
+
+    rag_service.start()
+    asyncio.ensure_future(warm_up(app, rag_service, args.profile_startup))
+
     with loop:
         loop.run_forever()
+    history.close()
 
 if __name__ == "__main__":
     main()
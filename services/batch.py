@@ -0,0 +1,232 @@
+"""
+Runs a file of questions through the RAG pipeline without the GUI.
+
+    python -m services.batch questions.jsonl --output results.jsonl --concurrency 4 --rps 2
+
+Each input line is a JSON object with a "question" (and optionally an "id"
+and a "filter" such as {"file_types": ["pdf"], "ingested_after": "2024-01-01"},
+see services.retrieval_filter; other fields are copied to the result). One result line is appended per
+question as soon as it finishes: the answer, the ids of the chunks it was
+based on, per-stage timings in ms and the error, if any. Re-running with the
+same output file skips questions that already have a successful result, so
+an interrupted run resumes where it stopped (failed ones are retried).
+
+With `--embeddings hashing --fake-chat --ingest DIR --data-dir SCRATCH` it
+runs end to end on local fakes, e.g. as a smoke test.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import Dict, Iterator, List, Set
+
+from .embedding_providers import available_providers
+from .rag_service import RagService, DESKTOP_APP_NAME, default_base_path
+from .rate_limiter import TokenBucket
+from .retrieval_filter import RetrievalFilter
+from .telemetry import tracer, TraceCollector
+
+logger = logging.getLogger(__name__)
+
+
+def read_questions(path: str) -> Iterator[Dict]:
+    """
+    Yields the questions of a JSONL file; lines without an "id" get their
+    line number as id.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            if not record.get("question"):
+                raise ValueError(f"{path}:{line_no}: missing \"question\"")
+            record["id"] = str(record.get("id", line_no))
+            yield record
+
+
+def load_finished(path: str) -> Set[str]:
+    """
+    Ids with a successful result in an earlier run's output. A last line cut
+    off by an interruption is removed so appending starts on a fresh line.
+    """
+    finished: Set[str] = set()
+    if not os.path.exists(path):
+        return finished
+    valid_end = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                break
+            valid_end += len(raw)
+            if not record.get("error"):
+                finished.add(str(record.get("id")))
+    if valid_end != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(valid_end)
+    return finished
+
+
+def stage_timings(spans: List[Dict]) -> Dict[str, float]:
+    # Total ms per span name (a stage can run more than once per question)
+    timings: Dict[str, float] = {}
+    for span in spans:
+        timings[span["name"]] = round(timings.get(span["name"], 0.0) + span["duration_ms"], 3)
+    return timings
+
+
+async def run_batch(service: RagService, questions: List[Dict], output_path: str, concurrency: int = 4,
+                    rps: float = 0.0, progress_callback=None) -> Dict:
+    """
+    Answers `questions` with at most `concurrency` in flight and `rps` started
+    per second, appending one JSON line per question to `output_path` as it
+    completes. Returns a summary of this run.
+    """
+    collector = TraceCollector()
+    tracer.add_sink(collector)
+    slots = asyncio.Semaphore(concurrency)
+    # Question starts are spaced out to `rps` per second (no limit if 0)
+    starts = TokenBucket(rps, capacity=1) if rps > 0 else None
+    latencies: List[float] = []
+    errors = 0
+    done = 0
+
+    async def answer(record: Dict, out):
+        nonlocal errors, done
+        async with slots:
+            if starts is not None:
+                await starts.take()
+            started = time.perf_counter()
+            sources = []
+            pieces = []
+            error = None
+            with tracer.span("batch.question", id=record["id"]) as span:
+                try:
+                    filters = RetrievalFilter.from_dict(record.get("filter"))
+                    async for piece in service.stream_query(record["question"], sources=sources, filters=filters):
+                        pieces.append(piece)
+                except Exception as e:
+                    logger.debug("Question %s failed: %r", record["id"], e)
+                    error = f"{type(e).__name__}: {e}"
+            seconds = time.perf_counter() - started
+            spans = collector.pop(span.trace_id)
+        result = dict(record)
+        result.update(
+            answer="".join(pieces),
+            chunk_ids=[doc.id for doc in sources],
+            cached=any(s["name"] == "query.stream" and s.get("cached") for s in spans),
+            timings=stage_timings(s for s in spans if s["name"] != "batch.question"),
+            seconds=round(seconds, 3),
+            error=error,
+        )
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        out.flush()
+        done += 1
+        if error:
+            errors += 1
+        else:
+            latencies.append(seconds)
+        if progress_callback:
+            progress_callback(done, len(questions))
+
+    started = time.perf_counter()
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            await asyncio.gather(*(answer(record, out) for record in questions))
+    finally:
+        tracer.remove_sink(collector)
+    latencies.sort()
+    return {
+        "questions": len(questions),
+        "errors": errors,
+        "seconds": round(time.perf_counter() - started, 2),
+        "latency_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+        "latency_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+        "latency_mean": round(statistics.mean(latencies), 3) if latencies else None,
+    }
+
+
+def build_service(args) -> RagService:
+    chat_model = None
+    if args.fake_chat:
+        from .fakes import ScriptedChatModel
+        chat_model = ScriptedChatModel(first_token_latency=args.fake_latency, token_latency=args.fake_latency / 10)
+    api_key = os.environ.get("DASHSCOPE_API_KEY", "")
+    if not api_key and not (args.fake_chat and args.embeddings != "dashscope"):
+        raise SystemExit("DASHSCOPE_API_KEY is not set")
+    return RagService(
+        api_key or "unused",
+        chat_model=chat_model,
+        base_path=args.data_dir or default_base_path(DESKTOP_APP_NAME),
+        embedding_provider=args.embeddings,
+        embedding_options={"model_path": args.embedding_model, "threads": args.threads},
+    )
+
+
+async def main_async(args) -> Dict:
+    service = build_service(args)
+    if args.kb:
+        if args.ingest:
+            service.create_knowledge_base(args.kb[0])
+        service.default_bases = args.kb
+    service.start()
+    await service.wait_ready()
+    if args.no_cache:
+        service.query_cache_size = 0
+    if args.ingest:
+        report = await service.ingest_directory(args.ingest, kb=service.default_bases[0])
+        failed = [r for r in report if r["status"] != "ok"]
+        print(f"Ingested {len(report) - len(failed)}/{len(report)} files from {args.ingest}", file=sys.stderr)
+
+    finished = load_finished(args.output)
+    questions = [q for q in read_questions(args.input) if q["id"] not in finished]
+    if finished:
+        print(f"Resuming: {len(finished)} already answered, {len(questions)} to go", file=sys.stderr)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} questions", end="", file=sys.stderr, flush=True)
+
+    summary = await run_batch(service, questions, args.output, args.concurrency, args.rps, progress)
+    print(file=sys.stderr)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions without the GUI")
+    parser.add_argument("input", help="JSONL file, one {\"question\": ..., \"id\": ...} per line")
+    parser.add_argument("--output", help="results JSONL (appended to; default: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="questions in flight at once")
+    parser.add_argument("--rps", type=float, default=0.0, help="max questions started per second (0: no limit)")
+    parser.add_argument("--no-cache", action="store_true", help="do not answer repeated questions from the cache")
+    parser.add_argument("--data-dir", help="knowledge base directory (default: the desktop app's)")
+    parser.add_argument("--ingest", help="ingest this folder into the (first) knowledge base first")
+    parser.add_argument("--kb", action="append",
+                        help="knowledge base to search (repeatable; default: default)")
+    parser.add_argument("--embeddings", default=os.environ.get("RAG_EMBEDDINGS", "dashscope"),
+                        choices=available_providers())
+    parser.add_argument("--embedding-model", default=os.environ.get("RAG_EMBEDDING_MODEL"),
+                        help="local model directory for the onnx / sentence-transformers providers")
+    parser.add_argument("--threads", type=int, help="CPU threads for local embedding backends")
+    parser.add_argument("--fake-chat", action="store_true", help="scripted local chat model instead of DashScope")
+    parser.add_argument("--fake-latency", type=float, default=0.0, help="first-token latency of --fake-chat (s)")
+    args = parser.parse_args()
+    args.output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    summary = asyncio.run(main_async(args))
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
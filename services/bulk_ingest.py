@@ -0,0 +1,74 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import List, Dict, Tuple, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md")
+
+FileProgressCallback = Callable[[int, int, Dict], None]
+
+
+def scan_directory(root: str, extensions=SUPPORTED_EXTENSIONS) -> List[Tuple[str, int]]:
+    """
+    Walks a directory tree and returns (path, size) for every supported file,
+    largest first so a single big PDF never ends up holding up the tail.
+    """
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.startswith(".") or not name.lower().endswith(extensions):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                files.append((path, os.path.getsize(path)))
+            except OSError:
+                continue
+    files.sort(key=lambda f: f[1], reverse=True)
+    return files
+
+
+async def ingest_directory(rag_service, root: str, executor: Executor, workers: int,
+                           progress_callback: Optional[FileProgressCallback] = None,
+                           kb: Optional[str] = None) -> List[Dict]:
+    """
+    Parses every supported file under `root` in `executor` (a process pool)
+    and ingests each one into knowledge base `kb` as soon as it is parsed
+    (`rag_service.ingest_file`, which spools the text to disk rather than
+    holding it in memory).
+    Returns one report entry per file: path, status ("ok"/"failed"), chunks, error, seconds.
+    """
+    files = scan_directory(root)
+    total = len(files)
+    report: List[Dict] = []
+
+    # Keep only a couple of parsed-but-not-ingested files per worker around,
+    # so a fast parser cannot pile spooled texts up on disk.
+    slots = asyncio.Semaphore(workers * 2)
+
+    async def process(path: str):
+        started = time.perf_counter()
+        entry = {"path": path, "status": "ok", "chunks": 0, "error": ""}
+        try:
+            entry["chunks"] = await rag_service.ingest_file(path, os.path.relpath(path, root), source=path,
+                                                            executor=executor, kb=kb)
+        except Exception as e:
+            logger.warning("Failed to ingest %s: %s", path, e)
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+        finally:
+            slots.release()
+        entry["seconds"] = round(time.perf_counter() - started, 3)
+        report.append(entry)
+        if progress_callback:
+            progress_callback(len(report), total, entry)
+
+    tasks = []
+    for path, _ in files:
+        await slots.acquire()
+        tasks.append(asyncio.create_task(process(path)))
+    await asyncio.gather(*tasks)
+    return report
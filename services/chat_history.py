@@ -0,0 +1,272 @@
+"""
+Persistent chat history (SQLite, WAL).
+
+Messages are only ever appended. An answer that is still streaming gets
+its text appended as parts (offset, text): the text is the previous text
+cut at `offset` plus `text`, so a growing answer costs one small row per
+flush and a replaced placeholder is a part at offset 0. Parts are
+buffered and flushed every `flush_interval` seconds (or `flush_chars`
+characters), not per token, and folded into the message once it
+finishes. Reading is always by (conversation, id) index, one page at a
+time, so opening a long conversation costs the same as a short one.
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+INTERRUPTED_NOTE = "\n\n*(interrupted)*"
+
+
+def _apply_part(text: str, offset: int, part: str) -> str:
+    return text[:offset] + part
+
+
+class ChatHistory:
+    def __init__(self, db_path: str, flush_interval: float = 0.5, flush_chars: int = 4096):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a crash loses at most the last transactions, never corrupts
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+        # Streaming messages: latest text not yet written, and the text the
+        # stored parts add up to
+        self._pending: Dict[int, str] = {}
+        self._stored: Dict[int, str] = {}
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+
+        self.updates = 0  # update_message() calls
+        self.flushes = 0
+        self.parts_written = 0
+        self.recovered = self._recover()
+
+    def _create_schema(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL DEFAULT '',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at)"
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL DEFAULT '',
+                    complete INTEGER NOT NULL DEFAULT 1,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)"
+            )
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS message_parts (
+                    message_id INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_message_parts_message ON message_parts (message_id)"
+            )
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            with self.conn:
+                yield self.conn
+
+    def _recover(self) -> int:
+        """
+        Completes answers that were still streaming when the app last
+        stopped, from their stored parts.
+        """
+        with self._lock:
+            rows = self.conn.execute("SELECT id, content FROM messages WHERE complete = 0").fetchall()
+        for row in rows:
+            self.finish_message(row["id"], self._with_parts(row["id"], row["content"]) + INTERRUPTED_NOTE)
+        return len(rows)
+
+    def _with_parts(self, message_id: int, content: str) -> str:
+        with self._lock:
+            parts = self.conn.execute(
+                "SELECT offset, text FROM message_parts WHERE message_id = ? ORDER BY rowid", (message_id,)
+            ).fetchall()
+        for offset, text in parts:
+            content = _apply_part(content, offset, text)
+        return content
+
+    # Conversations
+
+    def create_conversation(self, title: str = "") -> int:
+        now = time.time()
+        with self.transaction() as conn:
+            return conn.execute(
+                "INSERT INTO conversations (title, created_at, updated_at) VALUES (?, ?, ?)", (title, now, now)
+            ).lastrowid
+
+    def rename_conversation(self, conversation_id: int, title: str):
+        with self.transaction() as conn:
+            conn.execute("UPDATE conversations SET title = ? WHERE id = ?", (title, conversation_id))
+
+    def delete_conversation(self, conversation_id: int):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM message_parts WHERE message_id IN "
+                         "(SELECT id FROM messages WHERE conversation_id = ?)", (conversation_id,))
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def list_conversations(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """
+        One page of conversations, most recently active first.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, title, created_at, updated_at FROM conversations "
+                "ORDER BY updated_at DESC, id DESC LIMIT ? OFFSET ?",
+                (limit if limit is not None else -1, offset)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def get_conversation(self, conversation_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, title, created_at, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    # Messages
+
+    def append_message(self, conversation_id: int, role: str, content: str, complete: bool = True) -> int:
+        """
+        Appends a message and returns its id (ids grow with time). A message
+        appended with `complete=False` is streaming: update it with
+        update_message() and end it with finish_message().
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            message_id = conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, complete, created_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, role, content, int(complete), now)
+            ).lastrowid
+            conn.execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (now, conversation_id))
+        if not complete:
+            self._stored[message_id] = content
+        return message_id
+
+    def update_message(self, message_id: int, content: str):
+        """
+        Records the latest text of a streaming message. Written with the
+        next flush: at most every `flush_interval` seconds, or once
+        `flush_chars` characters are pending.
+        """
+        if message_id not in self._stored:
+            return  # not streaming (or already finished)
+        self.updates += 1
+        stored = len(self._stored[message_id])
+        previous = self._pending.get(message_id)
+        # Characters not written yet (an answer grows at its end)
+        self._pending_chars += abs(len(content) - stored) - (abs(len(previous) - stored) if previous is not None else 0)
+        self._pending[message_id] = content
+        if self._pending_chars >= self.flush_chars or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the pending text of all streaming messages in one transaction,
+        one part per message.
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        parts = []
+        for message_id, content in self._pending.items():
+            stored = self._stored.get(message_id, "")
+            offset = 0
+            limit = min(len(stored), len(content))
+            while offset < limit and stored[offset] == content[offset]:
+                offset += 1
+            if offset == len(stored) == len(content):
+                continue
+            parts.append((message_id, offset, content[offset:]))
+            self._stored[message_id] = content
+        self._pending.clear()
+        self._pending_chars = 0
+        if parts:
+            with self.transaction() as conn:
+                conn.executemany("INSERT INTO message_parts (message_id, offset, text) VALUES (?, ?, ?)", parts)
+            self.parts_written += len(parts)
+        self.flushes += 1
+
+    def finish_message(self, message_id: int, content: str):
+        """
+        Stores the final text of a streaming message and drops its parts.
+        """
+        pending = self._pending.pop(message_id, None)
+        stored = self._stored.pop(message_id, None)
+        if pending is not None:
+            self._pending_chars -= abs(len(pending) - len(stored))
+        with self.transaction() as conn:
+            conn.execute("UPDATE messages SET content = ?, complete = 1 WHERE id = ?", (content, message_id))
+            conn.execute("DELETE FROM message_parts WHERE message_id = ?", (message_id,))
+
+    def messages(self, conversation_id: int, before_id: Optional[int] = None,
+                 limit: int = 50) -> Tuple[List[Dict], bool]:
+        """
+        Up to `limit` messages older than `before_id` (default: the newest),
+        oldest first, and whether there are older ones still.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, role, content, complete, created_at FROM messages "
+                "WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, before_id if before_id is not None else 2 ** 63 - 1, limit + 1)
+            ).fetchall()
+        has_more = len(rows) > limit
+        page = [dict(r) for r in reversed(rows[:limit])]
+        for message in page:
+            if not message["complete"]:
+                # Streaming right now: the stored parts, or the unwritten text
+                message_id = message["id"]
+                if message_id in self._pending:
+                    message["content"] = self._pending[message_id]
+                elif message_id in self._stored:
+                    message["content"] = self._stored[message_id]
+                else:
+                    message["content"] = self._with_parts(message_id, message["content"])
+        return page, has_more
+
+    def count_messages(self, conversation_id: int) -> int:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict:
+        return {
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "parts_written": self.parts_written,
+            "streaming": len(self._stored),
+            "recovered": self.recovered,
+        }
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
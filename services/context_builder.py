@@ -0,0 +1,256 @@
+import math
+import re
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .lexical_index import _CJK, tokenize
+
+_CJK_CHARS_RE = re.compile(rf"[{_CJK}]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap prompt-token estimate: one token per CJK character, one per ~4
+    characters of anything else. Close enough for budgeting without loading
+    the model's tokenizer.
+    """
+    cjk = len(_CJK_CHARS_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _stitch(first, second) -> Optional[str]:
+    # Two (start, end, text) ranges of one document joined without repeating
+    # their overlap; None if there is a gap between them
+    (s1, e1, t1), (s2, e2, t2) = sorted([first, second])
+    if s2 > e1:
+        return None  # a real gap; only the stored text could fill it
+    return t1 + t2[max(0, e1 - s2):] if e2 > e1 else t1
+
+
+class ContextSpan:
+    """
+    A contiguous range of one document, built from one or more chunks.
+    """
+
+    def __init__(self, doc, rank: int):
+        meta = doc.metadata or {}
+        self.doc_id = meta.get("doc_id")
+        self.content_hash = meta.get("content_hash")
+        self.start = meta.get("start_index")
+        self.end = meta.get("end_index")
+        if self.start is not None and self.end is None:
+            self.end = self.start + len(doc.page_content)
+        self.text = doc.page_content
+        self.docs = [doc]
+        self.rank = rank  # best selection rank among its chunks
+
+    @property
+    def has_offsets(self) -> bool:
+        return self.doc_id is not None and self.start is not None and self.end is not None
+
+    def gap_to(self, other: "ContextSpan") -> Optional[int]:
+        """
+        Characters between this span and another of the same document
+        (negative when they overlap), or None if they cannot be merged.
+        """
+        if not self.has_offsets or not other.has_offsets or other.doc_id != self.doc_id \
+                or other.content_hash != self.content_hash:
+            return None
+        return max(other.start, self.start) - min(other.end, self.end)
+
+    def merged_text(self, other: "ContextSpan", load_span: Callable[[str, int, int], Optional[str]]) -> Optional[str]:
+        """
+        Text of this span extended by `other`, without repeating the overlap.
+        """
+        start = min(self.start, other.start)
+        end = max(self.end, other.end)
+        text = load_span(self.content_hash, start, end) if self.content_hash else None
+        if text is not None:
+            return text
+        # No stored full text: stitch the texts by their offsets
+        return _stitch((self.start, self.end, self.text), (other.start, other.end, other.text))
+
+    def extend(self, other: "ContextSpan", text: str):
+        self.start = min(self.start, other.start)
+        self.end = max(self.end, other.end)
+        self.text = text
+        self.docs.extend(other.docs)
+        self.rank = min(self.rank, other.rank)
+
+
+class ContextResult:
+    def __init__(self, text: str, spans: List[ContextSpan], candidates: int,
+                 tokens: int, naive_tokens: int, baseline_tokens: int):
+        self.text = text
+        self.spans = spans
+        self.candidates = candidates
+        self.tokens = tokens
+        self.naive_tokens = naive_tokens  # the selected chunks joined as-is
+        self.baseline_tokens = baseline_tokens  # the old top-3 join
+
+    @property
+    def docs(self):
+        return [doc for span in self.spans for doc in span.docs]
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.naive_tokens - self.tokens
+
+    def stats(self) -> Dict:
+        return {
+            "candidates": self.candidates,
+            "chunks": sum(len(s.docs) for s in self.spans),
+            "spans": len(self.spans),
+            "context_tokens": self.tokens,
+            "naive_tokens": self.naive_tokens,
+            "baseline_tokens": self.baseline_tokens,
+            "saved_tokens": self.saved_tokens,
+        }
+
+
+class ContextBuilder:
+    """
+    Turns over-fetched retrieval candidates into the prompt context:
+    1. orders them by maximal marginal relevance (relevance vs. similarity to
+       what is already chosen), so near-duplicate chunks do not crowd out
+       other material;
+    2. merges chunks of the same document that overlap or nearly touch
+       (within `merge_gap` chars) into one span, dropping the repeated
+       overlap;
+    3. adds spans until the estimated token budget is used up (by default
+       the size of the top `baseline_k` candidates joined as-is, so the
+       context is better packed but never larger than before).
+    """
+
+    separator = "\n\n"
+
+    def __init__(self, token_budget: Optional[int] = None, mmr_lambda: float = 0.7, merge_gap: int = 20,
+                 baseline_k: int = 3):
+        # None: the size of the top `baseline_k` chunks joined as-is, so the
+        # prompt never grows beyond the old top-3 context
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.merge_gap = merge_gap
+        self.baseline_k = baseline_k
+
+    def mmr_order(self, docs: Sequence, query_embedding: Optional[Sequence[float]],
+                  embeddings: Optional[Sequence[Optional[Sequence[float]]]]) -> List[int]:
+        """
+        Greedy MMR over all candidates. Relevance is cosine similarity to the
+        query when vectors are available, otherwise the retrieval rank;
+        redundancy is cosine similarity (or token overlap) between chunks.
+        """
+        n = len(docs)
+        if n == 0:
+            return []
+        if embeddings is not None and all(e is not None for e in embeddings):
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+            similarity = vectors @ vectors.T
+        else:
+            token_sets = [set(tokenize(d.page_content)) for d in docs]
+            similarity = np.array([[len(a & b) / (len(a | b) or 1) for b in token_sets] for a in token_sets],
+                                  dtype=np.float32)
+            vectors = None
+        if vectors is not None and query_embedding is not None:
+            query = np.asarray(query_embedding, dtype=np.float32)
+            relevance = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        else:
+            relevance = 1.0 - np.arange(n, dtype=np.float32) / n
+
+        order = [int(np.argmax(relevance))]
+        remaining = set(range(n)) - set(order)
+        while remaining:
+            candidates = sorted(remaining)
+            redundancy = similarity[np.ix_(candidates, order)].max(axis=1)
+            scores = self.mmr_lambda * relevance[candidates] - (1 - self.mmr_lambda) * redundancy
+            best = candidates[int(np.argmax(scores))]
+            order.append(best)
+            remaining.discard(best)
+        return order
+
+    def _coalesce(self, spans: List[ContextSpan], grown: ContextSpan,
+                  load_span: Callable[[str, int, int], Optional[str]], used: int, separator_cost: int) -> int:
+        """
+        Merges `grown` with the other spans it now overlaps or nearly
+        touches (a chunk can bridge two spans already selected). Returns
+        the updated token count; merging only removes repeated text.
+        """
+        while True:
+            for other in spans:
+                if other is grown:
+                    continue
+                gap = grown.gap_to(other)
+                if gap is None or gap > self.merge_gap:
+                    continue
+                text = grown.merged_text(other, load_span)
+                if text is None:
+                    continue
+                used += estimate_tokens(text) - estimate_tokens(grown.text) - estimate_tokens(other.text) \
+                    - separator_cost
+                grown.extend(other, text)
+                spans.remove(other)
+                break
+            else:
+                return used
+
+    def build(self, docs: Sequence, query_embedding: Optional[Sequence[float]] = None,
+              embeddings: Optional[Sequence[Optional[Sequence[float]]]] = None,
+              load_span: Optional[Callable[[str, int, int], Optional[str]]] = None) -> ContextResult:
+        """
+        `docs` are the candidates in retrieval order, `embeddings` their
+        vectors (optional), `load_span(content_hash, start, end)` returns a
+        stored document's text range for filling the gap between merged
+        chunks.
+        """
+        if load_span is None:
+            def load_span(content_hash, start, end):
+                return None
+
+        baseline = self.separator.join(d.page_content for d in docs[:self.baseline_k])
+        budget = self.token_budget if self.token_budget is not None else estimate_tokens(baseline)
+        separator_cost = estimate_tokens(self.separator)
+
+        spans: List[ContextSpan] = []
+        used = 0
+        seen_texts = set()
+        selected = []
+        for rank, i in enumerate(self.mmr_order(docs, query_embedding, embeddings)):
+            doc = docs[i]
+            if doc.page_content in seen_texts:
+                continue
+            candidate = ContextSpan(doc, rank)
+            merged = False
+            for span in spans:
+                gap = span.gap_to(candidate)
+                if gap is None or gap > self.merge_gap:
+                    continue
+                text = span.merged_text(candidate, load_span)
+                if text is None:
+                    continue
+                cost = estimate_tokens(text) - estimate_tokens(span.text)
+                if used + cost <= budget:
+                    span.extend(candidate, text)
+                    used += cost
+                    selected.append(doc)
+                    seen_texts.add(doc.page_content)
+                    used = self._coalesce(spans, span, load_span, used, separator_cost)
+                merged = True
+                break
+            if merged:
+                continue
+            cost = estimate_tokens(candidate.text) + (separator_cost if spans else 0)
+            if used + cost > budget:
+                continue  # a smaller candidate further down may still fit
+            spans.append(candidate)
+            used += cost
+            selected.append(doc)
+            seen_texts.add(doc.page_content)
+
+        # Best spans first; a merged span keeps document order internally
+        spans.sort(key=lambda s: s.rank)
+        text = self.separator.join(s.text for s in spans)
+        naive = self.separator.join(d.page_content for d in selected)
+        return ContextResult(text, spans, len(docs), estimate_tokens(text),
+                             estimate_tokens(naive), estimate_tokens(baseline))
@@ -0,0 +1,269 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple
+
+
+def make_doc_id(title: str) -> str:
+    """
+    Stable document id derived from the title, so re-saving a document
+    with the same title addresses the same catalog row.
+    """
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunk_id(doc_id: str, index: int, text: str) -> str:
+    """
+    Deterministic chunk id: the same chunk text at the same position of the
+    same document always maps to the same id.
+    """
+    text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    return f"{doc_id}-{index}-{text_hash}"
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class DocumentCatalog:
+    """
+    SQLite sidecar that keeps one row per document next to the Chroma directory.
+    Listing reads from here in O(documents) instead of scanning every chunk.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    source TEXT NOT NULL DEFAULT '',
+                    summary TEXT NOT NULL DEFAULT '',
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    content_hash TEXT NOT NULL DEFAULT '',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_documents_created ON documents (created_at)"
+            )
+            # Catalogs created before retrieval filters lack the file type
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(documents)")}
+            if "mime_type" not in columns:
+                self.conn.execute("ALTER TABLE documents ADD COLUMN mime_type TEXT NOT NULL DEFAULT ''")
+            # Retrieval filters (see match_filter); updated_at is the ingestion time
+            for column in ("source", "mime_type", "updated_at"):
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_{column} ON documents ({column})")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS catalog_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups several writes into one SQLite transaction (rolled back on error).
+        """
+        with self._lock:
+            with self.conn:
+                yield self.conn
+
+    def upsert_document(self, doc_id: str, title: str, source: str, summary: str,
+                        chunk_count: int, content_hash: str, conn: Optional[sqlite3.Connection] = None,
+                        mime_type: str = "", ingested_at: Optional[float] = None):
+        """
+        `ingested_at` (default now) becomes updated_at; pass the value written
+        to the chunks' metadata so catalog and chunks agree.
+        """
+        now = ingested_at if ingested_at is not None else time.time()
+        sql = """
+            INSERT INTO documents (doc_id, title, source, summary, chunk_count, content_hash, mime_type,
+                                   created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(doc_id) DO UPDATE SET
+                title = excluded.title,
+                source = excluded.source,
+                summary = excluded.summary,
+                chunk_count = excluded.chunk_count,
+                content_hash = excluded.content_hash,
+                mime_type = excluded.mime_type,
+                updated_at = excluded.updated_at
+        """
+        params = (doc_id, title, source, summary, chunk_count, content_hash, mime_type, now, now)
+        if conn is not None:
+            conn.execute(sql, params)
+            return
+        with self.transaction() as c:
+            c.execute(sql, params)
+
+    def set_content_hash(self, doc_id: str, content_hash: str, conn: Optional[sqlite3.Connection] = None):
+        sql = "UPDATE documents SET content_hash = ? WHERE doc_id = ?"
+        if conn is not None:
+            conn.execute(sql, (content_hash, doc_id))
+            return
+        with self.transaction() as c:
+            c.execute(sql, (content_hash, doc_id))
+
+    def set_mime_type(self, doc_id: str, mime_type: str, conn: Optional[sqlite3.Connection] = None):
+        sql = "UPDATE documents SET mime_type = ? WHERE doc_id = ?"
+        if conn is not None:
+            conn.execute(sql, (mime_type, doc_id))
+            return
+        with self.transaction() as c:
+            c.execute(sql, (mime_type, doc_id))
+
+    def is_content_referenced(self, content_hash: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM documents WHERE content_hash = ? LIMIT 1", (content_hash,)
+            ).fetchone()
+        return row is not None
+
+    def get_document(self, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _search_clause(query: Optional[str]):
+        if not query:
+            return "", ()
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return (" WHERE title LIKE ? ESCAPE '\\' OR source LIKE ? ESCAPE '\\' OR summary LIKE ? ESCAPE '\\'",
+                (pattern, pattern, pattern))
+
+    def list_documents(self, offset: int = 0, limit: Optional[int] = None,
+                       query: Optional[str] = None) -> List[Dict]:
+        """
+        Returns one page of documents in insertion order, optionally only those
+        whose title, source or summary contains `query` (case-insensitive).
+        """
+        where, params = self._search_clause(query)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT doc_id, title, source, summary, chunk_count, content_hash "
+                f"FROM documents{where} ORDER BY created_at, rowid LIMIT ? OFFSET ?",
+                params + (limit if limit is not None else -1, offset)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def count_documents(self, query: Optional[str] = None) -> int:
+        where, params = self._search_clause(query)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM documents{where}", params).fetchone()[0]
+
+    @staticmethod
+    def _filter_clause(retrieval_filter):
+        conditions, params = [], []
+        for column, values in (("doc_id", retrieval_filter.doc_ids), ("source", retrieval_filter.sources),
+                               ("mime_type", retrieval_filter.file_types)):
+            if values is not None:
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "0")
+                params.extend(sorted(values))
+        if retrieval_filter.ingested_after is not None:
+            conditions.append("updated_at >= ?")
+            params.append(retrieval_filter.ingested_after)
+        if retrieval_filter.ingested_before is not None:
+            conditions.append("updated_at < ?")
+            params.append(retrieval_filter.ingested_before)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), tuple(params)
+
+    def match_filter(self, retrieval_filter) -> Tuple[List[str], int]:
+        """
+        The ids of the documents a services.retrieval_filter.RetrievalFilter
+        selects and their total number of chunks.
+        """
+        where, params = self._filter_clause(retrieval_filter)
+        with self._lock:
+            rows = self.conn.execute(f"SELECT doc_id, chunk_count FROM documents{where}", params).fetchall()
+        return [r[0] for r in rows], sum(r[1] for r in rows)
+
+    def list_values(self, column: str, limit: int = 1000) -> List[Tuple[str, int]]:
+        """
+        Distinct values of "source" or "mime_type" with their document
+        counts, most common first (choices for a filter).
+        """
+        if column not in ("source", "mime_type"):
+            raise ValueError(f"Not a filterable column: {column}")
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {column}, COUNT(*) FROM documents WHERE {column} != '' "
+                f"GROUP BY {column} ORDER BY COUNT(*) DESC, {column} LIMIT ?", (limit,)
+            ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM catalog_meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str, conn: Optional[sqlite3.Connection] = None):
+        sql = "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES (?, ?)"
+        if conn is not None:
+            conn.execute(sql, (key, value))
+            return
+        with self.transaction() as c:
+            c.execute(sql, (key, value))
+
+    def migrate_from_vector_store(self, vector_store, page_size: int = 1000) -> int:
+        """
+        One-time migration: builds the catalog from the chunk metadata of an
+        existing collection. Pages through Chroma so memory stays bounded.
+        Returns the number of documents written.
+        """
+        if self.get_meta("migrated_from_collection") == "1":
+            return 0
+
+        docs: Dict[str, Dict] = {}
+        offset = 0
+        while True:
+            page = vector_store.get(limit=page_size, offset=offset, include=["metadatas"])
+            metadatas = page.get("metadatas") or []
+            if not metadatas:
+                break
+            for m in metadatas:
+                if not m:
+                    continue
+                title = m.get("title", "Untitled")
+                doc_id = m.get("doc_id") or make_doc_id(title)
+                entry = docs.get(doc_id)
+                if entry is None:
+                    full_content = m.get("full_content", "")
+                    docs[doc_id] = {
+                        "title": title,
+                        "source": m.get("source", ""),
+                        "summary": m.get("summary", full_content[:100]),
+                        "chunk_count": 1,
+                        "content_hash": content_hash(full_content) if full_content else "",
+                    }
+                else:
+                    entry["chunk_count"] += 1
+            offset += len(metadatas)
+
+        with self.transaction() as conn:
+            for doc_id, d in docs.items():
+                self.upsert_document(doc_id, d["title"], d["source"], d["summary"],
+                                     d["chunk_count"], d["content_hash"], conn=conn)
+            self.set_meta("migrated_from_collection", "1", conn=conn)
+        return len(docs)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,170 @@
+import os
+import zlib
+import codecs
+import tempfile
+from typing import Dict, Iterator, Optional
+
+from .document_catalog import make_doc_id, content_hash as hash_content
+
+
+class DocumentStore:
+    """
+    Content-addressed store for full document texts.
+    Each text is written once as a zlib-compressed blob named by its SHA-256,
+    so chunks only need to carry a doc_id and character offsets.
+    """
+
+    def __init__(self, root: str, compress_level: int = 6):
+        self.root = root
+        self.compress_level = compress_level
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, content_hash: str) -> str:
+        # Shard by the first two hex chars to keep directories small
+        return os.path.join(self.root, content_hash[:2], content_hash + ".z")
+
+    def put(self, content: str) -> str:
+        """
+        Stores the text (no-op if it is already present) and returns its hash.
+        """
+        content_hash = hash_content(content)
+        path = self._path(content_hash)
+        if os.path.exists(path):
+            return content_hash
+
+        data = zlib.compress(content.encode("utf-8"), self.compress_level)
+        self._write(path, [data])
+        return content_hash
+
+    def put_file(self, text_path: str, content_hash: str, block_size: int = 1 << 20) -> str:
+        """
+        Stores the UTF-8 text file at `text_path` under `content_hash` (its
+        content_hash, computed by the caller), compressing it block by block
+        so the text is never loaded whole.
+        """
+        path = self._path(content_hash)
+        if os.path.exists(path):
+            return content_hash
+
+        def blocks():
+            compressor = zlib.compressobj(self.compress_level)
+            with open(text_path, "rb") as f:
+                for data in iter(lambda: f.read(block_size), b""):
+                    yield compressor.compress(data)
+            yield compressor.flush()
+
+        self._write(path, blocks())
+        return content_hash
+
+    def _write(self, path: str, blocks):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so a crash never leaves a truncated blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for data in blocks:
+                    f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, content_hash: str) -> Optional[str]:
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def iter_text(self, content_hash: str, block_size: int = 1 << 16) -> Iterator[str]:
+        """
+        Decompresses a stored text incrementally, in pieces of roughly
+        `block_size` compressed bytes.
+        """
+        decompressor = zlib.decompressobj()
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with open(self._path(content_hash), "rb") as f:
+            for data in iter(lambda: f.read(block_size), b""):
+                text = decoder.decode(decompressor.decompress(data))
+                if text:
+                    yield text
+        text = decoder.decode(decompressor.flush(), final=True)
+        if text:
+            yield text
+
+    def get_span(self, content_hash: str, start: int, end: int) -> Optional[str]:
+        """
+        content[start:end], decompressing only up to `end` (large documents
+        are never loaded whole for one chunk).
+        """
+        if not self.contains(content_hash):
+            return None
+        pieces = []
+        offset = 0
+        for text in self.iter_text(content_hash):
+            if offset + len(text) > start:
+                pieces.append(text[max(0, start - offset):end - offset])
+            offset += len(text)
+            if offset >= end:
+                break
+        return "".join(pieces)
+
+    def contains(self, content_hash: str) -> bool:
+        return os.path.exists(self._path(content_hash))
+
+    def delete(self, content_hash: str):
+        path = self._path(content_hash)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def migrate_full_content(collection, store: DocumentStore, page_size: int = 500) -> Dict[str, str]:
+    """
+    Rewrites chunks created before the document store existed: moves the
+    inline `full_content` / `summary` metadata into the store and replaces it
+    with doc_id and character offsets.
+    Returns {doc_id: content_hash} for every document that was migrated.
+    """
+    migrated: Dict[str, str] = {}
+    # Chunks come back in insertion order, so search for each one after the
+    # previous chunk of the same text to get correct offsets for repeats.
+    search_from: Dict[str, int] = {}
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=["metadatas", "documents"])
+        ids = page.get("ids") or []
+        if not ids:
+            break
+
+        update_ids, update_metas = [], []
+        for chunk_id, meta, text in zip(ids, page["metadatas"], page["documents"]):
+            if not meta or "full_content" not in meta:
+                continue
+            full_content = meta["full_content"] or ""
+            doc_id = meta.get("doc_id") or make_doc_id(meta.get("title", "Untitled"))
+            content_hash = store.put(full_content)
+            migrated[doc_id] = content_hash
+
+            text = text or ""
+            start = full_content.find(text, search_from.get(content_hash, 0))
+            if start < 0:
+                start = max(full_content.find(text), 0)
+            search_from[content_hash] = start + 1
+            new_meta = dict(meta)
+            new_meta.update({
+                "doc_id": doc_id,
+                "content_hash": content_hash,
+                "start_index": start,
+                "end_index": start + len(text),
+                # None removes the key from the Chroma metadata
+                "full_content": None,
+                "summary": None,
+            })
+            update_ids.append(chunk_id)
+            update_metas.append(new_meta)
+
+        if update_ids:
+            collection.update(ids=update_ids, metadatas=update_metas)
+        offset += len(ids)
+    return migrated
@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalization used for cache keys only; the original text is what gets embedded.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper with an in-memory LRU tier and an on-disk SQLite tier.
+    Keys are (model name, kind, hash of normalized text), so re-ingesting the
+    same text or repeating a question costs no remote embedding call.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, db_path: Optional[str] = None,
+                 memory_size: int = 10000, max_disk_bytes: int = 512 * 1024 * 1024):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.conn = None
+        if db_path:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            with self.conn:
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        key TEXT PRIMARY KEY,
+                        vector BLOB NOT NULL,
+                        size INTEGER NOT NULL,
+                        last_access REAL NOT NULL
+                    )
+                """)
+                self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings (last_access)"
+                )
+            self._disk_bytes = self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()[0]
+
+    def _key(self, text: str, kind: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{kind}:{digest}"
+
+    # --- Cache tiers ---
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        disk_keys = []
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_keys.append(key)
+
+            if self.conn is not None and disk_keys:
+                # Chunk the IN clause to stay under SQLite's variable limit
+                now = time.time()
+                for i in range(0, len(disk_keys), 500):
+                    batch = disk_keys[i:i + 500]
+                    rows = self.conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = array("f", blob).tolist()
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+                    if rows:
+                        with self.conn:
+                            self.conn.executemany(
+                                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                [(now, key) for key, _ in rows]
+                            )
+        return found
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _store(self, items: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self.conn is None or not items:
+                return
+            now = time.time()
+            rows = []
+            for key, vector in items.items():
+                blob = array("f", vector).tobytes()
+                rows.append((key, blob, len(blob), now))
+            keys = list(items)
+            with self.conn:
+                # Rows being replaced no longer count towards the budget
+                replaced = 0
+                for i in range(0, len(keys), 500):
+                    batch = keys[i:i + 500]
+                    replaced += self.conn.execute(
+                        f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch
+                    ).fetchone()[0]
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_access) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+            self._disk_bytes += sum(r[2] for r in rows) - replaced
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        """
+        Drops least recently used rows until the disk tier is under 90% of its budget.
+        """
+        target = int(self.max_disk_bytes * 0.9)
+        with self.conn:
+            while self._disk_bytes > target:
+                rows = self.conn.execute(
+                    "SELECT key, size FROM embeddings ORDER BY last_access LIMIT 1000"
+                ).fetchall()
+                if not rows:
+                    self._disk_bytes = 0
+                    break
+                evict = []
+                for key, size in rows:
+                    evict.append((key,))
+                    self._disk_bytes -= size
+                    if self._disk_bytes <= target:
+                        break
+                self.conn.executemany("DELETE FROM embeddings WHERE key = ?", evict)
+
+    async def _blocking(self, fn, *args):
+        # The disk tier is SQLite I/O; keep it off the event loop
+        if self.conn is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    # --- Embeddings interface ---
+
+    def _split(self, texts: List[str], kind: str):
+        keys = [self._key(t, kind) for t in texts]
+        found = self._lookup(keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.misses += len(missing)
+        return keys, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split(texts, "doc")
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        return [found[k] for k in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = await self._blocking(self._split, texts, "doc")
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await self._blocking(self._store, computed)
+            found.update(computed)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found, missing = self._split([text], "query")
+        if missing:
+            vector = self.underlying.embed_query(text)
+            self._store({keys[0]: vector})
+            return vector
+        return found[keys[0]]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found, missing = await self._blocking(self._split, [text], "query")
+        if missing:
+            vector = await self.underlying.aembed_query(text)
+            await self._blocking(self._store, {keys[0]: vector})
+            return vector
+        return found[keys[0]]
+
+    # --- Stats ---
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes if self.conn is not None else 0,
+            }
+
+    def close(self):
+        if self.conn is not None:
+            with self._lock:
+                self.conn.close()
+                self.conn = None
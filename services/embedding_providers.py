@@ -0,0 +1,242 @@
+"""
+Pluggable embedding backends.
+
+A provider turns options into an EmbeddingBackend: the LangChain Embeddings
+object plus the model id and vector dimension recorded on the Chroma
+collection, so a collection built with one model is never queried or
+extended with another.
+
+    backend = create_backend("onnx", model_path="models/bge-small-zh", threads=4)
+"""
+import asyncio
+import inspect
+import os
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# The only backend before providers existed; collections without a recorded
+# model were built with it. Also the model name used in embedding cache keys.
+DASHSCOPE_MODEL = "text-embedding-v1"
+DASHSCOPE_DIMENSION = 1536
+
+
+class EmbeddingBackend(NamedTuple):
+    embeddings: Embeddings
+    model_id: str
+    dimension: int
+
+
+class EmbeddingMismatchError(RuntimeError):
+    """
+    The collection was built with a different embedding model or dimension.
+    """
+
+
+_providers: Dict[str, Callable[..., EmbeddingBackend]] = {}
+
+
+def register_provider(name: str):
+    def decorator(factory: Callable[..., EmbeddingBackend]):
+        _providers[name] = factory
+        return factory
+    return decorator
+
+
+def available_providers() -> List[str]:
+    return sorted(_providers)
+
+
+# Options of the in-process backends; the command lines pass them whatever
+# the provider, and remote or fake providers ignore them
+LOCAL_OPTIONS = frozenset({"model_path", "threads"})
+
+
+def create_backend(provider: str = "dashscope", **options) -> EmbeddingBackend:
+    factory = _providers.get(provider)
+    if factory is None:
+        raise ValueError(f"Unknown embedding provider {provider!r} (available: {', '.join(available_providers())})")
+    accepted = inspect.signature(factory).parameters
+    options = {k: v for k, v in options.items() if v is not None and (k in accepted or k not in LOCAL_OPTIONS)}
+    unknown = sorted(set(options) - set(accepted))
+    if unknown:
+        raise ValueError(f"Embedding provider {provider!r} has no option {', '.join(unknown)} "
+                         f"(options: {', '.join(accepted)})")
+    return factory(**options)
+
+
+def backend_from_embeddings(embeddings: Embeddings, model_id: Optional[str] = None) -> EmbeddingBackend:
+    """
+    Wraps an Embeddings object supplied by the caller. The dimension comes
+    from its `dimension` attribute, or from embedding a probe string.
+    """
+    dimension = getattr(embeddings, "dimension", None) or len(embeddings.embed_query("dimension probe"))
+    return EmbeddingBackend(embeddings, model_id or getattr(embeddings, "model_id", type(embeddings).__name__), dimension)
+
+
+@register_provider("dashscope")
+def _dashscope(model: str = DASHSCOPE_MODEL, dimension: int = DASHSCOPE_DIMENSION) -> EmbeddingBackend:
+    from langchain_community.embeddings import DashScopeEmbeddings
+    return EmbeddingBackend(DashScopeEmbeddings(model=model), model, dimension)
+
+
+@register_provider("hashing")
+def _hashing(size: int = 64, latency: float = 0.0) -> EmbeddingBackend:
+    from .fakes import HashingEmbeddings
+    return EmbeddingBackend(HashingEmbeddings(size=size, latency=latency), f"hashing:{size}", size)
+
+
+@register_provider("onnx")
+def _onnx(model_path: str, threads: Optional[int] = None, batch_size: int = 32,
+          max_length: int = 512, query_prefix: str = "") -> EmbeddingBackend:
+    embeddings = OnnxEmbeddings(model_path, threads=threads, batch_size=batch_size,
+                                max_length=max_length, query_prefix=query_prefix)
+    name = os.path.basename(os.path.normpath(model_path))
+    return EmbeddingBackend(embeddings, f"onnx:{name}", embeddings.dimension)
+
+
+@register_provider("sentence-transformers")
+def _sentence_transformers(model_path: str, threads: Optional[int] = None, batch_size: int = 32,
+                           query_prefix: str = "") -> EmbeddingBackend:
+    embeddings = SentenceTransformerEmbeddings(model_path, threads=threads, batch_size=batch_size,
+                                               query_prefix=query_prefix)
+    return EmbeddingBackend(embeddings, f"st:{model_path}", embeddings.dimension)
+
+
+class _LocalEmbeddings(Embeddings):
+    """
+    Shared parts of the in-process backends: inference is CPU-bound and
+    blocking, so the async methods run it on a worker thread.
+    """
+    query_prefix = ""
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([self.query_prefix + text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_query, text)
+
+
+class OnnxEmbeddings(_LocalEmbeddings):
+    """
+    Sentence embeddings from an exported transformer (a directory holding
+    `model.onnx` or `onnx/model.onnx` and a HuggingFace `tokenizer.json`).
+    The session is created once; texts are embedded in length-sorted batches
+    (less padding), mean-pooled over the attention mask and L2-normalized.
+    Requires `onnxruntime` and `tokenizers`.
+    """
+
+    def __init__(self, model_path: str, threads: Optional[int] = None, batch_size: int = 32,
+                 max_length: int = 512, query_prefix: str = ""):
+        import numpy as np
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self._np = np
+        self.batch_size = batch_size
+        self.query_prefix = query_prefix
+
+        onnx_file = os.path.join(model_path, "model.onnx")
+        if not os.path.exists(onnx_file):
+            onnx_file = os.path.join(model_path, "onnx", "model.onnx")
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        if self.tokenizer.padding is None:
+            # Keep the model's own pad token when tokenizer.json defines one
+            self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads or max(1, (os.cpu_count() or 2) // 2)
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(onnx_file, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._lock = threading.Lock()  # the tokenizer's padding state is shared
+
+        size = self.session.get_outputs()[0].shape[-1]
+        self.dimension = size if isinstance(size, int) else len(self.embed_documents(["dimension probe"])[0])
+
+    def _embed_batch(self, texts: List[str]):
+        np = self._np
+        with self._lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        output = self.session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+
+        if output.ndim == 3:
+            # Token embeddings: mean over the real (unpadded) tokens
+            mask = attention_mask[..., None].astype(output.dtype)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return output / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+
+class SentenceTransformerEmbeddings(_LocalEmbeddings):
+    """
+    In-process sentence-transformers model on the CPU (optional dependency).
+    """
+
+    def __init__(self, model_path: str, threads: Optional[int] = None, batch_size: int = 32,
+                 query_prefix: str = ""):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.batch_size = batch_size
+        self.query_prefix = query_prefix
+        self.model = SentenceTransformer(model_path, device="cpu")
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return vectors.tolist()
+
+
+def ensure_collection_model(collection, backend: EmbeddingBackend):
+    """
+    Records the backend's model id and dimension on an empty collection, and
+    rejects a non-empty one that was built with something else. Collections
+    from before models were recorded are assumed to be DashScope-built.
+    """
+    metadata = dict(collection.metadata or {})
+    model_id = metadata.get("embedding_model")
+    dimension = metadata.get("embedding_dimension")
+
+    if model_id is None:
+        if collection.count() == 0:
+            model_id, dimension = backend.model_id, backend.dimension
+        else:
+            sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+            model_id, dimension = DASHSCOPE_MODEL, len(sample[0])
+        metadata.update(embedding_model=model_id, embedding_dimension=dimension)
+        collection.modify(metadata=metadata)
+
+    if model_id != backend.model_id or dimension != backend.dimension:
+        raise EmbeddingMismatchError(
+            f"The knowledge base was embedded with {model_id} ({dimension} dims), but the "
+            f"configured backend is {backend.model_id} ({backend.dimension} dims). "
+            f"Re-embed it first: python -m services.reembed --provider ..."
+        )
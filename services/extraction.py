@@ -0,0 +1,136 @@
+"""
+Text extraction helpers. Kept at module level (not on RagService) so they
+can be pickled into a ProcessPoolExecutor.
+"""
+import codecs
+import hashlib
+import os
+from typing import Dict, Iterator, Tuple
+
+# Text between pages / elements, as in the joined `unstructured` output
+PAGE_SEPARATOR = "\n\n"
+PREVIEW_CHARS = 2000
+
+
+def extract_text(file_path: str) -> str:
+    from unstructured.partition.auto import partition
+    try:
+        elements = partition(filename=file_path)
+        return "\n\n".join([str(e) for e in elements])
+    except Exception as e:
+        raise RuntimeError(f"Unstructured parsing failed: {str(e)}")
+
+
+def _iter_text_file(file_path: str, block_size: int = 1 << 20) -> Iterator[Tuple[str, int, int]]:
+    # Progress in bytes; the incremental decoder keeps multi-byte characters
+    # that straddle a block boundary intact
+    total = os.path.getsize(file_path)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(file_path, "rb") as f:
+        while True:
+            data = f.read(block_size)
+            text = decoder.decode(data, final=not data)
+            if text:
+                yield text, f.tell(), total
+            if not data:
+                break
+
+
+def _iter_pdf(file_path: str) -> Iterator[Tuple[str, int, int]]:
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    for i in range(total):
+        yield reader.pages[i].extract_text() or "", i + 1, total
+
+
+def _iter_docx(file_path: str, paragraphs_per_page: int = 200) -> Iterator[Tuple[str, int, int]]:
+    import docx
+    paragraphs = docx.Document(file_path).paragraphs
+    total = len(paragraphs)
+    for start in range(0, total, paragraphs_per_page):
+        batch = paragraphs[start:start + paragraphs_per_page]
+        yield PAGE_SEPARATOR.join(p.text for p in batch if p.text.strip()), start + len(batch), total
+
+
+def _iter_unstructured(file_path: str) -> Iterator[Tuple[str, int, int]]:
+    # Fallback for other formats (and scanned PDFs, which need OCR): the
+    # elements are parsed at once, then handed out page by page
+    from unstructured.partition.auto import partition
+    try:
+        elements = partition(filename=file_path)
+    except Exception as e:
+        raise RuntimeError(f"Unstructured parsing failed: {str(e)}")
+    pages: Dict[int, list] = {}
+    for element in elements:
+        pages.setdefault(getattr(element.metadata, "page_number", None) or 1, []).append(str(element))
+    for i, number in enumerate(sorted(pages)):
+        yield PAGE_SEPARATOR.join(pages.pop(number)), i + 1, len(pages) + i + 1
+
+
+def _join_pages(pages: Iterator[Tuple[str, int, int]]) -> Iterator[Tuple[str, int, int]]:
+    # Separator between non-empty pages; empty ones still report progress
+    first = True
+    for text, done, total in pages:
+        if text.strip():
+            text = text if first else PAGE_SEPARATOR + text
+            first = False
+        else:
+            text = ""
+        yield text, done, total
+
+
+def iter_pages(file_path: str) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yields (text, done, total) per page of a file, where done/total count
+    pages, paragraphs or bytes depending on the format; the texts concatenate
+    to the whole document. Only one page is held in memory for text,
+    Markdown, PDF and DOCX files.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in (".txt", ".md"):
+        yield from _iter_text_file(file_path)
+        return
+    if ext == ".pdf":
+        found_text = False
+        for text, done, total in _join_pages(_iter_pdf(file_path)):
+            found_text = found_text or bool(text)
+            yield text, done, total
+        if not found_text:
+            # No text layer at all: a scanned PDF
+            yield from _join_pages(_iter_unstructured(file_path))
+        return
+    if ext == ".docx":
+        try:
+            import docx  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            yield from _join_pages(_iter_docx(file_path))
+            return
+    yield from _join_pages(_iter_unstructured(file_path))
+
+
+def extract_to_spool(file_path: str, spool_path: str, progress_path: str = "") -> Dict:
+    """
+    Streams the text of a file into `spool_path` (UTF-8) page by page and
+    returns {"content_hash", "chars", "preview"}. The hash matches
+    document_catalog.content_hash of the whole text. Progress ("done total")
+    is rewritten to `progress_path` after every page, for a parent process
+    to poll.
+    """
+    digest = hashlib.sha256()
+    chars = 0
+    preview = ""
+    with open(spool_path, "w", encoding="utf-8", newline="") as spool:
+        for text, done, total in iter_pages(file_path):
+            if text:
+                spool.write(text)
+                digest.update(text.encode("utf-8"))
+                chars += len(text)
+                if len(preview) < PREVIEW_CHARS:
+                    preview += text[:PREVIEW_CHARS - len(preview)]
+            if progress_path:
+                with open(progress_path, "w") as f:
+                    f.write(f"{done} {total}")
+    return {"content_hash": digest.hexdigest(), "chars": chars, "preview": preview}
@@ -0,0 +1,192 @@
+"""
+Deterministic local stand-ins for the DashScope backends (embeddings and
+the streaming chat model), plus a fake provider that throttles them.
+Used by benchmarks and headless checks so nothing calls the network.
+"""
+import asyncio
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import List, Any, Optional, Iterator, AsyncIterator
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_TOKEN_RE = re.compile(r"[一-鿿]|\w+")
+_STREAM_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+class ThrottlingError(Exception):
+    """
+    What FakeProviderServer answers instead of a result: an HTTP 429.
+    """
+
+    status_code = 429
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("429 Too Many Requests (Throttling.RateQuota)")
+        self.retry_after = retry_after
+
+
+class FakeProviderServer:
+    """
+    In-process stand-in for a rate-limited model API. A request is rejected
+    with ThrottlingError when `requests_per_second` were already admitted in
+    the last second, when `max_concurrent` are in progress, or at random
+    with probability `throttle_rate`; otherwise it takes `latency` seconds
+    (plus up to `jitter`). Fakes given a `server` call `handle()` first.
+    """
+
+    def __init__(self, requests_per_second: float = 20, max_concurrent: int = 8, latency: float = 0.05,
+                 jitter: float = 0.0, throttle_rate: float = 0.0, retry_after: Optional[float] = None,
+                 seed: int = 0):
+        self.requests_per_second = requests_per_second
+        self.max_concurrent = max_concurrent
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._admitted = deque()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.served = 0
+        self.rejected = 0
+
+    async def handle(self):
+        now = time.monotonic()
+        while self._admitted and now - self._admitted[0] >= 1.0:
+            self._admitted.popleft()
+        if (len(self._admitted) >= self.requests_per_second or self.in_flight >= self.max_concurrent
+                or self._random.random() < self.throttle_rate):
+            self.rejected += 1
+            raise ThrottlingError(self.retry_after)
+        self._admitted.append(now)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+        finally:
+            self.in_flight -= 1
+        self.served += 1
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Feature-hashing bag-of-words embedder. Similar texts get similar vectors,
+    and every call is counted so tests can assert on remote-call savings.
+    """
+
+    def __init__(self, size: int = 64, latency: float = 0.0, server: Optional[FakeProviderServer] = None):
+        self.size = size
+        self.latency = latency
+        self.server = server
+        self.calls = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    @property
+    def dimension(self) -> int:
+        return self.size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _count(self, n: int):
+        with self._lock:
+            self.calls += 1
+            self.texts_embedded += n
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._count(len(texts))
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.server is not None:
+            await self.server.handle()
+        self._count(len(texts))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model that answers with scripted responses (cycled per call), streamed
+    word by word. `first_token_latency` is slept before the first token and
+    `token_latency` between tokens, to mimic a remote model. `open_streams`
+    shows whether cancelled async streams were actually closed. With a
+    `server`, async calls are admitted (or throttled) by it first.
+    """
+
+    responses: List[str] = ["This is a scripted answer.\n\n- first point\n- second point\n"]
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    calls: int = 0
+    open_streams: int = 0  # async streams started and not yet closed
+    streamed_tokens: int = 0
+    server: Optional[Any] = None  # FakeProviderServer
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _next_response(self) -> str:
+        response = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        return response
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        tokens = _STREAM_TOKEN_RE.findall(self._next_response())
+        time.sleep(self.first_token_latency + self.token_latency * max(0, len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(_STREAM_TOKEN_RE.findall(self._next_response())):
+            time.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.server is not None:
+            await self.server.handle()
+        tokens = _STREAM_TOKEN_RE.findall(self._next_response())
+        await asyncio.sleep(self.first_token_latency + self.token_latency * max(0, len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.server is not None:
+            await self.server.handle()
+        self.open_streams += 1
+        try:
+            for i, token in enumerate(_STREAM_TOKEN_RE.findall(self._next_response())):
+                delay = self.first_token_latency if i == 0 else self.token_latency
+                if delay:
+                    await asyncio.sleep(delay)
+                self.streamed_tokens += 1
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        finally:
+            self.open_streams -= 1
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from functools import partial
+from typing import List, Dict, Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class IngestPipeline:
+    """
+    Embeds chunks in fixed-size batches with a bounded number of embedding
+    requests in flight, and writes each batch into Chroma as soon as it is
+    embedded (while later batches are still embedding).
+    """
+
+    def __init__(self, embeddings: "Embeddings", collection, batch_size: int = 25,
+                 max_in_flight: int = 4, max_retries: int = 3, retry_delay: float = 0.5):
+        # DashScope text-embedding-v1 accepts at most 25 texts per request
+        self.embeddings = embeddings
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds one batch, retrying only this batch with exponential backoff.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                logger.warning("Embedding batch failed (%s), retry %d/%d in %.1fs",
+                               e, attempt, self.max_retries, delay)
+                await asyncio.sleep(delay)
+
+    async def run(self, ids: List[str], texts: List[str], metadatas: List[Dict],
+                  progress_callback: Optional[ProgressCallback] = None) -> int:
+        """
+        Ingests all chunks and returns the number written.
+        `progress_callback(done, total)` is called after every written batch.
+        """
+        total = len(texts)
+        if total == 0:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        write_lock = asyncio.Lock()
+        done = 0
+
+        async def process(start: int):
+            nonlocal done
+            end = min(start + self.batch_size, total)
+            try:
+                vectors = await self._embed_batch(texts[start:end])
+                # Chroma writes are blocking and not safe to interleave; run them
+                # one at a time off the event loop.
+                async with write_lock:
+                    await loop.run_in_executor(None, partial(
+                        self.collection.upsert,
+                        ids=ids[start:end],
+                        embeddings=vectors,
+                        documents=texts[start:end],
+                        metadatas=metadatas[start:end],
+                    ))
+                done += end - start
+                if progress_callback:
+                    progress_callback(done, total)
+            finally:
+                slots.release()
+
+        tasks = []
+        try:
+            for start in range(0, total, self.batch_size):
+                # Backpressure: wait for a free slot before scheduling the next batch
+                await slots.acquire()
+                tasks.append(asyncio.create_task(process(start)))
+                # Surface a failed batch early instead of scheduling the rest
+                for t in tasks:
+                    if t.done() and not t.cancelled() and t.exception() is not None:
+                        raise t.exception()
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return done
@@ -0,0 +1,312 @@
+"""
+Named knowledge bases.
+
+Each base has its own Chroma collection (in the shared chroma_db
+directory), document catalog, full-text store and BM25 index, so a query
+only searches the bases it selects. The "default" base keeps the original
+layout (collection `rag_collection`, catalog.sqlite3 and documents/ in the
+data directory); the others live under bases/<name>/ with collection
+`kb_<name>`. A base is only opened when first used.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from .document_catalog import DocumentCatalog, make_doc_id
+from .document_store import DocumentStore, migrate_full_content
+from .ingest_pipeline import IngestPipeline
+from .lexical_index import BM25Index
+from .retrieval_filter import DEFAULT_MIME_TYPE, mime_type_for
+from .startup_profile import startup_profile
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    import numpy as np
+
+COLLECTION_NAME = "rag_collection"
+DEFAULT_KB = "default"
+BASES_DIR = "bases"
+
+# Usable as a directory and (with the kb_ prefix) a Chroma collection name
+_NAME_RE = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,46}[A-Za-z0-9])?$")
+
+# Per-vector overhead of Chroma's HNSW graph on top of the float32 vector
+# (M=16 neighbours per layer-0 node, ids and bookkeeping)
+_HNSW_OVERHEAD_BYTES = 200
+
+
+def validate_name(name: str) -> str:
+    if not isinstance(name, str) or not _NAME_RE.match(name):
+        raise ValueError(f"Invalid knowledge base name {name!r}: use 1-48 letters, digits, '-' or '_'")
+    return name
+
+
+def list_names(base_path: str) -> List[str]:
+    """
+    The default base followed by the others, in name order.
+    """
+    root = os.path.join(base_path, BASES_DIR)
+    names = sorted(
+        entry for entry in (os.listdir(root) if os.path.isdir(root) else [])
+        if _NAME_RE.match(entry) and entry != DEFAULT_KB and os.path.isdir(os.path.join(root, entry))
+    )
+    return [DEFAULT_KB] + names
+
+
+class KnowledgeBase:
+    """
+    The resources of one knowledge base, opened by `open()`. The BM25 index
+    is only built on the first search (see RagService._ensure_lexical_index).
+    """
+
+    def __init__(self, name: str, base_path: str):
+        self.name = validate_name(name)
+        if name == DEFAULT_KB:
+            self.root = base_path
+            self.collection_name = COLLECTION_NAME
+        else:
+            self.root = os.path.join(base_path, BASES_DIR, name)
+            self.collection_name = f"kb_{name}"
+
+        self.vector_store = None
+        self.collection = None
+        self.catalog: Optional[DocumentCatalog] = None
+        self.doc_store: Optional[DocumentStore] = None
+        self.lexical_index: Optional[BM25Index] = None
+        self.ingest_pipeline: Optional[IngestPipeline] = None
+        self.lexical_build = None  # future of the background BM25 build
+        self.dimension = 0
+        self.space = "l2"  # distance function of the collection
+
+        # Filtered vector matrices for exact_search, most recent last; at
+        # most `exact_cache_vectors` vectors in total. Dropped on every
+        # change to the base (see changed()).
+        self.exact_cache_vectors = 8000
+        self._exact_cache: "OrderedDict[str, Tuple[List[str], np.ndarray]]" = OrderedDict()
+        self._generation = 0
+
+        self.open_seconds: Optional[float] = None
+        self.searches = 0
+        self._search_latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.catalog is not None
+
+    def open(self, client, embeddings, embedding_backend, pipeline_options: Optional[Dict] = None):
+        """
+        Opens the collection, catalog and document store (idempotent; called
+        from a worker thread).
+        """
+        from langchain_chroma import Chroma
+        from .embedding_providers import ensure_collection_model
+
+        with self._lock:
+            if self.is_open:
+                return
+            started = time.perf_counter()
+            os.makedirs(self.root, exist_ok=True)
+            with startup_profile.phase("open.chroma"):
+                vector_store = Chroma(
+                    client=client,
+                    collection_name=self.collection_name,
+                    embedding_function=embeddings,
+                )
+                collection = vector_store._collection
+                # Refuse to mix vectors from different models in one collection
+                ensure_collection_model(collection, embedding_backend)
+
+            # Document catalog (SQLite sidecar next to the Chroma directory).
+            # Built once from the existing collection the first time it is opened.
+            with startup_profile.phase("open.catalog"):
+                catalog = DocumentCatalog(os.path.join(self.root, "catalog.sqlite3"))
+                catalog.migrate_from_vector_store(vector_store)
+
+            # Full texts are stored once, keyed by content hash; chunks only carry
+            # doc_id + offsets. Older collections still inline `full_content` in
+            # every chunk, so rewrite them once.
+            with startup_profile.phase("open.document_store"):
+                doc_store = DocumentStore(os.path.join(self.root, "documents"))
+                self._migrate_full_content(collection, catalog, doc_store)
+
+            # Retrieval filters need doc_id, mime_type and ingested_at on
+            # every chunk; older collections get them once
+            with startup_profile.phase("open.filter_metadata"):
+                self._migrate_filter_metadata(collection, catalog)
+
+            self.vector_store = vector_store
+            self.collection = collection
+            self.doc_store = doc_store
+            self.lexical_index = BM25Index()
+            # Batched, concurrent embedding + write pipeline for ingestion
+            self.ingest_pipeline = IngestPipeline(embeddings, collection, **(pipeline_options or {}))
+            self.dimension = embedding_backend.dimension
+            self.space = self._space_of(collection)
+            self.catalog = catalog
+            self.open_seconds = time.perf_counter() - started
+
+    @staticmethod
+    def _migrate_full_content(collection, catalog: DocumentCatalog, doc_store: DocumentStore):
+        if catalog.get_meta("full_content_migrated") == "1":
+            return
+        migrated = migrate_full_content(collection, doc_store)
+        with catalog.transaction() as conn:
+            for doc_id, content_hash in migrated.items():
+                catalog.set_content_hash(doc_id, content_hash, conn=conn)
+            catalog.set_meta("full_content_migrated", "1", conn=conn)
+
+    @staticmethod
+    def _migrate_filter_metadata(collection, catalog: DocumentCatalog, page_size: int = 1000):
+        if catalog.get_meta("filter_metadata_migrated") == "1":
+            return
+        mime_types: Dict[str, str] = {}
+        documents: Dict[str, Optional[Dict]] = {}
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["metadatas"])
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            update_ids, update_metadatas = [], []
+            for chunk_id, meta in zip(ids, page["metadatas"]):
+                meta = meta or {}
+                if "doc_id" in meta and "mime_type" in meta and "ingested_at" in meta:
+                    continue
+                doc_id = meta.get("doc_id") or make_doc_id(meta.get("title", "Untitled"))
+                if doc_id not in documents:
+                    documents[doc_id] = catalog.get_document(doc_id)
+                doc = documents[doc_id]
+                mime_type = mime_types.get(doc_id) or (doc or {}).get("mime_type")
+                if not mime_type:
+                    # Files were ingested with their path as the source
+                    source = meta.get("source", "")
+                    mime_type = mime_type_for(source) if os.path.splitext(source)[1] else DEFAULT_MIME_TYPE
+                mime_types[doc_id] = mime_type
+                update_ids.append(chunk_id)
+                update_metadatas.append({**meta, "doc_id": doc_id, "mime_type": mime_type,
+                                         "ingested_at": doc["updated_at"] if doc else time.time()})
+            if update_ids:
+                collection.update(ids=update_ids, metadatas=update_metadatas)
+            offset += len(ids)
+        with catalog.transaction() as conn:
+            for doc_id, mime_type in mime_types.items():
+                if documents.get(doc_id) and not documents[doc_id]["mime_type"]:
+                    catalog.set_mime_type(doc_id, mime_type, conn=conn)
+            catalog.set_meta("filter_metadata_migrated", "1", conn=conn)
+
+    @staticmethod
+    def _space_of(collection) -> str:
+        try:
+            configuration = collection.configuration or {}
+            return (configuration.get("hnsw") or {}).get("space") or "l2"
+        except Exception:
+            return (collection.metadata or {}).get("hnsw:space", "l2")
+
+    def changed(self):
+        """
+        Called after every write to the collection.
+        """
+        with self._lock:
+            self._generation += 1
+            self._exact_cache.clear()
+
+    def _filtered_vectors(self, where: Dict) -> Tuple[List[str], "np.ndarray"]:
+        import numpy as np
+
+        key = repr(where)
+        with self._lock:
+            cached = self._exact_cache.get(key)
+            if cached is not None:
+                self._exact_cache.move_to_end(key)
+                return cached
+            generation = self._generation
+        found = self.collection.get(where=where, include=["embeddings"])
+        entry = (found["ids"], np.asarray(found["embeddings"], dtype=np.float32))
+        with self._lock:
+            # Not cached if the collection changed while it was read
+            if generation == self._generation and len(entry[0]) <= self.exact_cache_vectors:
+                self._exact_cache[key] = entry
+                while sum(len(ids) for ids, _ in self._exact_cache.values()) > self.exact_cache_vectors:
+                    self._exact_cache.popitem(last=False)
+        return entry
+
+    def exact_search(self, embedding: List[float], k: int, where: Dict) -> List[Tuple["Document", float]]:
+        """
+        Exact nearest neighbours among the chunks matching `where`, as
+        (document, distance) like Chroma's vector search. Only the filtered
+        vectors are read (and kept for the next query with the same filter)
+        and scored in numpy; texts are fetched for the top k. For a small
+        filtered set this is cheaper than a filtered HNSW search and never
+        misses a match.
+        """
+        import numpy as np
+        from langchain_core.documents import Document
+
+        ids, vectors = self._filtered_vectors(where)
+        if not ids:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            distances = 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+        elif self.space == "ip":
+            distances = 1.0 - vectors @ query
+        else:  # Chroma's l2 is the squared distance
+            diff = vectors - query
+            distances = np.einsum("ij,ij->i", diff, diff)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        found = self.collection.get(ids=[ids[i] for i in top], include=["documents", "metadatas"])
+        rows = {chunk_id: (text, meta) for chunk_id, text, meta in
+                zip(found["ids"], found["documents"], found["metadatas"])}
+        hits = []
+        for i in top:
+            if ids[i] in rows:  # unless deleted meanwhile
+                text, meta = rows[ids[i]]
+                hits.append((Document(id=ids[i], page_content=text or "", metadata=meta or {}), float(distances[i])))
+        return hits
+
+    def close(self):
+        """
+        Releases the in-process state (BM25 index, catalog connection); the
+        base can be opened again later.
+        """
+        with self._lock:
+            if self.catalog is not None:
+                self.catalog.close()
+            self.vector_store = self.collection = self.catalog = self.doc_store = None
+            self.lexical_index = self.ingest_pipeline = self.lexical_build = None
+            self._exact_cache.clear()
+
+    def record_search(self, seconds: float):
+        self.searches += 1
+        self._search_latencies.append(seconds)
+
+    def stats(self) -> Dict:
+        """
+        Size, estimated memory and search latency. Vector memory is an
+        estimate of Chroma's HNSW index for this collection, which Chroma
+        loads on the first vector search.
+        """
+        if not self.is_open:
+            return {"loaded": False}
+        latencies = sorted(self._search_latencies)
+        chunks = self.collection.count()
+        lexical_built = self.lexical_build is not None and self.lexical_build.done()
+        return {
+            "loaded": True,
+            "documents": self.catalog.count_documents(),
+            "chunks": chunks,
+            "open_ms": round(self.open_seconds * 1000, 1),
+            "lexical_mb": round(self.lexical_index.memory_bytes() / 2 ** 20, 2) if lexical_built else 0.0,
+            "vector_mb_est": round(chunks * (self.dimension * 4 + _HNSW_OVERHEAD_BYTES) / 2 ** 20, 2)
+            if self.searches else 0.0,
+            "searches": self.searches,
+            "search_ms_p50": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+            "search_ms_p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else None,
+        }
@@ -0,0 +1,212 @@
+import math
+import re
+import sys
+import threading
+from array import array
+from collections import Counter
+from typing import Collection, List, Dict, Optional, Tuple, Iterable, Sequence
+
+# CJK ideographs, kana and hangul are indexed as character bigrams; everything
+# else as lowercase words. Identifiers like "ERR_CONN-404" or "v1.2.3" are kept
+# whole and also split into their parts.
+_CJK = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W{_CJK}]+(?:[._\-/:#][^\W{_CJK}]+)*")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_PART_RE = re.compile(r"[._\-/:#]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(match):
+            if len(match) == 1:
+                tokens.append(match)
+            else:
+                tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+        else:
+            tokens.append(match)
+            parts = _PART_RE.split(match)
+            if len(parts) > 1:
+                tokens.extend(p for p in parts if p)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[str]:
+    """
+    Merges several ranked id lists: score(id) = sum(1 / (k + rank)).
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over chunk texts.
+    Postings are compact arrays (chunk slot, term frequency); removed chunks are
+    tombstoned and the postings are compacted once enough of them pile up.
+    Each slot also records its chunk's document, so a search can be limited
+    to a set of documents (retrieval filters).
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, compact_ratio: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+
+        self._lock = threading.RLock()
+        self._ids: List[str] = []           # slot -> chunk id
+        self._slots: Dict[str, int] = {}    # chunk id -> slot (live only)
+        self._lengths = array("I")          # slot -> token count
+        self._alive = bytearray()           # slot -> 1 if live
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._doc_numbers: Dict[str, int] = {}  # doc id -> number (0: unknown)
+        self._slot_docs = array("I")             # slot -> doc number
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, chunk_id: str):
+        return chunk_id in self._slots
+
+    def _doc_number(self, doc_id: Optional[str]) -> int:
+        if not doc_id:
+            return 0
+        number = self._doc_numbers.get(doc_id)
+        if number is None:
+            number = self._doc_numbers[doc_id] = len(self._doc_numbers) + 1
+        return number
+
+    def add_many(self, ids: Sequence[str], texts: Sequence[str], doc_ids: Optional[Sequence[str]] = None):
+        """
+        `doc_ids` are the chunks' documents, one per id (or None for all
+        unknown); chunks without one never match a document restriction.
+        """
+        with self._lock:
+            self.remove(ids)
+            for i, (chunk_id, text) in enumerate(zip(ids, texts)):
+                tokens = tokenize(text)
+                slot = len(self._ids)
+                self._ids.append(chunk_id)
+                self._slots[chunk_id] = slot
+                self._lengths.append(len(tokens))
+                self._alive.append(1)
+                self._slot_docs.append(self._doc_number(doc_ids[i] if doc_ids is not None else None))
+                self._total_length += len(tokens)
+                for term, tf in Counter(tokens).items():
+                    posting = self._postings.get(term)
+                    if posting is None:
+                        posting = self._postings[term] = (array("I"), array("H"))
+                    posting[0].append(slot)
+                    posting[1].append(min(tf, 65535))
+
+    def add(self, chunk_id: str, text: str, doc_id: Optional[str] = None):
+        self.add_many([chunk_id], [text], [doc_id])
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in ids:
+                slot = self._slots.pop(chunk_id, None)
+                if slot is None:
+                    continue
+                self._alive[slot] = 0
+                self._total_length -= self._lengths[slot]
+            dead = len(self._ids) - len(self._slots)
+            if dead and dead > self.compact_ratio * len(self._ids):
+                self._compact()
+
+    def _compact(self):
+        remap = {}
+        ids, lengths, alive, slot_docs = [], array("I"), bytearray(), array("I")
+        for slot, chunk_id in enumerate(self._ids):
+            if self._alive[slot]:
+                remap[slot] = len(ids)
+                ids.append(chunk_id)
+                lengths.append(self._lengths[slot])
+                alive.append(1)
+                slot_docs.append(self._slot_docs[slot])
+        postings = {}
+        for term, (slots, tfs) in self._postings.items():
+            new_slots, new_tfs = array("I"), array("H")
+            for slot, tf in zip(slots, tfs):
+                new_slot = remap.get(slot)
+                if new_slot is not None:
+                    new_slots.append(new_slot)
+                    new_tfs.append(tf)
+            if new_slots:
+                postings[term] = (new_slots, new_tfs)
+        self._ids, self._lengths, self._alive, self._postings = ids, lengths, alive, postings
+        self._slot_docs = slot_docs
+        self._slots = {chunk_id: slot for slot, chunk_id in enumerate(ids)}
+
+    def search(self, query: str, k: int = 10,
+               doc_ids: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (chunk id, score) pairs, best first; with `doc_ids`,
+        only chunks of those documents are considered (the k best of them,
+        not the matches among the overall k best).
+        """
+        import numpy as np  # not needed until the first search
+
+        terms = set(tokenize(query))
+        with self._lock:
+            n_live = len(self._slots)
+            if not terms or n_live == 0:
+                return []
+            avg_length = self._total_length / n_live or 1.0
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting is None:
+                    continue
+                slots = np.frombuffer(posting[0], dtype=np.uint32)
+                tfs = np.frombuffer(posting[1], dtype=np.uint16).astype(np.float32)
+                # df includes tombstoned slots until the next compaction
+                df = min(len(slots), n_live)
+                idf = math.log(1.0 + (n_live - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[slots] / avg_length)
+                scores[slots] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+            scores *= np.frombuffer(bytes(self._alive), dtype=np.uint8)
+            if doc_ids is not None:
+                wanted = [self._doc_numbers[d] for d in doc_ids if d in self._doc_numbers]
+                scores *= np.isin(np.frombuffer(self._slot_docs, dtype=np.uint32), wanted)
+
+            k = min(k, int(np.count_nonzero(scores)))
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self._ids[i], float(scores[i])) for i in top]
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate size of the index: posting arrays, per-slot arrays, ids
+        and the hash tables pointing at them.
+        """
+        with self._lock:
+            size = (len(self._lengths) * self._lengths.itemsize + len(self._alive)
+                    + len(self._slot_docs) * self._slot_docs.itemsize + sys.getsizeof(self._doc_numbers))
+            size += sum(sys.getsizeof(chunk_id) for chunk_id in self._ids)
+            size += sys.getsizeof(self._ids) + sys.getsizeof(self._slots) + sys.getsizeof(self._postings)
+            for term, (slots, tfs) in self._postings.items():
+                size += sys.getsizeof(term) + sys.getsizeof(slots) + sys.getsizeof(tfs)
+            return size
+
+    def build_from_collection(self, collection, page_size: int = 2000) -> int:
+        """
+        (Re)builds the index from every chunk in a Chroma collection.
+        """
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            self.add_many(ids, [d or "" for d in page["documents"]],
+                          [(m or {}).get("doc_id") for m in page["metadatas"]])
+            offset += len(ids)
+        return len(self)
@@ -0,0 +1,154 @@
+import asyncio
+import difflib
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .embedding_cache import normalize_text
+from .telemetry import tracer
+
+logger = logging.getLogger(__name__)
+
+# (draft, scope) -> (query embedding or None, retrieved documents)
+RetrieveFn = Callable[[str, Hashable], Awaitable[Tuple[Optional[List[float]], list]]]
+
+
+class PrefetchResult:
+    def __init__(self, query: str, kb_version: int, scope: Hashable = None):
+        self.query = query
+        self.key = _normalize(query)
+        self.kb_version = kb_version
+        self.scope = scope  # what was searched, e.g. the selected knowledge bases
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.embedding: Optional[List[float]] = None
+        self.docs: list = []
+
+    @property
+    def latency(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+
+def _normalize(query: str) -> str:
+    return normalize_text(query).lower()
+
+
+class RetrievalPrefetcher:
+    """
+    Speculative retrieval for the draft being typed. Only the latest draft is
+    kept: starting a new prefetch cancels the one in flight. On submit, take()
+    hands back the result if the submitted text matches the draft exactly or
+    nearly (difflib ratio >= `min_similarity`), awaiting it if still running.
+    """
+
+    def __init__(self, retrieve: RetrieveFn, min_similarity: float = 0.9, max_age: float = 120.0):
+        self.retrieve = retrieve
+        self.min_similarity = min_similarity
+        self.max_age = max_age
+        self._current: Optional[PrefetchResult] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.started = 0
+        self.cancelled = 0
+        self.submits = 0
+        self.hits = 0
+        self.near_hits = 0
+        self.embedding_calls = 0  # query embeddings issued by prefetches
+        self.used_embeddings = 0  # ... of which a submitted query reused
+        self.saved_seconds = 0.0
+
+    def start(self, draft: str, kb_version: int, scope: Hashable = None) -> Optional[asyncio.Task]:
+        """
+        Prefetches `draft` over `scope`, superseding any earlier prefetch. A
+        draft equal to the current one is not fetched again.
+        """
+        if self._current is not None and self._current.key == _normalize(draft) \
+                and self._current.kb_version == kb_version and self._current.scope == scope:
+            return self._task
+        self.cancel()
+        result = PrefetchResult(draft, kb_version, scope)
+        self._current = result
+        self._task = asyncio.ensure_future(self._run(result))
+        self.started += 1
+        return self._task
+
+    async def _run(self, result: PrefetchResult):
+        with tracer.span("prefetch.retrieve", query_chars=len(result.query)) as span:
+            self.embedding_calls += 1
+            try:
+                result.embedding, result.docs = await self.retrieve(result.query, result.scope)
+            except asyncio.CancelledError:
+                span.set(cancelled=True)
+                raise
+            result.finished = time.perf_counter()
+            span.set(chunks=len(result.docs))
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            self.cancelled += 1
+        self._task = None
+        self._current = None
+
+    async def take(self, query: str, kb_version: int, scope: Hashable = None) -> Optional[PrefetchResult]:
+        """
+        Returns (and consumes) the prefetched retrieval for a submitted query,
+        or None if there is no usable one.
+        """
+        self.submits += 1
+        result, task = self._current, self._task
+        if result is None or result.kb_version != kb_version or result.scope != scope:
+            self.cancel()
+            return None
+
+        key = _normalize(query)
+        exact = result.key == key
+        if not exact and difflib.SequenceMatcher(None, result.key, key).ratio() < self.min_similarity:
+            self.cancel()
+            return None
+
+        # Time already spent on this retrieval is what the submit saves
+        saved = time.perf_counter() - result.started
+        if task is not None and not task.done():
+            try:
+                # Shielded: cancelling the submitted query must not cancel
+                # the prefetch, and the prefetch failing must not fail the query
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                current = asyncio.current_task()
+                if current is not None and current.cancelling():
+                    raise  # the submitted query itself was cancelled
+                logger.debug("Prefetch was cancelled")
+                self._current = self._task = None
+                return None
+            except Exception as e:
+                logger.debug("Prefetch failed: %r", e)
+                self._current = self._task = None
+                return None
+        elif task is not None and (task.cancelled() or task.exception() is not None):
+            self._current = self._task = None
+            return None
+        if result.finished and time.perf_counter() - result.finished > self.max_age:
+            self._current = self._task = None
+            return None
+
+        self._current = self._task = None
+        self.hits += 1
+        if not exact:
+            self.near_hits += 1
+        self.used_embeddings += 1
+        self.saved_seconds += min(saved, result.latency)
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "started": self.started,
+            "cancelled": self.cancelled,
+            "submits": self.submits,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "hit_rate": self.hits / self.submits if self.submits else 0.0,
+            "embedding_calls": self.embedding_calls,
+            "wasted_embedding_calls": self.embedding_calls - self.used_embeddings,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -0,0 +1,147 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .embedding_cache import normalize_text
+
+
+class CachedAnswer:
+    def __init__(self, query: str, embedding: Optional[List[float]], docs: List[Document],
+                 chunks: List[str], kb_version: int, latency: float):
+        self.query = query
+        self.embedding = embedding
+        self.docs = docs
+        self.chunks = chunks  # streamed answer pieces, replayed as-is
+        self.kb_version = kb_version
+        self.latency = latency  # seconds the original retrieval + generation took
+        self.created_at = time.time()
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.chunks)
+
+
+class QueryCache:
+    """
+    Layered cache for retrieval results and answers:
+    - exact tier keyed on normalized query text
+    - semantic tier matching a new query embedding within `max_distance`
+      (cosine distance) of a cached one
+    Entries are tied to the knowledge-base version they were built against;
+    bumping the version invalidates everything.
+    """
+
+    def __init__(self, max_entries: int = 256, max_distance: float = 0.05, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.kb_version = 0
+
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._lock = threading.RLock()
+        # Unit-normalized embeddings of the cached queries, row-aligned with _keys
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+
+        # Every lookup goes through the exact tier; only its misses go on
+        # to the semantic tier (when there is a query embedding)
+        self.exact_hits = 0
+        self.exact_misses = 0
+        self.semantic_hits = 0
+        self.semantic_misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return normalize_text(query).lower()
+
+    def bump_version(self) -> int:
+        """
+        Called whenever the knowledge base changes; drops all cached entries.
+        """
+        with self._lock:
+            self.kb_version += 1
+            self._entries.clear()
+            self._rebuild_index()
+            return self.kb_version
+
+    def _is_fresh(self, entry: CachedAnswer) -> bool:
+        if entry.kb_version != self.kb_version:
+            return False
+        return self.ttl is None or time.time() - entry.created_at < self.ttl
+
+    def _rebuild_index(self):
+        self._keys = [k for k, e in self._entries.items() if e.embedding is not None]
+        if not self._keys:
+            self._matrix = None
+            return
+        matrix = np.array([self._entries[k].embedding for k in self._keys], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self._matrix = matrix / norms
+
+    def lookup_exact(self, query: str) -> Optional[CachedAnswer]:
+        key = self.normalize(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._is_fresh(entry):
+                self.exact_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            self.saved_seconds += entry.latency
+            return entry
+
+    def lookup_semantic(self, embedding: List[float]) -> Optional[CachedAnswer]:
+        with self._lock:
+            if self._matrix is None:
+                self.semantic_misses += 1
+                return None
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm == 0 or vector.shape[0] != self._matrix.shape[1]:
+                self.semantic_misses += 1
+                return None
+            similarities = self._matrix @ (vector / norm)
+            best = int(np.argmax(similarities))
+            entry = self._entries.get(self._keys[best])
+            if entry is None or 1.0 - float(similarities[best]) > self.max_distance or not self._is_fresh(entry):
+                self.semantic_misses += 1
+                return None
+            self._entries.move_to_end(self._keys[best])
+            self.semantic_hits += 1
+            self.saved_seconds += entry.latency
+            return entry
+
+    def put(self, query: str, embedding: Optional[List[float]], docs: List[Document],
+            chunks: List[str], latency: float, kb_version: int):
+        with self._lock:
+            # The knowledge base changed while this answer was generated
+            if kb_version != self.kb_version:
+                return
+            key = self.normalize(query)
+            self._entries[key] = CachedAnswer(query, embedding, docs, chunks, kb_version, latency)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._rebuild_index()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.exact_hits + self.exact_misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "exact_hits": self.exact_hits,
+                "exact_misses": self.exact_misses,
+                "semantic_hits": self.semantic_hits,
+                "semantic_misses": self.semantic_misses,
+                "misses": lookups - hits,  # answered by neither tier
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "entries": len(self._entries),
+                "kb_version": self.kb_version,
+            }
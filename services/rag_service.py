@@ -1,121 +1,1062 @@
 import os
+import time
 import asyncio
-from typing import List, Dict
+import functools
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import List, Dict, Optional, Sequence, Tuple, TYPE_CHECKING
 
-from langchain_community.chat_models import ChatTongyi
-from langchain_community.embeddings import DashScopeEmbeddings
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-import chromadb
-from PyQt5.QtCore import QStandardPaths, QObject, pyqtSignal
+from PyQt5.QtCore import QStandardPaths, QCoreApplication, QObject, pyqtSignal
+
+from .document_catalog import make_doc_id, make_chunk_id, content_hash as hash_content
+from .ingest_pipeline import ProgressCallback
+from .knowledge_base import KnowledgeBase, COLLECTION_NAME, DEFAULT_KB, list_names, validate_name
+from .retrieval_filter import RetrievalFilter, DEFAULT_MIME_TYPE, mime_type_for
+from .extraction import extract_text, extract_to_spool
+from .streaming_ingest import ExtractedFile, SEPARATORS, StreamingSplitter
+from .bulk_ingest import ingest_directory, FileProgressCallback
+from .startup_profile import startup_profile
+from .telemetry import tracer
+from .request_scheduler import RequestScheduler, ChatRequest
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import BaseMessage
+    from .context_builder import ContextResult
+    from .query_cache import CachedAnswer, QueryCache
+    from .rate_limiter import RateLimiter
+
+# LangChain, chromadb and the DashScope client take seconds to import, so they
+# are only imported by `_initialize` (on a background thread) and inside the
+# methods that need them. Every public async method awaits `wait_ready()`.
+
+logger = logging.getLogger(__name__)
+
+# Qt derives AppDataLocation from the application name, which for the desktop
+# app is its script name; headless tools pass it to open the same data.
+DESKTOP_APP_NAME = "main.py"
+
+def default_base_path(app_name: Optional[str] = None) -> str:
+    if app_name:
+        QCoreApplication.setApplicationName(app_name)
+    data_path = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
+    return os.path.join(data_path, "RagDataBase")
 
 class RagService(QObject):
     """
     Service to handle RAG operations: ChromaDB access and LLM calls.
     Inherits from QObject to use Signals if needed, but primarily used via async methods.
+
+    Construction is cheap; the embeddings, the Chroma collection and the
+    sidecar stores are opened by `start()` on a background thread.
     """
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, embeddings: Optional["Embeddings"] = None,
+                 chat_model: Optional["BaseChatModel"] = None, base_path: Optional[str] = None,
+                 embedding_provider: str = "dashscope", embedding_options: Optional[Dict] = None,
+                 context_budget: Optional[int] = None, context_candidates: int = 12, max_concurrent_queries: int = 2,
+                 rate_limiter: Optional["RateLimiter"] = None):
         super().__init__()
         # Set API Key for DashScope
         os.environ["DASHSCOPE_API_KEY"] = api_key
         
-        # 1. Initialize Embeddings
-        self.embeddings = DashScopeEmbeddings(
-            model="text-embedding-v1"
-        )
-        
-        # 2. Initialize ChromaDB (Persistent)
         # Store in AppData folder to avoid permission issues
-        data_path = QStandardPaths.writableLocation(QStandardPaths.AppDataLocation)
-        db_path = os.path.join(data_path, "RagDataBase", "chroma_db")
+        # (`base_path` overrides it, e.g. for benchmarks on a scratch directory)
+        self.base_path = base_path or default_base_path()
+
+        # Embeddings come from a provider (see services.embedding_providers),
+        # e.g. "onnx" with {"model_path": ..., "threads": 4} for a local CPU
+        # model. `embeddings` lets callers pass an Embeddings object directly
+        # (e.g. services.fakes.HashingEmbeddings); `chat_model` does the same
+        # for the LLM.
+        self.embedding_provider = embedding_provider
+        self.embedding_options = embedding_options or {}
+        self._embeddings_override = embeddings
+        self._chat_model_override = chat_model
+
+        # Named knowledge bases (see services.knowledge_base), opened on first
+        # use. Documents go into one base (`kb`, default "default"); a query
+        # searches the bases it selects (`bases`, default `default_bases`)
+        # concurrently. Bases nobody selects are never loaded.
+        self.default_bases: List[str] = [DEFAULT_KB]
+        self._bases: Dict[str, KnowledgeBase] = {}
+        self._bases_lock = threading.Lock()
+        self._chroma_client = None
+
+        # One answer cache per selection of bases and retrieval filter,
+        # `query_cache_size` entries each; 0 turns answer caching off. Only
+        # the `max_query_caches` most recently used selections are kept.
+        self.query_cache_size = 256
+        self.max_query_caches = 16
+        self._query_caches: "OrderedDict[Tuple[Tuple[str, ...], Optional[RetrievalFilter]], QueryCache]" = \
+            OrderedDict()
+        # New caches start past every evicted cache's version, so nothing
+        # taken from an evicted one (e.g. a prefetch) matches its successor
+        self._query_cache_epoch = 0
+
+        # Process pool for file parsing (see _get_parse_pool)
+        self.parse_workers = max(1, (os.cpu_count() or 2) - 1)
+        self._parse_pool = None
+
+        # Vector search slower than `vector_timeout` seconds is skipped.
+        self.vector_timeout = 3.0
+
+        # A filtered query whose filter matches at most `exact_search_limit`
+        # chunks of a base scores them all exactly instead of searching the
+        # HNSW index with a `where` clause (see KnowledgeBase.exact_search)
+        self.exact_search_limit = 2000
+
+        # Files are ingested from a spooled copy of their text, embedding
+        # `stream_window_chunks` chunks at a time (see ingest_extracted)
+        self.stream_window_chunks = 1000
+
+        # Prompt context: `context_candidates` chunks are retrieved, then
+        # diversified, merged and packed into `context_budget` estimated
+        # tokens (default: no more than the old top-3 context; see
+        # services.context_builder)
+        self.context_budget = context_budget
+        self.context_candidates = context_candidates
+        self._context_totals = {"queries": 0, "context_tokens": 0, "naive_tokens": 0, "baseline_tokens": 0}
+
+        # Chat answers run as cancellable tasks, `max_concurrent_queries` at
+        # a time (see submit_query)
+        self.scheduler = RequestScheduler(max_concurrent_queries)
+
+        # Calls to the remote APIs (DashScope embeddings, the default chat
+        # model) share one RateLimiter built from `rate_limits` (None: no
+        # limiter); see services.rate_limiter. A `rate_limiter` passed in is
+        # applied to the embeddings and chat model whatever they are, e.g.
+        # to exercise it against services.fakes.FakeProviderServer.
+        self.rate_limits: Optional[Dict] = {"requests_per_minute": 600, "tokens_per_minute": None}
+        self._rate_limiter_override = rate_limiter
+        self.rate_limiter: Optional["RateLimiter"] = None
+        self._chat_limiter: Optional["RateLimiter"] = None
+
+        self._init_future: Optional[Future] = None
+        self._start_lock = threading.Lock()
+
+    def start(self) -> Future:
+        """
+        Starts opening the heavy resources on a background thread (idempotent).
+        The returned future resolves once the service is ready, or carries the
+        initialization error.
+        """
+        with self._start_lock:
+            if self._init_future is None:
+                self._init_future = Future()
+                threading.Thread(target=self._run_initialize, name="rag-service-init", daemon=True).start()
+            return self._init_future
+
+    def _run_initialize(self):
+        try:
+            with startup_profile.phase("service.initialize"):
+                self._initialize()
+        except BaseException as e:
+            self._init_future.set_exception(e)
+        else:
+            self._init_future.set_result(True)
+
+    def is_ready(self) -> bool:
+        future = self._init_future
+        return future is not None and future.done() and future.exception() is None
+
+    async def wait_ready(self):
+        """
+        Awaits initialization, starting it if nobody has yet. Re-raises the
+        initialization error, if any.
+        """
+        await asyncio.wrap_future(self.start())
+
+    def _initialize(self):
+        db_path = os.path.join(self.base_path, "chroma_db")
         os.makedirs(db_path, exist_ok=True)
+
+        # 1. Initialize Embeddings
+        # Wrapped in a persistent cache so identical chunks and repeated
+        # questions are only embedded once.
+        with startup_profile.phase("import.embeddings"):
+            from .embedding_cache import CachedEmbeddings
+            from .embedding_providers import create_backend, backend_from_embeddings
+            from .rate_limiter import RateLimiter, RateLimitedEmbeddings
+        with startup_profile.phase(f"open.embeddings.{self.embedding_provider}"):
+            if self._embeddings_override is not None:
+                self.embedding_backend = backend_from_embeddings(self._embeddings_override)
+            else:
+                self.embedding_backend = create_backend(self.embedding_provider, **self.embedding_options)
+        limit_embeddings = self._embeddings_override is None and self.embedding_provider == "dashscope"
+        limit_chat = self._chat_model_override is None
+        self.rate_limiter = self._rate_limiter_override
+        if self.rate_limiter is not None:
+            limit_embeddings = limit_chat = True
+        elif self.rate_limits is not None and (limit_embeddings or limit_chat):
+            self.rate_limiter = RateLimiter(**self.rate_limits)
+        limit_embeddings = limit_embeddings and self.rate_limiter is not None
+        embeddings = self.embedding_backend.embeddings
+        if limit_embeddings:
+            # Under the cache, so cache hits cost no request budget
+            embeddings = RateLimitedEmbeddings(embeddings, self.rate_limiter)
+        with startup_profile.phase("open.embedding_cache"):
+            self.embeddings = CachedEmbeddings(
+                embeddings,
+                model_name=self.embedding_backend.model_id,
+                db_path=os.path.join(self.base_path, "embedding_cache.sqlite3")
+            )
         
-        # Using langchain-chroma wrapper for easier integration
-        self.vector_store = Chroma(
-            collection_name="rag_collection",
-            embedding_function=self.embeddings,
-            persist_directory=db_path
-        )
+        # 2. Initialize ChromaDB (Persistent)
+        # One client for all knowledge bases; each base is a collection of
+        # it, opened with its catalog and document store by _open_kb.
+        with startup_profile.phase("import.chroma"):
+            import chromadb
+            import langchain_chroma  # noqa: F401
+        with startup_profile.phase("open.chroma_client"):
+            self._chroma_client = chromadb.PersistentClient(path=db_path)
+
+        # Batched, concurrent embedding + write pipeline for ingestion
+        # (rate-limited embeddings are already retried by the limiter)
+        self._pipeline_options = {"batch_size": 25, "max_in_flight": 4, "max_retries": 0 if limit_embeddings else 3}
+
+        # Only the bases selected by default are opened up front
+        for name in self.default_bases:
+            if name in list_names(self.base_path):
+                self._open_kb_sync(name)
 
         # 3. Initialize Chat Model
-        self.chat_model = ChatTongyi(
-            model="qwen-plus",
-            streaming=True
-        )
+        chat_model = self._chat_model_override
+        if chat_model is None:
+            with startup_profile.phase("open.chat_model"):
+                from langchain_community.chat_models import ChatTongyi
+                chat_model = ChatTongyi(
+                    model="qwen-plus",
+                    streaming=True
+                )
+        self.chat_model = chat_model
+        self._chat_limiter = self.rate_limiter if limit_chat else None
+
+        # Warm the imports used on the first query / ingest
+        with startup_profile.phase("import.query_path"):
+            import langchain_core.messages  # noqa: F401
+            import langchain_text_splitters  # noqa: F401
+            from .query_cache import QueryCache  # noqa: F401
+            from .prefetch import RetrievalPrefetcher
+            from .context_builder import ContextBuilder
+
+        # Speculative retrieval for the draft being typed (see start_prefetch)
+        self.prefetcher = RetrievalPrefetcher(self._prefetch_retrieve)
+
+        self.context_builder = ContextBuilder(token_budget=self.context_budget)
+
+    # Knowledge bases
+
+    def knowledge_bases(self) -> List[str]:
+        """
+        Names of all knowledge bases, "default" first.
+        """
+        return list_names(self.base_path)
 
-    async def add_document(self, title: str, content: str, source: str = ""):
+    def create_knowledge_base(self, name: str) -> str:
+        """
+        Creates an empty knowledge base (a no-op if it exists). It is opened,
+        and its collection created, when first used.
+        """
+        validate_name(name)
+        os.makedirs(KnowledgeBase(name, self.base_path).root, exist_ok=True)
+        return name
+
+    def loaded_knowledge_bases(self) -> List[str]:
+        return [name for name, base in self._bases.items() if base.is_open]
+
+    def unload_knowledge_base(self, name: str):
+        """
+        Frees a base's in-process state (BM25 index, catalog connection); it
+        is opened again on its next use.
+        """
+        with self._bases_lock:
+            base = self._bases.pop(name, None)
+        if base is not None:
+            base.close()
+
+    def knowledge_base_stats(self) -> Dict[str, Dict]:
+        """
+        Per-base size, estimated memory and search latency; bases that are
+        not loaded only report `loaded: False`.
+        """
+        stats = {}
+        for name in self.knowledge_bases():
+            base = self._bases.get(name)
+            stats[name] = base.stats() if base is not None else {"loaded": False}
+        return stats
+
+    def _open_kb_sync(self, name: str) -> KnowledgeBase:
+        if name not in list_names(self.base_path):
+            raise ValueError(f"Unknown knowledge base {name!r}")
+        with self._bases_lock:
+            base = self._bases.get(name)
+            if base is None:
+                base = self._bases[name] = KnowledgeBase(name, self.base_path)
+        with tracer.span("kb.open", kb=name) as span:
+            base.open(self._chroma_client, self.embeddings, self.embedding_backend, self._pipeline_options)
+            span.set(seconds=round(base.open_seconds, 3))
+        return base
+
+    async def _kb(self, name: Optional[str] = None) -> KnowledgeBase:
+        """
+        The knowledge base `name` (default "default"), opening it in a worker
+        thread on first use.
+        """
+        base = self._bases.get(name or DEFAULT_KB)
+        if base is not None and base.is_open:
+            return base
+        return await asyncio.get_running_loop().run_in_executor(None, self._open_kb_sync, name or DEFAULT_KB)
+
+    def _selection(self, bases: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+        selection = tuple(sorted(set(bases if bases else self.default_bases)))
+        known = set(self.knowledge_bases())
+        for name in selection:
+            if name not in known:
+                raise ValueError(f"Unknown knowledge base {name!r}")
+        return selection
+
+    def query_cache_for(self, bases: Optional[Sequence[str]] = None,
+                        filters: Optional[RetrievalFilter] = None) -> "QueryCache":
+        """
+        The answer cache of a selection of bases and filter (cached answers
+        depend on what was searched).
+        """
+        from .query_cache import QueryCache
+
+        key = (self._selection(bases), filters or None)
+        cache = self._query_caches.get(key)
+        if cache is None:
+            cache = self._query_caches[key] = QueryCache(max_entries=self.query_cache_size)
+            cache.kb_version = self._query_cache_epoch
+            while len(self._query_caches) > self.max_query_caches:
+                _, evicted = self._query_caches.popitem(last=False)
+                self._query_cache_epoch = max(self._query_cache_epoch, evicted.kb_version + 1)
+        else:
+            self._query_caches.move_to_end(key)
+        return cache
+
+    @property
+    def query_cache(self) -> "QueryCache":
+        return self.query_cache_for()
+
+    def _knowledge_base_changed(self, name: str):
+        # Invalidates the cached answers of every selection including `name`
+        base = self._bases.get(name)
+        if base is not None:
+            base.changed()
+        for (selection, _), cache in self._query_caches.items():
+            if name in selection:
+                cache.bump_version()
+
+    async def add_document(self, title: str, content: str, source: str = "",
+                           progress_callback: Optional[ProgressCallback] = None, kb: Optional[str] = None,
+                           mime_type: str = DEFAULT_MIME_TYPE):
         """
         Splits text and adds to ChromaDB with metadata. 
         Also generates a brief summary for the metadata.
+        Re-saving a title replaces the previous version: unchanged content is a
+        no-op and only new/modified chunks are embedded.
+        `progress_callback(done, total)` reports embedded chunks per batch.
+        The document goes into knowledge base `kb` (default "default").
         """
+        await self.wait_ready()
+        base = await self._kb(kb)
+        with tracer.span("ingest.add_document", chars=len(content), kb=base.name) as span:
+            return await self._add_document(base, title, content, source, mime_type, progress_callback, span)
+
+    async def _add_document(self, base, title, content, source, mime_type, progress_callback, span):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
         # Generate summary (first 200 chars or LLM summary)
         # For speed, we'll use a simple extraction. 
         # Ideally, use self.chat_model to summarize, but that consumes tokens.
         summary = content[:200] + "..." if len(content) > 200 else content
+        doc_id = make_doc_id(title)
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=50
-        )
-        splits = text_splitter.create_documents(
-            texts=[content],
-            metadatas=[{"title": title, "source": source, "summary": summary, "full_content": content}]
-        )
-        
-        # Async add documents
-        await self.vector_store.aadd_documents(splits)
+        # Unchanged content is a no-op
+        existing = base.catalog.get_document(doc_id)
+        content_hash = hash_content(content)
+        if existing and existing['content_hash'] == content_hash:
+            span.set(unchanged=True, chunks=existing['chunk_count'], new_chunks=0)
+            return existing['chunk_count']
+
+        ingested_at = time.time()
+
+        with tracer.span("ingest.split") as split_span:
+            text_splitter = RecursiveCharacterTextSplitter(
+                separators=SEPARATORS,
+                keep_separator="start",
+                chunk_size=500,
+                chunk_overlap=50,
+                add_start_index=True
+            )
+            splits = text_splitter.create_documents(
+                texts=[content],
+                metadatas=[{"doc_id": doc_id, "title": title, "source": source, "content_hash": content_hash,
+                            "mime_type": mime_type, "ingested_at": ingested_at}]
+            )
+            for split in splits:
+                split.metadata["end_index"] = split.metadata["start_index"] + len(split.page_content)
+            split_span.set(chunks=len(splits))
+
+        # Deterministic ids: a chunk whose index and text did not change keeps
+        # its id, so only new/modified chunks need embedding.
+        ids = [make_chunk_id(doc_id, i, split.page_content) for i, split in enumerate(splits)]
+        loop = asyncio.get_running_loop()
+        old = await loop.run_in_executor(None, functools.partial(
+            base.collection.get, where={"doc_id": doc_id}, include=["metadatas"]
+        ))
+        old_metadatas = dict(zip(old['ids'], old['metadatas']))
+        old_ids = set(old_metadatas)
+        new_positions = [i for i, chunk_id in enumerate(ids) if chunk_id not in old_ids]
+        kept_positions = [i for i, chunk_id in enumerate(ids) if chunk_id in old_ids]
+        stale_ids = list(old_ids - set(ids))
+        new_ids = [ids[i] for i in new_positions]
+        span.set(unchanged=False, chunks=len(splits), new_chunks=len(new_ids), stale_chunks=len(stale_ids))
+
+        # Store the full text once; chunks reference it by hash + offsets
+        stored_content = not base.doc_store.contains(content_hash)
+        updated_ids: List[str] = []
+        # Embed in batches and write each batch as soon as it is ready
+        try:
+            base.doc_store.put(content)
+            with tracer.span("ingest.embed_write", chunks=len(new_ids)) as write_span:
+                await base.ingest_pipeline.run(
+                    new_ids,
+                    [splits[i].page_content for i in new_positions],
+                    [splits[i].metadata for i in new_positions],
+                    progress_callback=progress_callback
+                )
+                write_span.set(chunks_per_s=round(len(new_ids) / max(time.perf_counter() - write_span.start, 1e-9), 1))
+            # Kept chunks only need their offsets, content hash and
+            # ingestion time refreshed
+            if kept_positions:
+                updated_ids = [ids[i] for i in kept_positions]
+                await loop.run_in_executor(None, functools.partial(
+                    base.collection.update,
+                    ids=updated_ids,
+                    metadatas=[splits[i].metadata for i in kept_positions]
+                ))
+            # Record the document in the catalog. If anything fails, undo the
+            # writes above so the collection, the store and the catalog never
+            # disagree.
+            base.catalog.upsert_document(doc_id, title, source, summary, len(splits), content_hash,
+                                         mime_type=mime_type, ingested_at=ingested_at)
+        except BaseException:
+            await self._undo_ingest(base, content_hash, stored_content, new_ids,
+                                    {i: old_metadatas[i] for i in updated_ids})
+            raise
+
+        # BM25 tokenizing is CPU-bound: off the event loop, like the Chroma writes
+        await loop.run_in_executor(None, base.lexical_index.add_many, new_ids,
+                                   [splits[i].page_content for i in new_positions], [doc_id] * len(new_ids))
+        await loop.run_in_executor(None, base.lexical_index.remove, stale_ids)
+        self._knowledge_base_changed(base.name)
+
+        # Drop chunks from the previous version in one batched call
+        if stale_ids:
+            await base.vector_store.adelete(stale_ids)
+            base.changed()
+        if existing and existing['content_hash'] and not base.catalog.is_content_referenced(existing['content_hash']):
+            base.doc_store.delete(existing['content_hash'])
         return len(splits)
 
-    async def get_all_documents(self) -> List[Dict]:
+    async def _undo_ingest(self, base: KnowledgeBase, content_hash: str, stored_content: bool,
+                           written_ids: List[str], previous_metadatas: Dict[str, Dict]):
         """
-        Retrieves all unique documents (by title/source) from metadata.
-        Note: Chroma doesn't have a direct 'get all unique docs' efficiently, 
-        so we fetch all and deduplicate based on metadata for the UI list.
+        Rolls back a failed ingest: deletes the chunks it wrote, restores the
+        metadata of the kept chunks it refreshed and drops the full text it
+        stored, so the catalog still describes what is in Chroma and the
+        document store.
         """
-        # This is a bit of a hack since VectorStores aren't relational DBs.
-        # We fetch all data to list in the UI. 
-        # For a production app, we might store document/metadata list in a separate SQLite table.
-        # Here we just `get` everything.
-        results = self.vector_store.get()
-        metadatas = results['metadatas']
-        
-        unique_docs = {}
-        for m in metadatas:
-            if not m: continue
-            title = m.get('title', 'Untitled')
-            if title not in unique_docs:
-                unique_docs[title] = {
-                    'title': title,
-                    'source': m.get('source', ''),
-                    'summary': m.get('summary', m.get('full_content', '')[:100]), # Use summary if available
-                }
-        return list(unique_docs.values())
+        loop = asyncio.get_running_loop()
+        try:
+            if previous_metadatas:
+                await loop.run_in_executor(None, functools.partial(
+                    base.collection.update, ids=list(previous_metadatas), metadatas=list(previous_metadatas.values())
+                ))
+            if written_ids:
+                await loop.run_in_executor(None, base.lexical_index.remove, written_ids)
+                await base.vector_store.adelete(written_ids)
+            if stored_content and not base.catalog.is_content_referenced(content_hash):
+                base.doc_store.delete(content_hash)
+        except Exception as e:
+            logger.warning("Could not roll back a failed ingest of %s: %r", content_hash, e)
+
+    async def get_all_documents(self, offset: int = 0, limit: Optional[int] = None,
+                                query: Optional[str] = None, kb: Optional[str] = None) -> List[Dict]:
+        """
+        Returns one page of documents from the catalog of knowledge base `kb`
+        (one row per document), without touching the Chroma collection.
+        `query` filters by a substring of the title, source or summary.
+        """
+        await self.wait_ready()
+        base = await self._kb(kb)
+        return base.catalog.list_documents(offset=offset, limit=limit, query=query)
+
+    async def count_documents(self, query: Optional[str] = None, kb: Optional[str] = None) -> int:
+        await self.wait_ready()
+        return (await self._kb(kb)).catalog.count_documents(query)
+
+    async def get_document(self, title: str, kb: Optional[str] = None) -> Optional[Dict]:
+        """
+        Catalog entry for the document saved under `title`, if any.
+        """
+        await self.wait_ready()
+        return (await self._kb(kb)).catalog.get_document(make_doc_id(title))
+
+    async def filter_options(self, bases: Optional[Sequence[str]] = None, limit: int = 1000) -> Dict[str, List]:
+        """
+        Choices for a RetrievalFilter over the selected bases: documents as
+        (doc_id, title) in title order, and the sources and file types in
+        use, most common first; at most `limit` of each.
+        """
+        await self.wait_ready()
+        documents: Dict[str, str] = {}
+        sources: Dict[str, int] = {}
+        file_types: Dict[str, int] = {}
+        for name in self._selection(bases):
+            catalog = (await self._kb(name)).catalog
+            for doc in catalog.list_documents(limit=limit):
+                documents.setdefault(doc["doc_id"], doc["title"])
+            for counts, column in ((sources, "source"), (file_types, "mime_type")):
+                for value, count in catalog.list_values(column, limit):
+                    counts[value] = counts.get(value, 0) + count
+        return {
+            "documents": sorted(documents.items(), key=lambda d: d[1].lower())[:limit],
+            "sources": sorted(sources, key=lambda v: (-sources[v], v))[:limit],
+            "file_types": sorted(file_types, key=lambda v: (-file_types[v], v))[:limit],
+        }
+
+    def embedding_cache_stats(self) -> Dict:
+        return self.embeddings.stats() if self.is_ready() else {}
+
+    async def get_document_content(self, doc_id: str, kb: Optional[str] = None) -> Optional[str]:
+        """
+        Lazily loads the full text of a document from the document store.
+        """
+        await self.wait_ready()
+        base = await self._kb(kb)
+        doc = base.catalog.get_document(doc_id)
+        if not doc or not doc['content_hash']:
+            return None
+        return base.doc_store.get(doc['content_hash'])
+
+    def _get_parse_pool(self) -> ProcessPoolExecutor:
+        # Parsing is CPU-bound, so it runs in worker processes (threads would
+        # serialize on the GIL). Created lazily on first use.
+        if self._parse_pool is None:
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        return self._parse_pool
 
     async def extract_text_from_file(self, file_path: str) -> str:
         """
         Extracts text from a local file using unstructured.
-        Runs in a separate thread to avoid blocking the event loop.
+        Runs in a worker process to avoid blocking the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with tracer.span("ingest.extract", file_type=os.path.splitext(file_path)[1].lower()) as span:
+            text = await loop.run_in_executor(self._get_parse_pool(), extract_text, file_path)
+            span.set(chars=len(text))
+        return text
+
+    async def extract_file(self, file_path: str, progress_callback: Optional[ProgressCallback] = None,
+                           executor: Optional[Executor] = None) -> ExtractedFile:
+        """
+        Parses a file in a worker process (of `executor`, default the parse
+        pool), streaming its text page by page to a spool file instead of
+        returning it. `progress_callback(done, total)` reports pages (or bytes,
+        for plain text) while parsing. The caller owns the result: pass it to
+        ingest_extracted() or discard() it.
         """
         loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self._extract_text_sync, file_path)
+        fd, spool_path = tempfile.mkstemp(prefix="rag_spool_", suffix=".txt")
+        os.close(fd)
+        progress_path = spool_path + ".progress"
+        with tracer.span("ingest.extract", file_type=os.path.splitext(file_path)[1].lower(), streamed=True) as span:
+            future = loop.run_in_executor(executor or self._get_parse_pool(), extract_to_spool,
+                                          file_path, spool_path, progress_path)
+            try:
+                # The worker cannot call back into this process; it rewrites
+                # a small progress file that is polled here
+                while True:
+                    done, _ = await asyncio.wait({future}, timeout=0.2)
+                    if progress_callback:
+                        self._report_extract_progress(progress_path, progress_callback)
+                    if done:
+                        break
+                result = future.result()
+            except BaseException:
+                if os.path.exists(spool_path):
+                    os.remove(spool_path)
+                raise
+            finally:
+                if os.path.exists(progress_path):
+                    os.remove(progress_path)
+            span.set(chars=result["chars"])
+        return ExtractedFile(file_path, spool_path, result["content_hash"], result["chars"], result["preview"])
+
+    @staticmethod
+    def _report_extract_progress(progress_path: str, progress_callback: ProgressCallback):
+        try:
+            with open(progress_path) as f:
+                done, total = (int(n) for n in f.read().split())
+        except (OSError, ValueError):
+            return  # not written yet, or caught mid-write
+        progress_callback(done, total)
+
+    async def ingest_extracted(self, title: str, extracted: ExtractedFile, source: str = "",
+                               progress_callback: Optional[ProgressCallback] = None,
+                               kb: Optional[str] = None) -> int:
+        """
+        add_document() for a spooled file: the text is read back in blocks,
+        split incrementally and embedded `stream_window_chunks` at a time, so
+        memory does not grow with the file. `progress_callback(done, total)`
+        reports characters processed. Returns the number of chunks.
+        """
+        await self.wait_ready()
+        base = await self._kb(kb)
+        with tracer.span("ingest.add_document", chars=extracted.chars, streamed=True, kb=base.name) as span:
+            return await self._ingest_extracted(base, title, extracted, source, progress_callback, span)
+
+    async def ingest_file(self, file_path: str, title: Optional[str] = None, source: Optional[str] = None,
+                          progress_callback: Optional[ProgressCallback] = None,
+                          executor: Optional[Executor] = None, kb: Optional[str] = None) -> int:
+        """
+        extract_file() + ingest_extracted(); `progress_callback` first reports
+        parsing, then ingestion. The title defaults to the file name and the
+        source to its path.
+        """
+        extracted = await self.extract_file(file_path, progress_callback, executor)
+        try:
+            if not extracted.preview.strip():
+                raise ValueError("No text extracted")
+            return await self.ingest_extracted(title or os.path.basename(file_path), extracted,
+                                               file_path if source is None else source, progress_callback, kb)
+        finally:
+            extracted.discard()
+
+    async def _ingest_extracted(self, base, title, extracted, source, progress_callback, span):
+        summary = extracted.preview[:200] + "..." if extracted.chars > 200 else extracted.preview
+        doc_id = make_doc_id(title)
+        content_hash = extracted.content_hash
+
+        # Unchanged content is a no-op
+        existing = base.catalog.get_document(doc_id)
+        if existing and existing['content_hash'] == content_hash:
+            span.set(unchanged=True, chunks=existing['chunk_count'], new_chunks=0)
+            return existing['chunk_count']
+
+        loop = asyncio.get_running_loop()
+        old = await loop.run_in_executor(None, functools.partial(
+            base.collection.get, where={"doc_id": doc_id}, include=["metadatas"]
+        ))
+        old_metadatas = dict(zip(old['ids'], old['metadatas']))
+        old_ids = set(old_metadatas)
+        seen_ids = set()
+        written_ids: List[str] = []
+        updated_ids: List[str] = []
+        ingested_at = time.time()
+        mime_type = mime_type_for(extracted.file_path)
+        metadata = {"doc_id": doc_id, "title": title, "source": source, "content_hash": content_hash,
+                    "mime_type": mime_type, "ingested_at": ingested_at}
+        window: List = []
+        chunk_count = 0
+        read_chars = 0
+
+        async def flush():
+            # Same deterministic ids as add_document: unchanged chunks are
+            # not embedded again, only their metadata is refreshed
+            new = [(i, text, meta) for i, text, meta in window if i not in old_ids]
+            kept = [(i, meta) for i, _, meta in window if i in old_ids]
+            if new:
+                ids = [i for i, _, _ in new]
+                await base.ingest_pipeline.run(ids, [t for _, t, _ in new], [m for _, _, m in new])
+                written_ids.extend(ids)
+                await loop.run_in_executor(
+                    None, base.lexical_index.add_many, ids, [t for _, t, _ in new], [doc_id] * len(ids)
+                )
+            if kept:
+                updated_ids.extend(i for i, _ in kept)
+                await loop.run_in_executor(None, functools.partial(
+                    base.collection.update, ids=[i for i, _ in kept], metadatas=[m for _, m in kept]
+                ))
+            window.clear()
+            if progress_callback:
+                progress_callback(read_chars, extracted.chars)
+
+        def collect(chunks):
+            nonlocal chunk_count
+            for start, end, text in chunks:
+                chunk_id = make_chunk_id(doc_id, chunk_count, text)
+                window.append((chunk_id, text, {**metadata, "start_index": start, "end_index": end}))
+                seen_ids.add(chunk_id)
+                chunk_count += 1
+
+        stored_content = not base.doc_store.contains(content_hash)
+        try:
+            with tracer.span("ingest.store"):
+                await loop.run_in_executor(
+                    None, base.doc_store.put_file, extracted.spool_path, content_hash
+                )
+            # The splitter must know up front which separator the whole text is cut at
+            separator = await loop.run_in_executor(
+                None, StreamingSplitter.separator_for, extracted.iter_blocks()
+            )
+            splitter = StreamingSplitter(separator, chunk_size=500, chunk_overlap=50)
+            with tracer.span("ingest.embed_write") as write_span:
+                for block in extracted.iter_blocks():
+                    read_chars += len(block)
+                    collect(splitter.feed(block))
+                    if len(window) >= self.stream_window_chunks:
+                        await flush()
+                collect(splitter.finish())
+                await flush()
+                write_span.set(chunks=len(written_ids),
+                               chunks_per_s=round(len(written_ids) / max(time.perf_counter() - write_span.start, 1e-9), 1))
+            base.catalog.upsert_document(doc_id, title, source, summary, chunk_count, content_hash,
+                                         mime_type=mime_type, ingested_at=ingested_at)
+        except BaseException:
+            # Same guarantee as add_document: no chunks without a catalog row
+            await self._undo_ingest(base, content_hash, stored_content, written_ids,
+                                    {i: old_metadatas[i] for i in updated_ids})
+            raise
+
+        stale_ids = list(old_ids - seen_ids)
+        span.set(unchanged=False, chunks=chunk_count, new_chunks=len(written_ids), stale_chunks=len(stale_ids))
+        await loop.run_in_executor(None, base.lexical_index.remove, stale_ids)
+        self._knowledge_base_changed(base.name)
+        if stale_ids:
+            await base.vector_store.adelete(stale_ids)
+            base.changed()
+        if existing and existing['content_hash'] and not base.catalog.is_content_referenced(existing['content_hash']):
+            base.doc_store.delete(existing['content_hash'])
+        return chunk_count
+
+    async def ingest_directory(self, root: str, workers: Optional[int] = None,
+                               progress_callback: Optional[FileProgressCallback] = None,
+                               kb: Optional[str] = None) -> List[Dict]:
+        """
+        Ingests every PDF/DOCX/TXT/MD file under `root` into knowledge base
+        `kb`, largest first. Returns a per-file report (see
+        services.bulk_ingest.ingest_directory).
+        """
+        if workers is None or workers == self.parse_workers:
+            return await ingest_directory(self, root, self._get_parse_pool(),
+                                          self.parse_workers, progress_callback, kb)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return await ingest_directory(self, root, pool, workers, progress_callback, kb)
+
+    def query_cache_stats(self) -> Dict:
+        """
+        Totals over the caches of all selections of knowledge bases.
+        """
+        if not self.is_ready():
+            return {}
+        totals = {"exact_hits": 0, "exact_misses": 0, "semantic_hits": 0, "semantic_misses": 0, "misses": 0,
+                  "saved_seconds": 0.0, "entries": 0}
+        for cache in list(self._query_caches.values()):
+            stats = cache.stats()
+            for key in totals:
+                totals[key] += stats[key]
+        lookups = totals["exact_hits"] + totals["semantic_hits"] + totals["misses"]
+        totals["hit_rate"] = (totals["exact_hits"] + totals["semantic_hits"]) / lookups if lookups else 0.0
+        totals["saved_seconds"] = round(totals["saved_seconds"], 3)
+        totals["selections"] = len({selection for selection, _ in self._query_caches})
+        totals["filtered_caches"] = sum(1 for _, filters in self._query_caches if filters)
+        return totals
+
+    def start_prefetch(self, draft: str, bases: Optional[Sequence[str]] = None,
+                       filters: Optional[RetrievalFilter] = None):
+        """
+        Speculatively embeds and retrieves `draft` (the text being typed) in
+        the background, superseding the previous draft. stream_query reuses
+        the result if the submitted question matches. No-op until ready.
+        """
+        if not self.is_ready():
+            return None
+        scope = (self._selection(bases), filters or None)
+        return self.prefetcher.start(draft, self.query_cache_for(*scope).kb_version, scope)
+
+    def cancel_prefetch(self):
+        if self.is_ready():
+            self.prefetcher.cancel()
+
+    def prefetch_stats(self) -> Dict:
+        return self.prefetcher.stats() if self.is_ready() else {}
+
+    def submit_query(self, user_input: str, key: Optional[str] = None, supersede: bool = False,
+                     bases: Optional[Sequence[str]] = None, filters: Optional[RetrievalFilter] = None
+                     ) -> ChatRequest:
+        """
+        Schedules stream_query(user_input, bases=bases, filters=filters) as a
+        cancellable request and returns its handle; read the answer with
+        `request.stream()`, stop it with `request.cancel()`. With
+        `supersede`, unfinished requests with the same `key` are abandoned.
+        """
+        return self.scheduler.submit(lambda: self.stream_query(user_input, bases=bases, filters=filters),
+                                     key, supersede)
+
+    def request_stats(self) -> Dict:
+        return self.scheduler.stats()
+
+    def rate_limit_stats(self) -> Optional[Dict]:
+        return self.rate_limiter.stats() if self.rate_limiter is not None else None
+
+    def _chat_stream(self, messages: List["BaseMessage"]):
+        # Answers are interactive: they are admitted ahead of queued
+        # ingestion batches. The output tokens are charged afterwards.
+        if self._chat_limiter is None:
+            return self.chat_model.astream(messages)
+        from .rate_limiter import INTERACTIVE, estimate_prompt_tokens
+        return self._chat_limiter.stream(lambda: self.chat_model.astream(messages), INTERACTIVE,
+                                         tokens=estimate_prompt_tokens(messages))
 
-    def _extract_text_sync(self, file_path: str) -> str:
-        from unstructured.partition.auto import partition
+    async def _chat_invoke(self, messages: List["BaseMessage"]):
+        if self._chat_limiter is None:
+            return await self.chat_model.ainvoke(messages)
+        from .rate_limiter import INTERACTIVE, estimate_prompt_tokens
+        return await self._chat_limiter.call(lambda: self.chat_model.ainvoke(messages), INTERACTIVE,
+                                             tokens=estimate_prompt_tokens(messages))
+
+    async def _prefetch_retrieve(self, draft: str, scope: Tuple[Tuple[str, ...], Optional[RetrievalFilter]]):
+        selection, filters = scope
+        embedding = await self._embed_query(draft)
+        return embedding, await self._retrieve(draft, embedding, k=self.context_candidates, bases=selection,
+                                               filters=filters)
+
+    def context_stats(self) -> Dict:
+        """
+        Prompt-context token totals since startup, compared with joining the
+        selected chunks as-is (`naive`) and with the old top-3 join.
+        """
+        totals = dict(self._context_totals)
+        totals["saved_tokens"] = totals["naive_tokens"] - totals["context_tokens"]
+        queries = totals["queries"]
+        totals["saved_per_query"] = round(totals["saved_tokens"] / queries, 1) if queries else 0.0
+        return totals
+
+    def _build_context(self, user_input: str, embedding: Optional[List[float]], docs: List["Document"],
+                       parent=None) -> "ContextResult":
+        """
+        Packs the retrieved candidates into the prompt context. Chunk vectors
+        (for the diversity step) are a local Chroma read; without a query
+        embedding the builder falls back to retrieval rank and word overlap.
+        """
+        with tracer.span("query.context", parent=parent, candidates=len(docs)) as span:
+            # Candidates carry the base they came from (see _retrieve)
+            by_base: Dict[str, List[str]] = {}
+            for doc in docs:
+                by_base.setdefault(doc.metadata.get("kb", DEFAULT_KB), []).append(doc.id)
+            bases = [self._bases[name] for name in by_base if name in self._bases and self._bases[name].is_open]
+            vectors = None
+            if embedding is not None and docs:
+                try:
+                    found_vectors = {}
+                    for base in bases:
+                        found = base.collection.get(ids=by_base[base.name], include=["embeddings"])
+                        found_vectors.update(((base.name, i), v) for i, v in zip(found["ids"], found["embeddings"]))
+                    vectors = [found_vectors.get((d.metadata.get("kb", DEFAULT_KB), d.id)) for d in docs]
+                except Exception as e:
+                    logger.warning("Chunk vectors unavailable for context selection: %r", e)
+
+            def load_span(content_hash: str, start: int, end: int) -> Optional[str]:
+                # Texts are content-addressed, so any base holding the hash will do
+                for base in bases:
+                    text = base.doc_store.get_span(content_hash, start, end)
+                    if text is not None:
+                        return text
+                return None
+
+            result = self.context_builder.build(docs, embedding, vectors, load_span)
+            stats = result.stats()
+            span.set(**stats)
+        for key in ("context_tokens", "naive_tokens", "baseline_tokens"):
+            self._context_totals[key] += stats[key]
+        self._context_totals["queries"] += 1
+        logger.debug("Context for %r: %s", user_input[:40], stats)
+        return result
+
+    async def _lookup_cache(self, cache: "QueryCache", user_input: str, embedding: Optional[List[float]] = None
+                            ) -> Tuple[Optional["CachedAnswer"], Optional[List[float]]]:
+        """
+        Exact tier first (no embedding needed), then the semantic tier.
+        Returns the cached entry (or None) and the query embedding, if computed.
+        A known `embedding` (e.g. from a prefetch) skips the embedding call.
+        With caching off only the embedding is computed.
+        """
+        if self.query_cache_size <= 0:
+            return None, embedding if embedding is not None else await self._embed_query(user_input)
+        cached = cache.lookup_exact(user_input)
+        if cached is not None:
+            return cached, cached.embedding
+        if embedding is None:
+            embedding = await self._embed_query(user_input)
+        if embedding is None:
+            return None, None
+        return cache.lookup_semantic(embedding), embedding
+
+    async def _embed_query(self, user_input: str) -> Optional[List[float]]:
+        """
+        Query embedding bounded by `vector_timeout`; None when the embedding
+        service is slow or unavailable (retrieval then goes lexical-only).
+        """
         try:
-            elements = partition(filename=file_path)
-            return "\n\n".join([str(e) for e in elements]) 
+            with tracer.span("query.embed"):
+                return await asyncio.wait_for(self.embeddings.aembed_query(user_input), self.vector_timeout)
         except Exception as e:
-            raise RuntimeError(f"Unstructured parsing failed: {str(e)}")
+            logger.warning("Query embedding unavailable, using lexical retrieval only: %r", e)
+            return None
+
+    async def _ensure_lexical_index(self, base: KnowledgeBase):
+        # Built from the collection in the background on first use
+        if base.lexical_build is None:
+            loop = asyncio.get_running_loop()
+            base.lexical_build = loop.run_in_executor(
+                None, base.lexical_index.build_from_collection, base.collection
+            )
+        await base.lexical_build
+
+    async def _search_kb(self, base: KnowledgeBase, user_input: str, embedding: Optional[List[float]],
+                         fetch_k: int, filters: Optional[RetrievalFilter] = None
+                         ) -> Tuple[List[Tuple[str, float]], List[Tuple["Document", float]]]:
+        """
+        One base's share of a query: BM25 hits as (chunk id, score) and
+        vector hits as (document, distance), both restricted to `filters`.
+        """
+        started = time.perf_counter()
+        lexical_hits = []
+        vector_hits = []
+        with tracer.span("retrieve.kb", kb=base.name) as kb_span:
+            doc_ids = where = None
+            exact = False
+            if filters:
+                # The catalog sizes the filtered set; an empty one needs no search
+                doc_ids, chunks = base.catalog.match_filter(filters)
+                kb_span.set(filtered_docs=len(doc_ids), filtered_chunks=chunks)
+                if not doc_ids:
+                    base.record_search(time.perf_counter() - started)
+                    return [], []
+                where = filters.where()
+                exact = chunks <= self.exact_search_limit
+
+            try:
+                with tracer.span("retrieve.lexical") as span:
+                    await self._ensure_lexical_index(base)
+                    lexical_hits = base.lexical_index.search(user_input, fetch_k, doc_ids=doc_ids)
+                    span.set(hits=len(lexical_hits))
+            except Exception as e:
+                logger.warning("Lexical search in %s failed: %r", base.name, e)
+
+            if embedding is not None:
+                try:
+                    with tracer.span("retrieve.vector", exact=exact) as span:
+                        # Run in a worker thread, so the bases are searched in parallel
+                        if exact:
+                            search = functools.partial(base.exact_search, embedding, fetch_k, where)
+                        else:
+                            search = functools.partial(
+                                base.vector_store.similarity_search_by_vector_with_relevance_scores,
+                                embedding, fetch_k, filter=where
+                            )
+                        vector_hits = await asyncio.wait_for(
+                            asyncio.get_running_loop().run_in_executor(None, search), self.vector_timeout
+                        )
+                        span.set(hits=len(vector_hits))
+                except Exception as e:
+                    logger.warning("Vector search in %s unavailable, using lexical results only: %r", base.name, e)
+            kb_span.set(lexical=len(lexical_hits), vector=len(vector_hits))
+        base.record_search(time.perf_counter() - started)
+        return lexical_hits, vector_hits
+
+    async def _retrieve(self, user_input: str, embedding: Optional[List[float]], k: int = 3,
+                        bases: Optional[Sequence[str]] = None,
+                        filters: Optional[RetrievalFilter] = None) -> List["Document"]:
+        """
+        Hybrid retrieval over the selected knowledge bases: each base is
+        searched concurrently, the BM25 hits of all bases are ranked by score
+        and the vector hits by distance (one embedding model, so distances
+        compare across collections), and the two rankings are merged with
+        reciprocal rank fusion. Without an embedding, or if the vector search
+        is slower than `vector_timeout`, only the lexical candidates are used.
+        Each document's metadata names its base under "kb". `filters`
+        restricts both searches in every base (pushed down to Chroma).
+        """
+        from langchain_core.documents import Document
+        from .lexical_index import reciprocal_rank_fusion
+
+        fetch_k = k * 4
+        selection = self._selection(bases)
+        kbs = await asyncio.gather(*(self._kb(name) for name in selection))
+        results = await asyncio.gather(*(self._search_kb(base, user_input, embedding, fetch_k, filters)
+                                         for base in kbs))
+
+        # Chunk ids are only unique within a base, so rank (base, id) keys
+        lexical_ranked = sorted(
+            ((score, f"{base.name}/{chunk_id}") for base, (hits, _) in zip(kbs, results) for chunk_id, score in hits),
+            key=lambda hit: -hit[0]
+        )
+        by_key: Dict[str, "Document"] = {}
+        vector_ranked = []
+        for base, (_, hits) in zip(kbs, results):
+            for doc, distance in hits:
+                key = f"{base.name}/{doc.id}"
+                doc.metadata["kb"] = base.name
+                by_key[key] = doc
+                vector_ranked.append((distance, key))
+        vector_ranked.sort(key=lambda hit: hit[0])
+        ranked = reciprocal_rank_fusion([
+            [key for _, key in vector_ranked[:fetch_k]],
+            [key for _, key in lexical_ranked[:fetch_k]],
+        ])[:k]
+
+        # Lexical-only hits still need their text; this is a local Chroma read
+        missing: Dict[str, List[str]] = {}
+        for key in ranked:
+            if key not in by_key:
+                name, chunk_id = key.split("/", 1)
+                missing.setdefault(name, []).append(chunk_id)
+        if missing:
+            with tracer.span("retrieve.fetch", chunks=sum(len(ids) for ids in missing.values())):
+                for base in kbs:
+                    if base.name not in missing:
+                        continue
+                    found = base.collection.get(ids=missing[base.name], include=["documents", "metadatas"])
+                    for chunk_id, text, meta in zip(found["ids"], found["documents"], found["metadatas"]):
+                        by_key[f"{base.name}/{chunk_id}"] = Document(
+                            id=chunk_id, page_content=text or "", metadata={**(meta or {}), "kb": base.name}
+                        )
+        return [by_key[key] for key in ranked if key in by_key]
 
-    async def query(self, user_input: str) -> str:
+    async def query(self, user_input: str, bases: Optional[Sequence[str]] = None,
+                    filters: Optional[RetrievalFilter] = None) -> str:
         """
         Performs RAG: Search -> Augment -> Generate
+        `bases` selects the knowledge bases searched (default `default_bases`)
+        and `filters` the documents within them.
         """
+        await self.wait_ready()
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        started = time.perf_counter()
+        selection = self._selection(bases)
+        cache = self.query_cache_for(selection, filters)
+        cached, embedding = await self._lookup_cache(cache, user_input)
+        if cached is not None:
+            return cached.answer
+        kb_version = cache.kb_version
+
         # 1. Retrieve
-        docs = await self.vector_store.asimilarity_search(user_input, k=3)
-        context_text = "\n\n".join([d.page_content for d in docs])
+        candidates = await self._retrieve(user_input, embedding, k=self.context_candidates, bases=selection,
+                                          filters=filters)
+        context = self._build_context(user_input, embedding, candidates)
+        docs, context_text = context.docs, context.text
         
         # 2. Prompt
         system_prompt = f"""You are a helpful assistant. Use the following context to answer the user's question.
@@ -130,27 +1071,113 @@ Context:
         ]
         
         # 3. Generate (Streaming not implemented in this simple method, returns full str)
-        response = await self.chat_model.ainvoke(messages)
+        response = await self._chat_invoke(messages)
+        if self.query_cache_size > 0:
+            cache.put(user_input, embedding, docs, [response.content],
+                      time.perf_counter() - started, kb_version)
         return response.content
 
-    async def stream_query(self, user_input: str):
+    async def stream_query(self, user_input: str, sources: Optional[List["Document"]] = None,
+                           bases: Optional[Sequence[str]] = None, filters: Optional[RetrievalFilter] = None):
         """
-        Generator for streaming response
+        Generator for streaming response.
+        If a `sources` list is given, the chunks the answer is based on are
+        appended to it before the first piece is yielded. `bases` selects the
+        knowledge bases searched (default `default_bases`) and `filters` the
+        documents within them.
         """
-        docs = await self.vector_store.asimilarity_search(user_input, k=3)
-        context_text = "\n\n".join([d.page_content for d in docs])
-        
-        system_prompt = f"""You are a helpful assistant. Use the following context to answer the user's question.
+        await self.wait_ready()
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        selection = self._selection(bases)
+        filters = filters or None
+        cache = self.query_cache_for(selection, filters)
+        # The root span crosses `yield`, so it is not made current; the stage
+        # spans name it as their parent instead.
+        root = tracer.begin("query.stream", query_chars=len(user_input), bases=len(selection),
+                            filtered=filters is not None)
+        try:
+            started = time.perf_counter()
+            # Retrieval may already have been done for the draft while typing
+            prefetched = await self.prefetcher.take(user_input, cache.kb_version, (selection, filters))
+            with tracer.span("query.cache_lookup", parent=root) as span:
+                cached, embedding = await self._lookup_cache(
+                    cache, user_input, prefetched.embedding if prefetched else None
+                )
+                span.set(hit=cached is not None)
+            if cached is not None:
+                root.set(cached=True, tokens=len(cached.chunks))
+                if sources is not None:
+                    sources.extend(cached.docs)
+                # Replay the cached answer through the same generator
+                for piece in cached.chunks:
+                    yield piece
+                return
+            kb_version = cache.kb_version
+
+            with tracer.span("query.retrieve", parent=root, k=self.context_candidates) as span:
+                if prefetched is not None:
+                    candidates = prefetched.docs
+                else:
+                    candidates = await self._retrieve(user_input, embedding, k=self.context_candidates,
+                                                      bases=selection, filters=filters)
+                span.set(chunks=len(candidates), vector=embedding is not None, prefetched=prefetched is not None)
+
+            context = self._build_context(user_input, embedding, candidates, parent=root)
+            docs = context.docs
+            if sources is not None:
+                sources.extend(docs)
+
+            with tracer.span("query.prompt", parent=root) as span:
+                context_text = context.text
+
+                system_prompt = f"""You are a helpful assistant. Use the following context to answer the user's question.
 If the answer is not in the context, say you don't know. Do not invent facts.
 
 Context:
 {context_text}
 """
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_input)
-        ]
-        
-        # Use astream
-        async for chunk in self.chat_model.astream(messages):
-            yield chunk.content
+                messages = [
+                    SystemMessage(content=system_prompt),
+                    HumanMessage(content=user_input)
+                ]
+                span.set(context_chars=len(context_text), prompt_chars=len(system_prompt) + len(user_input))
+
+            # Use astream
+            pieces = []
+            output_tokens = None  # reported by the model, if it sends usage metadata
+            generate_start = time.perf_counter()
+            first_token = None
+            async for chunk in self._chat_stream(messages):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                    tracer.record("query.first_token", first_token - generate_start, parent=root)
+                usage = getattr(chunk, "usage_metadata", None)
+                if usage:
+                    output_tokens = max(output_tokens or 0, usage.get("output_tokens") or 0)
+                pieces.append(chunk.content)
+                yield chunk.content
+
+            finished = time.perf_counter()
+            tokens = output_tokens or len(pieces)
+            streaming = finished - (first_token or finished)
+            tracer.record("query.generate", finished - generate_start, parent=root,
+                          tokens=tokens, chars=sum(len(p) for p in pieces),
+                          tokens_per_s=round(tokens / streaming, 1) if streaming > 0 else None)
+            root.set(cached=False, tokens=tokens)
+            if self._chat_limiter is not None:
+                from .context_builder import estimate_tokens
+                self._chat_limiter.charge(output_tokens or estimate_tokens("".join(pieces)))
+
+            # Only complete answers are cached
+            if self.query_cache_size > 0:
+                cache.put(user_input, embedding, docs, pieces,
+                          finished - started, kb_version)
+        except (asyncio.CancelledError, GeneratorExit):
+            root.set(cancelled=True)
+            raise
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            tracer.end(root)
@@ -0,0 +1,343 @@
+"""
+Client-side throttling and retries for the remote model APIs.
+
+One RateLimiter is shared by the embedding and chat calls of a RagService:
+- token buckets cap requests and (estimated) tokens per minute;
+- the number of calls in flight adapts AIMD-style: +1/limit per success,
+  halved (at most once per `cooldown`) when the provider throttles;
+- waiting calls are admitted by priority, so interactive queries overtake
+  queued ingestion batches;
+- retryable failures (429, 5xx, timeouts, connection errors) are retried
+  with full-jitter exponential backoff, honouring Retry-After.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import re
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar, TYPE_CHECKING
+
+from langchain_core.embeddings import Embeddings
+
+from .context_builder import estimate_tokens
+from .telemetry import tracer
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Priorities (lower is served first)
+INTERACTIVE = 0
+BACKGROUND = 1
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_THROTTLE_MARKERS = ("throttl", "rate limit", "ratelimit", "too many requests")
+# A 429 status in a message ("HTTP 429", "status_code=429", "Error code: 429"),
+# not any number that happens to contain 429
+_STATUS_429 = re.compile(r"\b(?:http(?:/[\d.]+)?|status(?:[ _]?code)?|code)\W{0,3}429\b", re.IGNORECASE)
+
+
+def status_code_of(error: BaseException) -> Optional[int]:
+    for obj in (error, getattr(error, "response", None)):
+        for attr in ("status_code", "status", "http_status"):
+            value = getattr(obj, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    429s, whatever the client library wraps them in (DashScope reports
+    "Throttling" codes in the message).
+    """
+    if status_code_of(error) == 429:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in _THROTTLE_MARKERS) or _STATUS_429.search(message) is not None
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    if is_throttling_error(error):
+        return True
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status = status_code_of(error)
+    return status is not None and status >= 500
+
+
+def retry_after_of(error: BaseException) -> Optional[float]:
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("Retry-After") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    `rate` units per second, bursting up to `capacity`. consume() may take
+    the level below zero (e.g. output tokens known only afterwards); later
+    callers then wait for the debt to be refilled.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay_for(self, amount: float) -> float:
+        """
+        Seconds until `amount` (at most `capacity`) can be consumed.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    async def take(self, amount: float = 1.0):
+        while True:
+            delay = self.delay_for(amount)
+            if delay <= 0:
+                self.consume(amount)
+                return
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float = 600, tokens_per_minute: Optional[float] = None,
+                 initial_concurrency: int = 4, min_concurrency: int = 1, max_concurrency: int = 32,
+                 burst_seconds: float = 1.0, max_retries: int = 5, base_delay: float = 0.5,
+                 max_delay: float = 30.0, decrease_factor: float = 0.5, cooldown: float = 1.0):
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 60 * burst_seconds))
+        self.tokens = (TokenBucket(tokens_per_minute / 60, tokens_per_minute / 60 * burst_seconds)
+                       if tokens_per_minute else None)
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+
+        self._waiters: List = []  # heap of [priority, seq, future, tokens]
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0  # Retry-After from the provider
+        self._last_decrease = 0.0
+
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+        self.retries = 0
+        self._waits = {INTERACTIVE: deque(maxlen=500), BACKGROUND: deque(maxlen=500)}
+
+    # Admission
+
+    async def acquire(self, priority: int = BACKGROUND, tokens: float = 0):
+        """
+        Waits for a concurrency slot and request/token budget. Every acquire()
+        must be paired with release().
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), future, tokens])
+        started = time.perf_counter()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # admitted just as the caller was cancelled
+            raise
+        waited = time.perf_counter() - started
+        self._waits.setdefault(priority, deque(maxlen=500)).append(waited)
+        if waited > 0.001:
+            tracer.record("ratelimit.wait", waited, priority=_PRIORITY_NAMES.get(priority, priority))
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        while self._waiters:
+            _, _, future, tokens = self._waiters[0]
+            if future.done():  # the waiter was cancelled
+                heapq.heappop(self._waiters)
+                continue
+            if self._in_flight >= max(1, int(self.limit)):
+                return  # release() dispatches again
+            delay = max(self._paused_until - time.monotonic(), self.requests.delay_for(1),
+                        self.tokens.delay_for(tokens) if self.tokens and tokens else 0.0)
+            if delay > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.consume(1)
+            if self.tokens and tokens:
+                self.tokens.consume(tokens)
+            self._in_flight += 1
+            future.set_result(None)
+
+    def charge(self, tokens: float):
+        """
+        Bills tokens known only after a call (e.g. the generated answer).
+        """
+        if self.tokens and tokens:
+            self.tokens.consume(tokens)
+
+    # Feedback
+
+    def _on_success(self):
+        self.successes += 1
+        self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def _on_error(self, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        Returns the delay before the next attempt, or None to give up.
+        """
+        if is_throttling_error(error):
+            self.throttled += 1
+            now = time.monotonic()
+            # One decrease per burst of 429s, not one per failed call
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                self._last_decrease = now
+        if attempt >= self.max_retries or not is_retryable_error(error):
+            self.failures += 1
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = retry_after_of(error)
+        if retry_after:
+            delay = max(delay, retry_after)
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self.retries += 1
+        logger.warning("Model call failed (%s), retry %d/%d in %.2fs", error, attempt + 1, self.max_retries, delay)
+        return delay
+
+    # Calls
+
+    async def call(self, fn: Callable[[], Awaitable[T]], priority: int = BACKGROUND, tokens: float = 0) -> T:
+        """
+        Runs `fn()` within the limits, retrying retryable failures.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(priority, tokens)
+            try:
+                result = await fn()
+            except Exception as e:
+                self.release()
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self._on_success()
+            self.release()
+            return result
+
+    async def stream(self, factory: Callable[[], AsyncIterator[T]], priority: int = INTERACTIVE,
+                     tokens: float = 0) -> AsyncIterator[T]:
+        """
+        Streams `factory()` within the limits, holding a slot until it ends.
+        A failure before the first item is retried; after it, it is raised
+        (the consumer already has part of the output).
+        """
+        attempt = 0
+        while True:
+            await self.acquire(priority, tokens)
+            upstream = factory()
+            started = False
+            error = None
+            try:
+                async for item in upstream:
+                    started = True
+                    yield item
+            except Exception as e:
+                error = e
+            finally:
+                self.release()
+                await upstream.aclose()
+            if error is None:
+                self._on_success()
+                return
+            delay = self._on_error(error, attempt)
+            if delay is None or started:
+                raise error
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        waits = {}
+        for priority, values in self._waits.items():
+            ordered = sorted(values)
+            name = _PRIORITY_NAMES.get(priority, str(priority))
+            waits[f"{name}_wait_ms_p50"] = round(ordered[len(ordered) // 2] * 1000, 1) if ordered else None
+            waits[f"{name}_wait_ms_p95"] = round(ordered[int(len(ordered) * 0.95)] * 1000, 1) if ordered else None
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self._in_flight,
+            "waiting": sum(1 for w in self._waiters if not w[2].done()),
+            "successes": self.successes,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            **waits,
+        }
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Routes async embedding calls through a RateLimiter: query embeddings as
+    interactive, document batches (ingestion) as background. The sync
+    methods pass straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, limiter: RateLimiter):
+        self.underlying = underlying
+        self.limiter = limiter
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.limiter.call(lambda: self.underlying.aembed_documents(texts), BACKGROUND,
+                                       tokens=sum(estimate_tokens(t) for t in texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.limiter.call(lambda: self.underlying.aembed_query(text), INTERACTIVE,
+                                       tokens=estimate_tokens(text))
+
+
+def estimate_prompt_tokens(messages: List["BaseMessage"]) -> int:
+    return sum(estimate_tokens(m.content if isinstance(m.content, str) else str(m.content)) for m in messages)
@@ -0,0 +1,136 @@
+"""
+Re-embeds the knowledge bases with another embedding backend.
+
+    python -m services.reembed --provider onnx --model-path models/bge-small-zh --threads 4
+
+Chunks are copied (text, metadata, ids) into a staging collection embedded
+with the new backend, which then replaces the original. An interrupted run
+resumes where it stopped; the original collection is only dropped once the
+staging copy is complete. The catalog and the document store are untouched.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Optional
+
+from .embedding_cache import CachedEmbeddings
+from .embedding_providers import EmbeddingBackend, create_backend, available_providers
+from .ingest_pipeline import IngestPipeline, ProgressCallback
+from .knowledge_base import COLLECTION_NAME, KnowledgeBase, list_names
+from .rag_service import DESKTOP_APP_NAME, default_base_path
+
+logger = logging.getLogger(__name__)
+
+
+def _collection_or_none(client, name):
+    try:
+        return client.get_collection(name)
+    except Exception:
+        return None
+
+
+async def reembed_collection(client, backend: EmbeddingBackend, name: str = COLLECTION_NAME,
+                             cache_path: Optional[str] = None, page_size: int = 500,
+                             batch_size: int = 25, max_in_flight: int = 2,
+                             progress_callback: Optional[ProgressCallback] = None) -> int:
+    """
+    Re-embeds collection `name` of a Chroma client with `backend` and returns
+    the number of chunks in the new collection.
+    """
+    staging_name = f"{name}__reembed"
+    source = _collection_or_none(client, name)
+    model_metadata = {"embedding_model": backend.model_id, "embedding_dimension": backend.dimension}
+
+    if source is not None and (source.metadata or {}).get("embedding_model") == backend.model_id:
+        logger.info("%s is already embedded with %s", name, backend.model_id)
+        return source.count()
+
+    staging = _collection_or_none(client, staging_name)
+    if staging is not None and (staging.metadata or {}).get("embedding_model") != backend.model_id:
+        # Left over from an interrupted run towards another backend
+        client.delete_collection(staging_name)
+        staging = None
+    if staging is None:
+        if source is None:
+            raise ValueError(f"Collection {name!r} does not exist")
+        staging = client.create_collection(staging_name, metadata={**model_metadata, "reembed_complete": False})
+
+    if source is not None:
+        embeddings = CachedEmbeddings(backend.embeddings, model_name=backend.model_id, db_path=cache_path)
+        pipeline = IngestPipeline(embeddings, staging, batch_size=batch_size, max_in_flight=max_in_flight)
+        total = source.count()
+        done = 0
+        offset = 0
+        while True:
+            page = source.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            ids = page["ids"]
+            if not ids:
+                break
+            offset += len(ids)
+            # Resume: skip chunks copied by an earlier, interrupted run
+            present = set(staging.get(ids=ids, include=[])["ids"])
+            todo = [i for i, chunk_id in enumerate(ids) if chunk_id not in present]
+            if todo:
+                await pipeline.run(
+                    [ids[i] for i in todo],
+                    [page["documents"][i] or "" for i in todo],
+                    [page["metadatas"][i] or {} for i in todo],
+                )
+            done += len(ids)
+            if progress_callback:
+                progress_callback(done, total)
+
+        staging.modify(metadata={**model_metadata, "reembed_complete": True})
+        client.delete_collection(name)
+    elif not (staging.metadata or {}).get("reembed_complete"):
+        raise RuntimeError(f"Collection {name!r} is missing and {staging_name!r} is incomplete")
+
+    # Swap the staging copy in under the original name
+    staging.modify(name=name, metadata=model_metadata)
+    return client.get_collection(name).count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed the knowledge bases with another embedding backend")
+    parser.add_argument("--provider", required=True, choices=available_providers())
+    parser.add_argument("--model-path", help="local model directory / name (onnx, sentence-transformers)")
+    parser.add_argument("--threads", type=int, help="CPU threads for local backends")
+    parser.add_argument("--data-dir", help="knowledge base directory (default: the desktop app's)")
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--in-flight", type=int, default=2)
+    parser.add_argument("--kb", action="append", help="only this knowledge base (repeatable; default: all)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    import chromadb
+
+    base_path = args.data_dir or default_base_path(DESKTOP_APP_NAME)
+    client = chromadb.PersistentClient(path=os.path.join(base_path, "chroma_db"))
+    backend = create_backend(args.provider, model_path=args.model_path, threads=args.threads)
+    print(f"Re-embedding {base_path} with {backend.model_id} ({backend.dimension} dims)", file=sys.stderr)
+
+    started = time.perf_counter()
+
+    def progress(done, total):
+        print(f"\r{done}/{total} chunks", end="", file=sys.stderr, flush=True)
+
+    count = 0
+    for name in args.kb or list_names(base_path):
+        collection_name = KnowledgeBase(name, base_path).collection_name
+        if _collection_or_none(client, collection_name) is None \
+                and _collection_or_none(client, f"{collection_name}__reembed") is None:
+            continue  # never opened, nothing to re-embed
+        print(f"{name}:", file=sys.stderr)
+        count += asyncio.run(reembed_collection(
+            client, backend, name=collection_name, cache_path=os.path.join(base_path, "embedding_cache.sqlite3"),
+            batch_size=args.batch_size, max_in_flight=args.in_flight, progress_callback=progress,
+        ))
+        print(file=sys.stderr)
+    print(f"Done: {count} chunks in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from .telemetry import tracer
+
+logger = logging.getLogger(__name__)
+
+# Request states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+_END = object()  # end-of-stream marker on a request's queue
+
+_request_ids = itertools.count(1)
+
+
+class ChatRequest:
+    """
+    Handle for one scheduled streaming request. The producer task fills a
+    queue that the caller drains with `stream()`; `cancel()` stops the
+    producer (and closes the upstream generator) whether or not anyone is
+    still reading.
+    """
+
+    def __init__(self, factory: Callable[[], AsyncIterator[str]], key: Optional[str] = None):
+        self.id = next(_request_ids)
+        self.key = key
+        self.factory = factory
+        self.state = QUEUED
+        self.error: Optional[BaseException] = None
+        self.cancel_reason: Optional[str] = None  # "stopped" or "superseded"
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.cancel_requested: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    @property
+    def active(self) -> bool:
+        return self.state in (QUEUED, RUNNING)
+
+    def cancel(self, reason: str = "stopped") -> bool:
+        """
+        Cancels the request if it is still queued or running.
+        """
+        if not self.active or self.task is None or self.cancel_requested is not None:
+            return False
+        self.cancel_requested = time.perf_counter()
+        self.cancel_reason = reason
+        self.task.cancel()
+        return True
+
+    async def stream(self) -> AsyncIterator[str]:
+        """
+        Yields the streamed pieces. Ends quietly on cancellation (check
+        `state`); re-raises the producer's error if it failed. Abandoning the
+        iteration cancels the request.
+        """
+        try:
+            while True:
+                piece = await self._queue.get()
+                if piece is _END:
+                    break
+                yield piece
+        finally:
+            if self.active:
+                self.cancel()
+        if self.state == FAILED:
+            raise self.error
+
+    async def wait(self) -> str:
+        """
+        Collects the whole answer (the part received before a cancellation).
+        """
+        return "".join([piece async for piece in self.stream()])
+
+
+class RequestScheduler:
+    """
+    Runs streaming requests (e.g. chat answers) as tasks, at most
+    `max_concurrent` at a time; the rest wait in FIFO order. A request
+    submitted with `supersede=True` abandons the unfinished requests that
+    share its `key`.
+    """
+
+    def __init__(self, max_concurrent: int = 2, latency_window: int = 200):
+        self.max_concurrent = max_concurrent
+        self._slots: Optional[asyncio.Semaphore] = None  # bound to the running loop on first use
+        self._active: Dict[int, ChatRequest] = {}
+
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.superseded = 0
+        self.failed = 0
+        self.max_queued = 0
+        self._cancel_latencies = deque(maxlen=latency_window)
+
+    def submit(self, factory: Callable[[], AsyncIterator[str]], key: Optional[str] = None,
+               supersede: bool = False) -> ChatRequest:
+        """
+        Schedules `factory()` (an async generator of pieces) and returns its
+        handle right away.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        if supersede and key is not None:
+            for stale in self.requests(key):
+                if stale.cancel("superseded"):
+                    self.superseded += 1
+
+        request = ChatRequest(factory, key)
+        request.task = asyncio.ensure_future(self._run(request))
+        request.task.add_done_callback(lambda _: self._finalize(request))
+        self._active[request.id] = request
+        self.submitted += 1
+        self.max_queued = max(self.max_queued, sum(1 for r in self._active.values() if r.state == QUEUED))
+        return request
+
+    async def _run(self, request: ChatRequest):
+        upstream = None
+        try:
+            async with self._slots:
+                request.state = RUNNING
+                request.started = time.perf_counter()
+                tracer.record("request.queue_wait", request.started - request.submitted, request=request.id)
+                upstream = request.factory()
+                async for piece in upstream:
+                    request._queue.put_nowait(piece)
+        except asyncio.CancelledError:
+            request.state = CANCELLED
+        except Exception as e:
+            logger.debug("Request %s failed: %r", request.id, e)
+            request.state = FAILED
+            request.error = e
+        else:
+            request.state = DONE
+        finally:
+            if upstream is not None:
+                # Close the upstream stream now rather than whenever the
+                # generator is garbage-collected
+                try:
+                    await upstream.aclose()
+                except Exception as e:
+                    logger.debug("Closing request %s stream failed: %r", request.id, e)
+
+    def _finalize(self, request: ChatRequest):
+        # A done callback rather than a `finally`, so it also runs for a task
+        # cancelled before its coroutine ever started
+        if request.active:
+            request.state = CANCELLED
+        request.finished = time.perf_counter()
+        request._queue.put_nowait(_END)
+        self._active.pop(request.id, None)
+        if request.state == DONE:
+            self.completed += 1
+        elif request.state == FAILED:
+            self.failed += 1
+        elif request.state == CANCELLED:
+            self.cancelled += 1
+            if request.cancel_requested is not None:
+                self._cancel_latencies.append(request.finished - request.cancel_requested)
+
+    def requests(self, key: Optional[str] = None) -> List[ChatRequest]:
+        """
+        Requests still queued or running (optionally only those with `key`).
+        """
+        return [r for r in self._active.values() if key is None or r.key == key]
+
+    def cancel_all(self, key: Optional[str] = None, reason: str = "stopped") -> int:
+        return sum(1 for r in self.requests(key) if r.cancel(reason))
+
+    async def shutdown(self):
+        """
+        Cancels everything and waits for the tasks to finish.
+        """
+        requests = self.requests()
+        for request in requests:
+            request.cancel()
+        await asyncio.gather(*(r.task for r in requests), return_exceptions=True)
+
+    def stats(self) -> Dict:
+        latencies = sorted(self._cancel_latencies)
+        return {
+            "submitted": self.submitted,
+            "running": sum(1 for r in self._active.values() if r.state == RUNNING),
+            "queued": sum(1 for r in self._active.values() if r.state == QUEUED),
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "superseded": self.superseded,
+            "failed": self.failed,
+            "cancel_latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+            "cancel_latency_ms_max": round(latencies[-1] * 1000, 3) if latencies else None,
+        }
@@ -0,0 +1,147 @@
+"""
+Structured filters for retrieval.
+
+A RetrievalFilter restricts a query to a set of documents, sources, file
+types and/or an ingestion date range. Every condition is a property of the
+whole document, recorded both in the catalog (to size the filtered set
+cheaply) and in each chunk's metadata (doc_id, source, mime_type,
+ingested_at), so the vector search takes it as a Chroma `where` clause
+instead of filtering afterwards.
+"""
+import mimetypes
+import os
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from .document_catalog import make_doc_id
+
+DEFAULT_MIME_TYPE = "text/plain"  # typed or pasted text
+
+
+def mime_type_for(path: str) -> str:
+    """
+    The MIME type of a file, by extension.
+    """
+    mime_type, _ = mimetypes.guess_type(path)
+    if mime_type is None and os.path.splitext(path)[1].lower() == ".md":
+        mime_type = "text/markdown"  # not in every mimetypes table
+    return mime_type or "application/octet-stream"
+
+
+def normalize_file_type(file_type: str) -> str:
+    """
+    Accepts a MIME type ("application/pdf") or an extension ("pdf", ".pdf").
+    """
+    file_type = file_type.strip().lower()
+    if "/" in file_type:
+        return file_type
+    return mime_type_for("file." + file_type.lstrip("."))
+
+
+def _timestamp(value) -> Optional[float]:
+    # Epoch seconds, a datetime or an ISO date/time string (local time)
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return float(value)
+
+
+class RetrievalFilter:
+    """
+    Conditions on the documents a query may use; unset conditions match
+    everything, set ones must all hold. `titles` are converted to doc ids.
+    The ingestion range is `ingested_after <= ingested_at < ingested_before`.
+    Filters are immutable and hashable, so they can key caches.
+    """
+
+    def __init__(self, doc_ids: Optional[Iterable[str]] = None, titles: Optional[Iterable[str]] = None,
+                 sources: Optional[Iterable[str]] = None, file_types: Optional[Iterable[str]] = None,
+                 ingested_after=None, ingested_before=None):
+        ids = set(doc_ids or ()) | {make_doc_id(title) for title in titles or ()}
+        self.doc_ids = frozenset(ids) if doc_ids is not None or titles is not None else None
+        self.sources = frozenset(sources) if sources is not None else None
+        self.file_types = frozenset(normalize_file_type(t) for t in file_types) if file_types is not None else None
+        self.ingested_after = _timestamp(ingested_after)
+        self.ingested_before = _timestamp(ingested_before)
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["RetrievalFilter"]:
+        """
+        Builds a filter from JSON-style fields (e.g. a batch input line);
+        None for no conditions.
+        """
+        if not data:
+            return None
+        unknown = set(data) - {"doc_ids", "titles", "sources", "file_types", "ingested_after", "ingested_before"}
+        if unknown:
+            raise ValueError(f"Unknown filter fields: {', '.join(sorted(unknown))}")
+        retrieval_filter = cls(**data)
+        return retrieval_filter if retrieval_filter else None
+
+    def to_dict(self) -> Dict:
+        data = {}
+        for name in ("doc_ids", "sources", "file_types"):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = sorted(value)
+        for name in ("ingested_after", "ingested_before"):
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        return data
+
+    def key(self) -> Tuple:
+        return (self.doc_ids, self.sources, self.file_types, self.ingested_after, self.ingested_before)
+
+    def __eq__(self, other):
+        return isinstance(other, RetrievalFilter) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __bool__(self):
+        return any(value is not None for value in self.key())
+
+    def __repr__(self):
+        return f"RetrievalFilter({self.to_dict()})"
+
+    def where(self) -> Optional[Dict]:
+        """
+        The filter as a Chroma `where` clause over chunk metadata (None if
+        it has no conditions).
+        """
+        clauses = []
+        if self.doc_ids is not None:
+            clauses.append({"doc_id": {"$in": sorted(self.doc_ids)}})
+        if self.sources is not None:
+            clauses.append({"source": {"$in": sorted(self.sources)}})
+        if self.file_types is not None:
+            clauses.append({"mime_type": {"$in": sorted(self.file_types)}})
+        if self.ingested_after is not None:
+            clauses.append({"ingested_at": {"$gte": self.ingested_after}})
+        if self.ingested_before is not None:
+            clauses.append({"ingested_at": {"$lt": self.ingested_before}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def describe(self) -> str:
+        """
+        A short label, e.g. for the chat header.
+        """
+        parts = []
+        if self.doc_ids is not None:
+            parts.append(f"{len(self.doc_ids)} doc" + ("s" if len(self.doc_ids) != 1 else ""))
+        if self.sources is not None:
+            parts.append(f"{len(self.sources)} source" + ("s" if len(self.sources) != 1 else ""))
+        if self.file_types is not None:
+            parts.append(", ".join(sorted((mimetypes.guess_extension(t) or t).lstrip(".") for t in self.file_types)))
+        if self.ingested_after is not None or self.ingested_before is not None:
+            after = datetime.fromtimestamp(self.ingested_after).date().isoformat() if self.ingested_after else ""
+            # The upper bound is exclusive; show the last day it includes
+            before = datetime.fromtimestamp(self.ingested_before - 1).date().isoformat() if self.ingested_before else ""
+            parts.append(f"{after}..{before}")
+        return "; ".join(parts) or "none"
@@ -0,0 +1,72 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import List, Dict
+
+# Taken when this module is first imported; main.py imports it before anything
+# heavy so offsets are relative to (almost) process start.
+_T0 = time.perf_counter()
+
+
+class StartupProfile:
+    """
+    Records named startup phases (offset from start, duration, thread) from
+    any thread. Phases are always recorded (it is cheap); `--profile-startup`
+    only decides whether the breakdown is printed. Recording stops at
+    finish(), so knowledge bases opened later are not added, and after
+    `max_phases` records in processes that never finish startup.
+    """
+
+    def __init__(self, t0: float = _T0, max_phases: int = 500):
+        self.t0 = t0
+        self.max_phases = max_phases
+        self.finished = False
+        self._phases: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _record(self, name: str, start: float, duration: float):
+        with self._lock:
+            if self.finished or len(self._phases) >= self.max_phases:
+                return
+            self._phases.append({
+                "phase": name,
+                "start": start - self.t0,
+                "duration": duration,
+                "thread": threading.current_thread().name,
+            })
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, start, time.perf_counter() - start)
+
+    def mark(self, name: str):
+        """
+        Records an instant (e.g. "window shown") with zero duration.
+        """
+        self._record(name, time.perf_counter(), 0.0)
+
+    def finish(self, name: str):
+        """
+        Records the mark ending startup (e.g. "service ready") and stops recording.
+        """
+        self.mark(name)
+        with self._lock:
+            self.finished = True
+
+    def phases(self) -> List[Dict]:
+        with self._lock:
+            return sorted(self._phases, key=lambda p: p["start"])
+
+    def report(self) -> str:
+        lines = [f"{'phase':<32}{'start ms':>10}{'took ms':>10}  thread"]
+        for p in self.phases():
+            took = f"{p['duration'] * 1000:.1f}" if p["duration"] else "-"
+            lines.append(f"{p['phase']:<32}{p['start'] * 1000:>10.1f}{took:>10}  {p['thread']}")
+        return "\n".join(lines)
+
+
+startup_profile = StartupProfile()
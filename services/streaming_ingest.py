@@ -0,0 +1,185 @@
+"""
+Bounded-memory ingestion of large files.
+
+A worker process streams the file's text page by page into a spool file on
+disk (extraction.extract_to_spool); the spool is then read back in blocks,
+split into chunks incrementally and embedded window by window. Neither the
+whole text nor the whole chunk list is held in memory, and the UI only ever
+sees a preview.
+"""
+import logging
+import os
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (start, end, text) of a chunk, offsets into the whole document
+Chunk = Tuple[int, int, str]
+
+# Separators of both ingest paths' RecursiveCharacterTextSplitter, passed
+# explicitly so that they cannot drift apart
+SEPARATORS = ["\n\n", "\n", " ", ""]
+
+
+class ExtractedFile:
+    """
+    The text of a parsed file, spooled to disk. `discard()` removes the spool.
+    """
+
+    def __init__(self, file_path: str, spool_path: str, content_hash: str, chars: int, preview: str):
+        self.file_path = file_path
+        self.spool_path = spool_path
+        self.content_hash = content_hash
+        self.chars = chars
+        self.preview = preview
+
+    def iter_blocks(self, block_chars: int = 1 << 16) -> Iterator[str]:
+        with open(self.spool_path, encoding="utf-8", newline="") as f:
+            for block in iter(lambda: f.read(block_chars), ""):
+                yield block
+
+    def discard(self):
+        if os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+
+class StreamingSplitter:
+    """
+    Incremental RecursiveCharacterTextSplitter: text is fed in blocks and
+    chunks come out with offsets into the whole text, the same chunks (text
+    and start_index) that splitting the whole text at once would give, so
+    both ingest paths produce the same chunk ids.
+
+    The recursive splitter cuts the text at its first separator that occurs
+    anywhere in it, so that separator must be known up front:
+    `separator_for()` finds it in a first pass over the blocks. The pieces
+    between two occurrences are then merged into chunks exactly like
+    TextSplitter._merge_splits (carrying the overlap from one chunk to the
+    next), and a piece too long for one chunk is split by a splitter with
+    the remaining separators, as the recursive splitter does. Memory is
+    bounded by the longest piece plus one chunk.
+    """
+
+    def __init__(self, separator: str, chunk_size: int = 500, chunk_overlap: int = 50):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separator = separator
+        # keep_separator="start": each separator starts the piece after it
+        sub_separators = SEPARATORS[SEPARATORS.index(separator) + 1:]
+        self.sub_splitter = RecursiveCharacterTextSplitter(
+            separators=sub_separators, keep_separator="start", chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        ) if sub_separators else None
+
+        self.text = ""  # received text not yet needed for locating chunks
+        self.base = 0  # position of text[0] in the whole text
+        self.piece_start = 0  # start of the piece still being received
+        self._current: List[str] = []  # pieces of the chunk being merged
+        self._total = 0
+        self._index = 0  # start_index bookkeeping of create_documents()
+        self._previous_len = 0
+
+    @staticmethod
+    def separator_for(blocks: Iterable[str], separators: Sequence[str] = SEPARATORS[:-1]) -> str:
+        """
+        The separator the recursive splitter would cut the whole text at:
+        the first of `separators` occurring in it, or "" (single
+        characters) if none does.
+        """
+        found = set()
+        tail = ""
+        keep = max(len(s) for s in separators) - 1
+        for block in blocks:
+            text = tail + block
+            found.update(s for s in separators if s not in found and s in text)
+            if separators[0] in found:
+                break
+            tail = text[-keep:] if keep else ""
+        return next((s for s in separators if s in found), "")
+
+    def feed(self, text: str) -> List[Chunk]:
+        self.text += text
+        chunks: List[Chunk] = []
+        for piece in self._complete_pieces():
+            self._add_piece(piece, chunks)
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        chunks: List[Chunk] = []
+        last = self.text[self.piece_start - self.base:]
+        self.piece_start += len(last)
+        if last:
+            self._add_piece(last, chunks)
+        self._flush(chunks)
+        return chunks
+
+    def _complete_pieces(self) -> Iterator[str]:
+        # A piece ends where the next separator starts
+        pending = self.text[self.piece_start - self.base:]
+        if not self.separator:
+            pieces = list(pending)
+        else:
+            pieces = []
+            start = 0
+            match = pending.find(self.separator, 1 if pending.startswith(self.separator) else 0)
+            while match != -1:
+                pieces.append(pending[start:match])
+                start = match
+                match = pending.find(self.separator, match + len(self.separator))
+        for piece in pieces:
+            self.piece_start += len(piece)
+            if piece:
+                yield piece
+
+    def _add_piece(self, piece: str, chunks: List[Chunk]):
+        # RecursiveCharacterTextSplitter._split_text, one piece at a time
+        if len(piece) < self.chunk_size:
+            self._merge(piece, chunks)
+            return
+        self._flush(chunks)
+        if self.sub_splitter is None:
+            self._emit(piece, chunks)
+        else:
+            for chunk in self.sub_splitter.split_text(piece):
+                self._emit(chunk, chunks)
+
+    def _merge(self, piece: str, chunks: List[Chunk]):
+        # TextSplitter._merge_splits with an empty join separator
+        size = len(piece)
+        if self._total + size > self.chunk_size and self._current:
+            self._emit_current(chunks)
+            while self._total > self.chunk_overlap or (self._total + size > self.chunk_size and self._total > 0):
+                self._total -= len(self._current.pop(0))
+        self._current.append(piece)
+        self._total += size
+
+    def _flush(self, chunks: List[Chunk]):
+        self._emit_current(chunks)
+        self._current = []
+        self._total = 0
+
+    def _emit_current(self, chunks: List[Chunk]):
+        text = "".join(self._current).strip()
+        if text:
+            self._emit(text, chunks)
+
+    def _emit(self, chunk: str, chunks: List[Chunk]):
+        # create_documents(): the chunk is looked up from just before where
+        # the previous one ended
+        offset = max(0, self._index + self._previous_len - self.chunk_overlap)
+        found = self.text.find(chunk, max(0, offset - self.base))
+        if found == -1:
+            # create_documents() would record start_index -1 here
+            logger.warning("Chunk not found after offset %d, searching from %d", offset, self.base)
+            found = self.text.find(chunk)
+            if found == -1:
+                raise RuntimeError(f"Chunk at offset ~{offset} not found in the text it was split from")
+        self._index = self.base + found
+        self._previous_len = len(chunk)
+        chunks.append((self._index, self._index + len(chunk), chunk))
+        # Text before the next lookup position is no longer needed
+        keep_from = min(max(0, self._index + len(chunk) - self.chunk_overlap), self.piece_start)
+        if keep_from > self.base:
+            self.text = self.text[keep_from - self.base:]
+            self.base = keep_from
@@ -0,0 +1,248 @@
+"""
+Named latency spans for the query / ingest paths.
+
+    with tracer.span("query.retrieve", k=3) as span:
+        docs = ...
+        span.set(chunks=len(docs))
+
+Finished spans are handed to every registered sink: a rotating JSONL log,
+an in-memory ring buffer (read by the performance panel) and, if the
+package is installed, OpenTelemetry. With no sinks a span only costs two
+perf_counter() calls.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import itertools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Optional, Iterator
+
+logger = logging.getLogger(__name__)
+
+_span_ids = itertools.count(1)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.name = name
+        self.id = next(_span_ids)
+        self.parent_id = parent.id if parent else None
+        self.trace_id = parent.trace_id if parent else self.id
+        self.attrs = dict(attrs)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, duration: Optional[float] = None):
+        self.duration = time.perf_counter() - self.start if duration is None else duration
+
+    def to_dict(self) -> Dict:
+        record = {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.id,
+            "parent_id": self.parent_id,
+            "ts": round(self.wall_start, 6),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+        }
+        if self.error:
+            record["error"] = self.error
+        record.update(self.attrs)
+        return record
+
+
+class Tracer:
+    """
+    Creates spans and fans finished ones out to the sinks. Nesting follows the
+    current asyncio task / thread (contextvars), so concurrent queries keep
+    separate traces.
+    """
+
+    def __init__(self):
+        self._sinks: List = []
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        with self._lock:
+            self._sinks = self._sinks + [sink]
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self._sinks = [s for s in self._sinks if s is not sink]
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attrs) -> Iterator[Span]:
+        span = Span(name, parent or _current_span.get(), **attrs)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self._emit(span)
+
+    def begin(self, name: str, **attrs) -> Span:
+        """
+        Starts a span without making it current; finish it with end(). For
+        spans that cross a `yield` (async generators run in the consumer's
+        context), with children passed `parent=` explicitly.
+        """
+        return Span(name, _current_span.get(), **attrs)
+
+    def end(self, span: Span):
+        span.finish()
+        self._emit(span)
+
+    def record(self, name: str, duration: float, parent: Optional[Span] = None, **attrs) -> Span:
+        """
+        Records a span measured elsewhere (e.g. time to first token), as a
+        child of `parent` or of the current span.
+        """
+        span = Span(name, parent or _current_span.get(), **attrs)
+        span.start -= duration
+        span.wall_start -= duration
+        span.finish(duration)
+        self._emit(span)
+        return span
+
+    def _emit(self, span: Span):
+        for sink in self._sinks:
+            try:
+                sink.export(span)
+            except Exception as e:
+                # Telemetry must never break the instrumented code path
+                logger.debug("Span sink %r failed: %r", sink, e)
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class RingBufferSink:
+    """
+    Keeps the last `maxlen` spans in memory for the current session.
+    """
+
+    def __init__(self, maxlen: int = 5000):
+        self._spans = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._spans.append(span.to_dict())
+
+    def spans(self, name: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            return [s for s in self._spans if name is None or s["name"] == name]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def stats(self, window: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        Rolling latency per span name over the last `window` spans of each
+        name (all buffered spans by default): count, p50, p95, last (ms).
+        """
+        by_name: Dict[str, List[float]] = {}
+        for s in self.spans():
+            by_name.setdefault(s["name"], []).append(s["duration_ms"])
+        result = {}
+        for name, durations in by_name.items():
+            if window:
+                durations = durations[-window:]
+            ordered = sorted(durations)
+            result[name] = {
+                "count": len(durations),
+                "p50": _percentile(ordered, 0.50),
+                "p95": _percentile(ordered, 0.95),
+                "last": durations[-1],
+            }
+        return result
+
+
+class TraceCollector:
+    """
+    Sink that groups finished spans by trace, for callers that want the
+    stage timings of one operation they wrapped in a span of their own:
+
+        with tracer.span("batch.question") as span:
+            ...
+        spans = collector.pop(span.trace_id)
+    """
+
+    def __init__(self):
+        self._traces: Dict[int, List[Dict]] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self._traces.setdefault(span.trace_id, []).append(span.to_dict())
+
+    def pop(self, trace_id: int) -> List[Dict]:
+        with self._lock:
+            return self._traces.pop(trace_id, [])
+
+
+class JsonlSink:
+    """
+    Appends one JSON line per span to `path`, rotating at `max_bytes`
+    (keeps `backup_count` old files).
+    """
+
+    def __init__(self, path: str, max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def export(self, span: Span):
+        record = logging.LogRecord("spans", logging.INFO, __file__, 0,
+                                   json.dumps(span.to_dict(), ensure_ascii=False), None, None)
+        self._handler.handle(record)
+
+    def close(self):
+        self._handler.close()
+
+
+class OpenTelemetrySink:
+    """
+    Re-emits finished spans through the OpenTelemetry API (the exporter is
+    whatever TracerProvider the application configured). Requires the
+    optional `opentelemetry-api` package.
+    """
+
+    def __init__(self, instrumentation_name: str = "rag_desktop"):
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError("OpenTelemetrySink requires the 'opentelemetry-api' package") from e
+        self._tracer = trace.get_tracer(instrumentation_name)
+
+    def export(self, span: Span):
+        end_ns = int((span.wall_start + (span.duration or 0.0)) * 1e9)
+        otel_span = self._tracer.start_span(span.name, start_time=int(span.wall_start * 1e9))
+        for key, value in span.attrs.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error:
+            otel_span.set_attribute("error.type", span.error)
+        otel_span.end(end_time=end_ns)
+
+
+tracer = Tracer()
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the app's packages (services, ui) from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture
+def make_service(tmp_path):
+    """
+    Builds and starts a RagService on local fakes in a scratch directory;
+    `await service.wait_ready()` inside the test's event loop.
+    """
+    from services.fakes import HashingEmbeddings, ScriptedChatModel
+    from services.rag_service import RagService
+
+    def make(**kwargs):
+        kwargs.setdefault("embeddings", HashingEmbeddings())
+        kwargs.setdefault("chat_model", ScriptedChatModel())
+        service = RagService("test", base_path=str(tmp_path / "data"), **kwargs)
+        service.start()
+        return service
+    return make
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from services.batch import load_finished
+
+
+def test_load_finished_skips_failed_ids_and_drops_a_cut_off_line(tmp_path):
+    path = tmp_path / "results.jsonl"
+    complete = (json.dumps({"id": "1", "answer": "yes", "error": None}) + "\n" +
+                json.dumps({"id": "2", "answer": "", "error": "TimeoutError: "}) + "\n" +
+                json.dumps({"id": 3, "answer": "no", "error": None}) + "\n")
+    path.write_text(complete + '{"id": "4", "answ', encoding="utf-8")
+
+    assert load_finished(str(path)) == {"1", "3"}
+    assert path.read_text(encoding="utf-8") == complete
+
+
+def test_load_finished_on_a_missing_file(tmp_path):
+    path = tmp_path / "results.jsonl"
+
+    assert load_finished(str(path)) == set()
+    assert not path.exists()
+
+
+def ask_three_times(make_service, tmp_path, no_cache):
+    from services.batch import run_batch
+
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        await service.add_document("doc", "The launch is planned for March.\n\nIt was moved once.", "notes")
+        question = {"question": "When is the launch?", "filter": {"sources": ["notes"]}}
+        output = tmp_path / "results.jsonl"
+        for i in range(3):
+            if i == 1 and no_cache:
+                # As --no-cache does, here after the filter's cache already holds the answer
+                service.query_cache_size = 0
+            await run_batch(service, [dict(question, id=str(i))], str(output), concurrency=1)
+        results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+        return results, service.chat_model.calls
+    return asyncio.run(run())
+
+
+def test_repeated_filtered_question_is_cached(make_service, tmp_path):
+    results, model_calls = ask_three_times(make_service, tmp_path, no_cache=False)
+
+    assert [r["cached"] for r in results] == [False, True, True]
+    assert model_calls == 1
+
+
+def test_no_cache_answers_repeated_filtered_questions_again(make_service, tmp_path):
+    results, model_calls = ask_three_times(make_service, tmp_path, no_cache=True)
+
+    assert [r["cached"] for r in results] == [False, False, False]
+    assert [r["error"] for r in results] == [None, None, None]
+    assert model_calls == 3
+
+
+def test_command_line_run_on_local_fakes_with_threads(tmp_path, monkeypatch, capsys):
+    from services import batch
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "notes.txt").write_text("The launch is planned for March.", encoding="utf-8")
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text(json.dumps({"id": "q1", "question": "When is the launch?"}) + "\n", encoding="utf-8")
+    output = tmp_path / "results.jsonl"
+    monkeypatch.delenv("DASHSCOPE_API_KEY", raising=False)
+    monkeypatch.setattr("sys.argv", [
+        "batch", str(questions), "--output", str(output), "--embeddings", "hashing", "--threads", "2",
+        "--fake-chat", "--ingest", str(docs), "--data-dir", str(tmp_path / "data"),
+    ])
+
+    batch.main()
+
+    results = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [(r["id"], r["error"]) for r in results] == [("q1", None)]
+    assert results[0]["chunk_ids"]
@@ -0,0 +1,51 @@
+import asyncio
+import os
+
+from services.bulk_ingest import scan_directory
+
+
+def make_tree(root):
+    (root / "sub").mkdir(parents=True)
+    (root / "small.txt").write_text("The launch is planned for March.", encoding="utf-8")
+    (root / "sub" / "large.md").write_text("\n\n".join(f"# Part {i}\n\n" + "Notes. " * 100 for i in range(20)),
+                                           encoding="utf-8")
+    (root / "sub" / "broken.pdf").write_bytes(b"not a pdf")
+    (root / ".hidden.txt").write_text("skipped", encoding="utf-8")
+    (root / "image.png").write_bytes(b"skipped")
+
+
+def test_supported_files_are_scanned_largest_first(tmp_path):
+    make_tree(tmp_path)
+
+    files = scan_directory(str(tmp_path))
+
+    assert [os.path.relpath(path, tmp_path) for path, _ in files] == [
+        os.path.join("sub", "large.md"), "small.txt", os.path.join("sub", "broken.pdf")]
+    assert [size for _, size in files] == sorted((size for _, size in files), reverse=True)
+
+
+def test_a_folder_is_ingested_with_a_report_per_file(make_service, tmp_path):
+    root = tmp_path / "docs"
+    make_tree(root)
+
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        service.create_knowledge_base("imported")
+        progress = []
+        report = await service.ingest_directory(str(root), workers=1, kb="imported",
+                                                progress_callback=lambda done, total, entry: progress.append(
+                                                    (done, total, entry["status"])))
+        titles = [d["title"] for d in await service.get_all_documents(kb="imported")]
+        return report, progress, titles, await service.count_documents()
+
+    report, progress, titles, default_count = asyncio.run(run())
+
+    by_file = {os.path.relpath(entry["path"], root): entry for entry in report}
+    assert by_file["small.txt"]["status"] == "ok" and by_file["small.txt"]["chunks"] == 1
+    assert by_file[os.path.join("sub", "large.md")]["chunks"] > 10
+    broken = by_file[os.path.join("sub", "broken.pdf")]
+    assert broken["status"] == "failed" and broken["error"] and broken["chunks"] == 0
+    assert [(done, total) for done, total, _ in progress] == [(1, 3), (2, 3), (3, 3)]
+    assert sorted(titles) == ["small.txt", os.path.join("sub", "large.md")]
+    assert default_count == 0
@@ -0,0 +1,90 @@
+import pytest
+
+from services.chat_history import INTERRUPTED_NOTE, ChatHistory
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "chat_history.sqlite3")
+
+
+def test_messages_are_read_a_page_at_a_time_newest_page_first(path):
+    history = ChatHistory(path)
+    conversation = history.create_conversation("long")
+    other = history.create_conversation("other")
+    ids = [history.append_message(conversation, "user" if i % 2 == 0 else "ai", f"message {i}") for i in range(120)]
+    history.append_message(other, "user", "elsewhere")
+
+    pages = []
+    before_id, has_more = None, True
+    while has_more:
+        page, has_more = history.messages(conversation, before_id=before_id, limit=50)
+        pages.append(page)
+        before_id = page[0]["id"]
+
+    assert [len(page) for page in pages] == [50, 50, 20]
+    assert [m["id"] for page in reversed(pages) for m in page] == ids
+    assert pages[0][-1]["content"] == "message 119"
+    assert history.count_messages(conversation) == 120
+    history.close()
+
+
+def test_conversations_are_listed_most_recently_active_first(path):
+    history = ChatHistory(path)
+    first = history.create_conversation("first")
+    second = history.create_conversation("second")
+    history.append_message(first, "user", "back to the first one")
+
+    assert [c["title"] for c in history.list_conversations()] == ["first", "second"]
+    assert [c["title"] for c in history.list_conversations(offset=1, limit=1)] == ["second"]
+
+    history.delete_conversation(first)
+
+    assert [c["id"] for c in history.list_conversations()] == [second]
+    assert history.messages(first) == ([], False)
+    history.close()
+
+
+def test_a_streamed_answer_reads_back_the_same_after_reopening(path):
+    history = ChatHistory(path, flush_interval=3600, flush_chars=20)
+    conversation = history.create_conversation()
+    history.append_message(conversation, "user", "When is the launch?")
+    answer = history.append_message(conversation, "ai", "Thinking...", complete=False)
+    text = ""
+    for word in "The launch is planned for March, after the review .".split():
+        text += word + " "
+        history.update_message(answer, text)  # the placeholder is replaced, then the text grows
+        assert history.messages(conversation)[0][-1]["content"] == text
+    history.finish_message(answer, text.strip())
+    history.update_message(answer, "ignored once finished")
+    history.close()
+
+    reopened = ChatHistory(path)
+    page, has_more = reopened.messages(conversation)
+
+    assert [(m["role"], m["content"], m["complete"]) for m in page] == [
+        ("user", "When is the launch?", 1), ("ai", text.strip(), 1)]
+    assert not has_more
+    assert reopened.recovered == 0
+    assert reopened.conn.execute("SELECT COUNT(*) FROM message_parts").fetchone()[0] == 0
+    reopened.close()
+
+
+def test_an_answer_cut_off_by_a_crash_is_recovered_from_its_parts(path):
+    history = ChatHistory(path, flush_interval=3600, flush_chars=10 ** 9)
+    conversation = history.create_conversation()
+    answer = history.append_message(conversation, "ai", "Thinking...", complete=False)
+    history.update_message(answer, "The launch is")
+    history.flush()
+    history.update_message(answer, "The launch is planned")
+    history.flush()
+    history.update_message(answer, "The launch is planned for March")  # never written
+    history.conn.close()  # the app stops without finishing the answer
+
+    reopened = ChatHistory(path)
+    page, _ = reopened.messages(conversation)
+
+    assert history.stats()["parts_written"] == 2
+    assert reopened.recovered == 1
+    assert [(m["content"], m["complete"]) for m in page] == [("The launch is planned" + INTERRUPTED_NOTE, 1)]
+    reopened.close()
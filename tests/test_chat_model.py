@@ -0,0 +1,95 @@
+import pytest
+
+from services.chat_history import ChatHistory
+
+
+@pytest.fixture
+def app():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = ChatHistory(str(tmp_path / "chat_history.sqlite3"))
+    yield history
+    history.close()
+
+
+def paint(delegate, model, row):
+    from PyQt5.QtWidgets import QStyleOptionViewItem
+    delegate._layout(model.index(row), QStyleOptionViewItem(), 300)
+
+
+def test_stream_documents_are_dropped_on_finish_and_on_conversation_switch(app, history):
+    from ui.chat_model import ChatDelegate, ChatModel
+
+    model = ChatModel(history)
+    delegate = ChatDelegate()
+    delegate.watch(model)
+    model.add_message("user", "first question")
+    first = model.add_message("ai", "Thinking...", streaming=True)
+    model.update_message(first, "Partial **answer**")
+    paint(delegate, model, 1)
+    assert first in delegate._streams
+
+    # Switching conversations mid-stream drops it; the answer keeps streaming
+    other = history.create_conversation("other")
+    model.load_conversation(other)
+    assert delegate._streams == {}
+    model.update_message(first, "Partial **answer** continued")
+
+    # Finished (or stopped) while another conversation is shown
+    model.new_conversation()
+    model.add_message("user", "second question")
+    second = model.add_message("ai", "Thinking...", streaming=True)
+    paint(delegate, model, 1)
+    model.finish_message(first)
+    assert set(delegate._streams) == {second}
+    model.finish_message(second)
+    assert delegate._streams == {}
+
+
+def test_bubble_layouts_are_reused_until_the_message_or_width_changes(app, history):
+    from PyQt5.QtWidgets import QStyleOptionViewItem
+    from ui.chat_model import ChatDelegate, ChatModel, VersionRole
+
+    model = ChatModel(history)
+    delegate = ChatDelegate()
+    model.add_message("user", "question")
+    answer = model.add_message("ai", "An **answer**")
+    model.finish_message(answer)
+
+    def layout(row, width=300):
+        return delegate._layout(model.index(row), QStyleOptionViewItem(), width)
+
+    first = layout(1)
+    assert layout(1) is first  # repainted, e.g. while scrolling
+    assert (delegate.cache_hits, delegate.cache_misses) == (1, 1)
+
+    assert layout(1, width=200) is not first  # the view was resized
+    assert layout(1) is first  # both widths stay cached
+
+    model.update_message(answer, "An edited **answer**")
+    edited = layout(1)
+    assert edited is not first
+    assert edited.toPlainText() == "An edited answer"
+    # The old version is dropped at every width
+    assert {key[1] for key in delegate._cache if key[0] == answer} == {model.index(1).data(VersionRole)}
+
+
+def test_cached_layouts_are_bounded_by_their_text_size(app, history):
+    from PyQt5.QtWidgets import QStyleOptionViewItem
+    from ui.chat_model import ChatDelegate, ChatModel
+
+    model = ChatModel(history)
+    delegate = ChatDelegate(max_cache_chars=2500)
+    for i in range(10):
+        model.add_message("user", f"{i} " + "x" * 998)
+    for row in range(10):
+        delegate._layout(model.index(row), QStyleOptionViewItem(), 300)
+
+    assert delegate._cache_chars <= 2500
+    assert len(delegate._cache) == 2  # the most recently painted rows
+    assert delegate._layout(model.index(9), QStyleOptionViewItem(), 300) is not None
+    assert delegate.cache_hits == 1
@@ -0,0 +1,31 @@
+from langchain_core.documents import Document
+
+from services.context_builder import ContextBuilder, estimate_tokens
+
+# Distinct words, so chunks only share the text they overlap on
+TEXT = "".join(f"w{i:04d} " for i in range(400))
+
+
+def chunk(start, end, doc_id="doc"):
+    return Document(page_content=TEXT[start:end], metadata={
+        "doc_id": doc_id, "content_hash": "hash", "start_index": start, "end_index": end,
+    })
+
+
+def test_bridging_chunk_merges_the_spans_it_joins():
+    # A and C are selected first; B overlaps both
+    docs = [chunk(0, 500), chunk(900, 1400), chunk(450, 950)]
+    result = ContextBuilder(token_budget=10000).build(docs)
+
+    assert len(result.spans) == 1
+    assert result.text == TEXT[0:1400]
+    assert len(result.docs) == 3
+
+
+def test_default_budget_is_no_larger_than_the_top_three_chunks():
+    docs = [chunk(i * 480, i * 480 + 500, doc_id=f"doc{i % 4}") for i in range(4)] + \
+           [chunk(i * 600, i * 600 + 500, doc_id=f"other{i}") for i in range(8)]
+    result = ContextBuilder().build(docs)
+
+    assert result.baseline_tokens == estimate_tokens("\n\n".join(d.page_content for d in docs[:3]))
+    assert 0 < result.tokens <= result.baseline_tokens
@@ -0,0 +1,94 @@
+import asyncio
+
+from services.document_catalog import DocumentCatalog, content_hash, make_doc_id
+
+
+def test_documents_are_listed_in_pages_in_insertion_order(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        for i in range(7):
+            await service.add_document(f"doc {i}", f"Text of document {i}.", "notes" if i % 2 else "mail")
+        pages = [await service.get_all_documents(offset=offset, limit=3) for offset in (0, 3, 6, 9)]
+        return pages, await service.count_documents()
+
+    pages, count = asyncio.run(run())
+
+    assert [[d["title"] for d in page] for page in pages] == [
+        ["doc 0", "doc 1", "doc 2"], ["doc 3", "doc 4", "doc 5"], ["doc 6"], []]
+    assert count == 7
+    first = pages[0][0]
+    assert first["doc_id"] == make_doc_id("doc 0")
+    assert first["chunk_count"] == 1
+    assert first["content_hash"] == content_hash("Text of document 0.")
+
+
+def test_listing_searches_title_source_and_summary(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        await service.add_document("Launch plan", "The launch is in March.", "notes")
+        await service.add_document("Budget", "Costs are 100% covered.", "mail")
+        await service.add_document("Minutes", "Nothing about it.", "notes_2024")
+        return {
+            query: ([d["title"] for d in await service.get_all_documents(query=query)],
+                    await service.count_documents(query))
+            for query in ("launch", "MAIL", "100%", "s_2", "%")
+        }
+
+    results = asyncio.run(run())
+
+    assert results == {
+        "launch": (["Launch plan"], 1),
+        "MAIL": (["Budget"], 1),
+        "100%": (["Budget"], 1),  # LIKE wildcards are matched literally
+        "s_2": (["Minutes"], 1),
+        "%": (["Budget"], 1),
+    }
+
+
+def test_resaving_a_title_keeps_one_row(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        await service.add_document("doc", "First version.")
+        await service.add_document("doc", "Second version.")
+        return await service.get_all_documents(), await service.get_document("doc")
+
+    documents, document = asyncio.run(run())
+
+    assert [d["title"] for d in documents] == ["doc"]
+    assert document["content_hash"] == content_hash("Second version.")
+
+
+class LegacyVectorStore:
+    """
+    Chunks as collections written before the catalog stored them: the full
+    text and summary inline in every chunk's metadata.
+    """
+
+    def __init__(self, metadatas):
+        self.metadatas = metadatas
+        self.pages = 0
+
+    def get(self, limit, offset, include):
+        self.pages += 1
+        return {"metadatas": self.metadatas[offset:offset + limit]}
+
+
+def test_catalog_is_built_once_from_an_existing_collection(tmp_path):
+    chunks = [{"title": "a", "source": "notes", "full_content": "Text of a", "summary": "about a"}] * 3 + \
+             [{"title": "b", "full_content": "Text of b"}] * 2
+    vector_store = LegacyVectorStore(chunks)
+    catalog = DocumentCatalog(str(tmp_path / "catalog.sqlite3"))
+
+    assert catalog.migrate_from_vector_store(vector_store, page_size=2) == 2
+    assert catalog.migrate_from_vector_store(vector_store, page_size=2) == 0
+
+    assert vector_store.pages == 4  # three pages and the empty one ending the scan
+    assert [(d["title"], d["source"], d["summary"], d["chunk_count"], d["content_hash"])
+            for d in catalog.list_documents()] == [
+        ("a", "notes", "about a", 3, content_hash("Text of a")),
+        ("b", "", "Text of b", 2, content_hash("Text of b")),
+    ]
+    catalog.close()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+
+from services.document_catalog import content_hash, make_doc_id
+from services.document_store import DocumentStore, migrate_full_content
+
+
+def blobs(store):
+    return sorted(name for _, _, files in os.walk(store.root) for name in files)
+
+
+def test_identical_texts_are_stored_once_and_kept_while_referenced(make_service):
+    text = "\n\n".join(f"Paragraph {i} " * 40 for i in range(5))
+
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        store = (await service._kb()).doc_store
+        await service.add_document("a", text)
+        await service.add_document("b", text)
+        shared = blobs(store)
+        await service.add_document("a", "A new text for a.")
+        after_a = blobs(store)
+        await service.add_document("b", "A new text for b.")
+        after_b = blobs(store)
+        return shared, after_a, after_b, await service.get_document_content(make_doc_id("b"))
+
+    shared, after_a, after_b, content_b = asyncio.run(run())
+
+    assert shared == [content_hash(text) + ".z"]
+    assert content_hash(text) + ".z" in after_a  # "b" still refers to it
+    assert content_hash(text) + ".z" not in after_b
+    assert len(after_b) == 2
+    assert content_b == "A new text for b."
+
+
+def test_spans_are_read_without_the_whole_text(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents"))
+    text = "".join(f"{i:06d} 检索 " for i in range(50000))
+    digest = store.put(text)
+
+    assert store.put(text) == digest == content_hash(text)
+    assert store.get_span(digest, 123456, 123500) == text[123456:123500]
+    assert store.get_span(digest, len(text) - 10, len(text)) == text[-10:]
+    assert store.get_span("0" * 64, 0, 10) is None
+
+
+def test_streamed_files_match_stored_strings(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents"))
+    text = "Some text 向量\n" * 10000
+    path = tmp_path / "text.txt"
+    path.write_text(text, encoding="utf-8")
+
+    digest = store.put_file(str(path), content_hash(text), block_size=1000)
+
+    assert store.get(digest) == text
+    assert "".join(store.iter_text(digest, block_size=100)) == text
+
+
+def test_inline_full_texts_are_moved_into_the_store(make_service, tmp_path):
+    full_content = "Intro.\n\nRepeated.\n\nMiddle.\n\nRepeated.\n\nEnd."
+    chunks = ["Intro.", "Repeated.", "Middle.", "Repeated.", "End."]
+    ids = [f"legacy-{i}" for i in range(len(chunks))]
+
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        collection = (await service._kb()).collection
+        # Chunks as written before the document store: no doc_id or offsets,
+        # the full text and summary inline in every chunk
+        collection.add(
+            ids=ids, documents=chunks, embeddings=service.embeddings.embed_documents(chunks),
+            metadatas=[{"title": "legacy", "full_content": full_content, "summary": "Intro."}] * len(chunks),
+        )
+        store = DocumentStore(str(tmp_path / "documents"))
+        migrated = migrate_full_content(collection, store, page_size=2)
+        return migrated, store, collection.get(ids=ids, include=["metadatas"])
+
+    migrated, store, after = asyncio.run(run())
+
+    digest = content_hash(full_content)
+    assert migrated == {make_doc_id("legacy"): digest}
+    assert store.get(digest) == full_content
+    metadatas = dict(zip(after["ids"], after["metadatas"]))
+    for chunk_id, chunk in zip(ids, chunks):
+        meta = metadatas[chunk_id]
+        assert "full_content" not in meta and "summary" not in meta
+        assert meta["doc_id"] == make_doc_id("legacy")
+        assert meta["content_hash"] == digest
+        assert full_content[meta["start_index"]:meta["end_index"]] == chunk
+    # Repeated chunk texts get the offsets of their own occurrence
+    assert metadatas["legacy-1"]["start_index"] < metadatas["legacy-3"]["start_index"]
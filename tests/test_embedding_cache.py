@@ -0,0 +1,39 @@
+import asyncio
+import os
+
+from services.embedding_cache import CachedEmbeddings
+from services.fakes import HashingEmbeddings
+
+
+def test_repeated_texts_make_no_provider_calls(tmp_path):
+    provider = HashingEmbeddings()
+    cache = CachedEmbeddings(provider, "hashing", db_path=os.path.join(tmp_path, "cache.sqlite3"))
+    texts = ["first chunk", "second chunk", "first chunk"]
+
+    first = cache.embed_documents(texts)
+    assert provider.calls == 1
+    assert provider.texts_embedded == 2  # duplicates are embedded once
+
+    assert cache.embed_documents(texts) == first
+    assert provider.calls == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    db_path = os.path.join(tmp_path, "cache.sqlite3")
+    CachedEmbeddings(HashingEmbeddings(), "hashing", db_path=db_path).embed_documents(["a", "b"])
+
+    provider = HashingEmbeddings()
+    cache = CachedEmbeddings(provider, "hashing", db_path=db_path)
+    asyncio.run(cache.aembed_documents(["a", "b"]))
+    assert provider.calls == 0
+    assert cache.stats()["disk_hits"] == 2
+
+
+def test_replacing_a_row_does_not_grow_the_disk_size(tmp_path):
+    cache = CachedEmbeddings(HashingEmbeddings(), "hashing", db_path=os.path.join(tmp_path, "cache.sqlite3"))
+    vector = cache.embed_query("question")
+    size = cache.stats()["disk_bytes"]
+
+    cache._store({cache._key("question", "query"): vector})
+    assert cache.stats()["disk_bytes"] == size
+    assert size == cache.conn.execute("SELECT SUM(length(vector)) FROM embeddings").fetchone()[0]
@@ -0,0 +1,48 @@
+import pytest
+
+from services import embedding_providers
+from services.embedding_providers import available_providers, create_backend
+
+# What main.py and services.batch pass, whatever the provider
+COMMAND_LINE_OPTIONS = {"model_path": "models/local-model", "threads": 2}
+
+
+class RecordingEmbeddings:
+    def __init__(self, model_path, **kwargs):
+        self.options = dict(kwargs, model_path=model_path)
+        self.dimension = 8
+
+
+@pytest.fixture
+def local_backends(monkeypatch):
+    # The in-process backends would load a real model
+    monkeypatch.setattr(embedding_providers, "OnnxEmbeddings", RecordingEmbeddings)
+    monkeypatch.setattr(embedding_providers, "SentenceTransformerEmbeddings", RecordingEmbeddings)
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test")
+
+
+@pytest.mark.parametrize("provider", available_providers())
+def test_every_provider_accepts_the_command_line_options(local_backends, provider):
+    backend = create_backend(provider, **COMMAND_LINE_OPTIONS)
+
+    assert backend.dimension > 0
+    if isinstance(backend.embeddings, RecordingEmbeddings):
+        assert backend.embeddings.options["threads"] == 2
+        assert backend.embeddings.options["model_path"] == "models/local-model"
+
+
+def test_none_options_are_left_to_the_provider_defaults():
+    backend = create_backend("hashing", size=16, threads=None, model_path=None)
+
+    assert backend.model_id == "hashing:16"
+
+
+@pytest.mark.parametrize("provider", available_providers())
+def test_an_option_no_provider_knows_is_rejected(local_backends, provider):
+    with pytest.raises(ValueError, match="no option bogus"):
+        create_backend(provider, bogus=1)
+
+
+def test_an_unknown_provider_is_rejected():
+    with pytest.raises(ValueError, match="Unknown embedding provider"):
+        create_backend("nope")
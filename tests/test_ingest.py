@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+from services.document_catalog import content_hash, make_doc_id
+
+TEXT = "\n\n".join(f"Paragraph {i}: " + f"word{i} " * 60 for i in range(10))
+
+
+def test_failed_catalog_write_rolls_back_every_store(make_service, monkeypatch):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        await service.add_document("doc", TEXT, "test")
+        base = await service._kb()
+        before = base.collection.get(where={"doc_id": make_doc_id("doc")}, include=["metadatas"])
+        catalog_row = base.catalog.get_document(make_doc_id("doc"))
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("catalog unavailable")
+        monkeypatch.setattr(base.catalog, "upsert_document", fail)
+
+        # Same opening paragraphs (kept chunks), a changed tail (new chunks)
+        changed = TEXT + "\n\nA new closing paragraph."
+        with pytest.raises(RuntimeError):
+            await service.add_document("doc", changed, "test")
+
+        after = base.collection.get(where={"doc_id": make_doc_id("doc")}, include=["metadatas"])
+        assert dict(zip(after["ids"], after["metadatas"])) == dict(zip(before["ids"], before["metadatas"]))
+        assert base.catalog.get_document(make_doc_id("doc")) == catalog_row
+        assert base.doc_store.contains(catalog_row["content_hash"])
+        assert not base.doc_store.contains(content_hash(changed))
+    asyncio.run(run())
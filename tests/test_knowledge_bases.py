@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+
+def test_a_query_merges_the_hits_of_every_selected_base(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        for name in ("research", "support", "archive"):
+            service.create_knowledge_base(name)
+        await service.add_document("launch", "The launch is planned for March.", kb="research")
+        await service.add_document("budget", "The budget was approved in May.", kb="research")
+        await service.add_document("ticket", "Customers ask when the launch is planned.", kb="support")
+        # The same document in two bases: same chunk id, two distinct hits
+        await service.add_document("faq", "Launch questions go to the launch team.", kb="research")
+        await service.add_document("faq", "Launch questions go to the launch team.", kb="support")
+
+        docs = await service._retrieve("When is the launch planned?", await service._embed_query(
+            "When is the launch planned?"), k=4, bases=["support", "research"])
+        return docs, service.loaded_knowledge_bases()
+
+    docs, loaded = asyncio.run(run())
+
+    hits = [(d.metadata["kb"], d.metadata["title"]) for d in docs]
+    assert hits[0] == ("support", "ticket")  # has every word of the question
+    assert set(hits) == {("research", "launch"), ("support", "ticket"), ("research", "faq"), ("support", "faq")}
+    assert "archive" not in loaded  # bases no query selected are never opened
+
+
+def test_default_bases_are_searched_when_none_are_selected(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        service.create_knowledge_base("archive")
+        await service.add_document("plan", "The launch is planned for March.")
+        await service.add_document("old plan", "The launch was planned for January.", kb="archive")
+        default = await service._retrieve("launch planned", None, k=4)
+        service.default_bases = ["archive"]
+        archive = await service._retrieve("launch planned", None, k=4)
+        return default, archive
+
+    default, archive = asyncio.run(run())
+
+    assert [(d.metadata["kb"], d.metadata["title"]) for d in default] == [("default", "plan")]
+    assert [(d.metadata["kb"], d.metadata["title"]) for d in archive] == [("archive", "old plan")]
+
+
+def test_knowledge_bases_are_listed_default_first_and_validated(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        for name in ("zeta", "alpha", "alpha"):
+            service.create_knowledge_base(name)
+        with pytest.raises(ValueError):
+            service.create_knowledge_base("../escape")
+        with pytest.raises(ValueError):
+            await service._retrieve("launch", None, bases=["missing"])
+        return service.knowledge_bases()
+
+    assert asyncio.run(run()) == ["default", "alpha", "zeta"]
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def loop():
+    from PyQt5.QtWidgets import QApplication
+
+    QApplication.instance() or QApplication([])
+    # The model schedules its page loads on the current event loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def settle(loop):
+    while asyncio.all_tasks(loop):
+        loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(loop)))
+
+
+@pytest.fixture
+def service(make_service, loop):
+    service = make_service()
+
+    async def fill():
+        await service.wait_ready()
+        for i in range(25):
+            await service.add_document(f"doc {i:02d}", f"Text {i}.", "mail" if i % 5 == 0 else "notes")
+    loop.run_until_complete(fill())
+    return service
+
+
+def titles(model):
+    return [model.index(row).data() for row in range(model.rowCount())]
+
+
+def test_rows_are_loaded_a_page_at_a_time(service, loop):
+    from ui.knowledge_model import KnowledgeModel
+
+    model = KnowledgeModel(service, page_size=10)
+    loaded = []
+    while model.canFetchMore():
+        model.fetchMore()
+        assert not model.canFetchMore()  # one page request at a time
+        settle(loop)
+        loaded.append(model.rowCount())
+
+    assert loaded == [10, 20, 25]
+    assert titles(model) == [f"doc {i:02d}" for i in range(25)]
+
+
+def test_the_search_is_applied_by_the_catalog_and_late_pages_are_dropped(service, loop):
+    from ui.knowledge_model import KnowledgeModel
+
+    model = KnowledgeModel(service, page_size=10)
+    model.fetchMore()
+    model.set_filter(" mail ")  # before the unfiltered page arrived
+    settle(loop)
+
+    assert titles(model) == ["doc 00", "doc 05", "doc 10", "doc 15", "doc 20"]
+    assert not model.canFetchMore()
+
+
+def test_a_saved_document_is_applied_without_reloading(service, loop):
+    from ui.knowledge_model import KnowledgeModel
+
+    model = KnowledgeModel(service, page_size=50)
+    model.set_filter("mail")
+    settle(loop)
+    resets = []
+    model.modelReset.connect(lambda: resets.append(True))
+
+    async def save():
+        await service.add_document("doc 00", "Edited text.", "mail")
+        await service.add_document("new mail", "New text.", "mail")
+        await service.add_document("new note", "New text.", "notes")
+        return [await service.get_document(title) for title in ("doc 00", "new mail", "new note")]
+    for doc in loop.run_until_complete(save()):
+        model.upsert_document(doc)
+
+    assert titles(model) == ["doc 00", "doc 05", "doc 10", "doc 15", "doc 20", "new mail"]
+    assert "Edited text." in model.docs[0]["summary"]
+    assert resets == []
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from services.streaming_ingest import ExtractedFile
+
+
+@pytest.fixture
+def widget(make_service):
+    from PyQt5.QtWidgets import QApplication
+    from ui.knowledge_widget import KnowledgeWidget
+
+    app = QApplication.instance() or QApplication([])
+    # The document list schedules its page loads on the current event loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    service = make_service()
+    loop.run_until_complete(service.wait_ready())
+    widget = KnowledgeWidget(service)
+    yield widget
+    widget.deleteLater()
+    app.processEvents()
+    pending_tasks = asyncio.all_tasks(loop)
+    for task in pending_tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending_tasks, return_exceptions=True))
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def pending(tmp_path):
+    spool = tmp_path / "spool.txt"
+    spool.write_text("Quarterly report text. " * 100, encoding="utf-8")
+    return ExtractedFile(str(tmp_path / "report.pdf"), str(spool), "hash", 2300, "Quarterly report text.")
+
+
+def test_remove_file_discards_the_upload_and_restores_the_editor(widget, tmp_path):
+    extracted = pending(tmp_path)
+    widget.set_pending_file(extracted)
+    assert widget.content_input.isReadOnly()
+    assert not widget.remove_file_btn.isHidden()
+    assert widget.title_input.text() == "report.pdf"
+
+    widget.remove_file_btn.click()
+
+    assert widget.pending_file is None
+    assert not (tmp_path / "spool.txt").exists()
+    assert not widget.content_input.isReadOnly()
+    assert widget.content_input.toPlainText() == ""
+    assert widget.title_input.text() == ""
+    assert widget.remove_file_btn.isHidden()
+
+
+def test_remove_file_keeps_a_title_the_user_typed(widget, tmp_path):
+    widget.set_pending_file(pending(tmp_path))
+    widget.title_input.setText("Q3 report")
+
+    widget.remove_file_btn.click()
+
+    assert widget.title_input.text() == "Q3 report"
@@ -0,0 +1,59 @@
+import asyncio
+
+from services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_cjk_text_is_tokenized_as_character_bigrams():
+    assert tokenize("向量检索") == ["向量", "量检", "检索"]
+    assert tokenize("用 BM25检索") == ["用", "bm25", "检索"]
+    assert tokenize("データベース") == ["デー", "ータ", "タベ", "ベー", "ース"]
+
+
+def test_identifiers_are_kept_whole_and_split_into_parts():
+    assert tokenize("Error ERR_CONN-404 in v1.2") == [
+        "error", "err_conn-404", "err", "conn", "404", "in", "v1.2", "v1", "2"]
+
+
+def test_cjk_queries_match_without_word_boundaries():
+    index = BM25Index()
+    index.add_many(["zh", "en", "mixed"],
+                   ["混合检索结合向量检索和关键词检索", "Hybrid retrieval merges two rankings", "向量数据库 vector store"])
+
+    assert [chunk_id for chunk_id, _ in index.search("向量检索", k=3)] == ["zh", "mixed"]
+    assert index.search("关键词", k=3)[0][0] == "zh"
+    assert [chunk_id for chunk_id, _ in index.search("VECTOR", k=3)] == ["mixed"]
+
+
+def test_search_is_limited_to_documents_and_skips_removed_chunks():
+    index = BM25Index()
+    index.add_many(["a-0", "a-1", "b-0"], ["launch in march", "launch moved", "launch cancelled"],
+                   ["a", "a", "b"])
+
+    assert {chunk_id for chunk_id, _ in index.search("launch", doc_ids={"b"})} == {"b-0"}
+    assert index.search("launch", doc_ids={"unknown"}) == []
+
+    index.remove(["a-0", "b-0"])  # compacts the postings
+
+    assert [chunk_id for chunk_id, _ in index.search("launch")] == ["a-1"]
+    assert len(index) == 1 and "a-0" not in index
+
+
+def test_reciprocal_rank_fusion_favours_ids_ranked_by_both():
+    vector = ["a", "b", "c"]
+    lexical = ["c", "a", "d"]
+
+    assert reciprocal_rank_fusion([vector, lexical]) == ["a", "c", "b", "d"]
+    assert reciprocal_rank_fusion([vector, []]) == vector
+
+
+def test_lexical_hits_are_retrieved_without_a_query_embedding(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        await service.add_document("errors", "ERR_CONN-404 means the upstream refused the connection.")
+        await service.add_document("notes", "向量检索需要嵌入模型。")
+        await service.add_document("other", "Nothing relevant here.")
+        return [[d.metadata["title"] for d in await service._retrieve(query, None, k=2)]
+                for query in ("what is err_conn-404", "检索")]
+
+    assert asyncio.run(run()) == [["errors"], ["notes"]]
@@ -0,0 +1,56 @@
+import pytest
+
+from ui.markdown_stream import split_completed_blocks
+
+ANSWER = (
+    "Here is the plan.\nIt has two steps.\n\n"
+    "- first item\n  continued\n- second item\n\n"
+    "1. one\n2. two\n\n3. three\nAfter the list.\n\n"
+    "```python\nx = 1\n\ny = 2\n```\n"
+    "Done.\n"
+)
+
+
+@pytest.mark.parametrize("text, boundaries", [
+    ("a\nb\n\nc", [5]),  # a paragraph ends at a blank line
+    ("para\n", []),  # ... and stays open until then
+    ("para\n\npartial", [6]),
+    ("```\ncode\n\nmore\n```\nafter", [19]),  # blank lines inside a fence do not end it
+    ("```\ncode\n", []),
+    ("- one\n- two\n", [6]),  # an item ends where the next one starts
+    ("- one\n  more\n- two\n\nend\n\n", [13, 20, 25]),
+    ("1. a\n2. b\n\n3. c\nText\n", [16]),  # an ordered list ends at the next other block
+    ("para\n```py\n", [5]),
+])
+def test_completed_block_boundaries(text, boundaries):
+    assert split_completed_blocks(text) == boundaries
+
+
+def test_a_completed_block_never_changes_as_the_answer_grows():
+    final = split_completed_blocks(ANSWER)
+
+    for length in range(len(ANSWER) + 1):
+        assert set(split_completed_blocks(ANSWER[:length])) <= set(final), ANSWER[:length]
+
+
+def test_scanning_resumes_from_a_boundary():
+    boundaries = split_completed_blocks(ANSWER)
+
+    for start in boundaries:
+        assert split_completed_blocks(ANSWER, start) == [b for b in boundaries if b > start]
+
+
+def test_streamed_answer_parses_each_completed_block_once():
+    from PyQt5.QtWidgets import QApplication
+    from ui.markdown_stream import IncrementalMarkdownDocument
+
+    app = QApplication.instance() or QApplication([])
+    document = IncrementalMarkdownDocument(app.font(), 400)
+    for length in range(0, len(ANSWER) + 1, 3):
+        document.set_text(ANSWER[:length])
+    document.set_text(ANSWER)
+
+    blocks = split_completed_blocks(ANSWER)
+    pieces = [ANSWER[start:end] for start, end in zip([0] + blocks, blocks)]
+    assert document.blocks_parsed == len([p for p in pieces if p.strip()])
+    assert document.text == ANSWER
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from services.prefetch import RetrievalPrefetcher
+
+
+def prefetcher(delay=0.0, fail=None):
+    calls = []
+
+    async def retrieve(draft, scope):
+        calls.append(draft)
+        await asyncio.sleep(delay)
+        if fail is not None:
+            raise fail
+        return [1.0, 0.0], [f"doc for {draft}"]
+    return RetrievalPrefetcher(retrieve), calls
+
+
+def test_cancelling_the_submit_does_not_wait_for_or_swallow_the_prefetch():
+    async def run():
+        prefetch, _ = prefetcher(delay=0.5)
+        prefetch.start("what is the launch date", kb_version=1)
+        submit = asyncio.ensure_future(prefetch.take("what is the launch date", kb_version=1))
+        await asyncio.sleep(0.05)
+        submit.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await submit
+        # The prefetch itself keeps running for a later submit
+        assert prefetch._task is not None and not prefetch._task.done()
+        prefetch.cancel()
+    asyncio.run(run())
+
+
+def test_a_cancelled_prefetch_is_a_miss_not_a_cancelled_submit():
+    async def run():
+        prefetch, _ = prefetcher(delay=0.5)
+        task = prefetch.start("what is the launch date", kb_version=1)
+        submit = asyncio.ensure_future(prefetch.take("what is the launch date", kb_version=1))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+        assert await submit is None
+    asyncio.run(run())
+
+
+def test_a_finished_prefetch_of_the_same_or_nearly_the_same_text_is_used():
+    async def run():
+        prefetch, calls = prefetcher()
+        await prefetch.start("what is the launch date", kb_version=1, scope="default")
+        exact = await prefetch.take("What is the launch date", kb_version=1, scope="default")
+        await prefetch.start("what is the launch date", kb_version=1, scope="default")
+        near = await prefetch.take("what is the launch date?", kb_version=1, scope="default")
+        return exact, near, calls, prefetch.stats()
+
+    exact, near, calls, stats = asyncio.run(run())
+
+    assert exact.docs == near.docs == ["doc for what is the launch date"]
+    assert exact.embedding == [1.0, 0.0]
+    assert calls == ["what is the launch date"] * 2
+    assert (stats["hits"], stats["near_hits"], stats["wasted_embedding_calls"]) == (2, 1, 0)
+
+
+def test_a_running_prefetch_is_awaited_rather_than_repeated():
+    async def run():
+        prefetch, calls = prefetcher(delay=0.1)
+        prefetch.start("what is the launch date", kb_version=1)
+        await asyncio.sleep(0.05)
+        prefetch.start("what is the launch date ", kb_version=1)  # same draft: not fetched again
+        result = await prefetch.take("what is the launch date", kb_version=1)
+        return result, calls, prefetch.stats()
+
+    result, calls, stats = asyncio.run(run())
+
+    assert result.docs == ["doc for what is the launch date"]
+    assert len(calls) == 1
+    assert stats["saved_seconds"] >= 0.04  # the time it ran before the submit
+
+
+@pytest.mark.parametrize("query, kb_version, scope", [
+    ("who runs the project", 1, "default"),  # another question
+    ("what is the launch date", 2, "default"),  # the knowledge base changed since
+    ("what is the launch date", 1, "other"),  # other bases or filters
+])
+def test_a_prefetch_that_does_not_match_the_submit_is_a_miss(query, kb_version, scope):
+    async def run():
+        prefetch, _ = prefetcher(delay=0.5)
+        task = prefetch.start("what is the launch date", kb_version=1, scope="default")
+        await asyncio.sleep(0.01)
+        result = await prefetch.take(query, kb_version=kb_version, scope=scope)
+        await asyncio.sleep(0)
+        return result, task, prefetch.stats()
+
+    result, task, stats = asyncio.run(run())
+
+    assert result is None
+    assert task.cancelled()  # not left running for nothing
+    assert (stats["hits"], stats["cancelled"], stats["wasted_embedding_calls"]) == (0, 1, 1)
+
+
+def test_a_new_draft_supersedes_the_previous_prefetch():
+    async def run():
+        prefetch, calls = prefetcher(delay=0.5)
+        first = prefetch.start("what is the", kb_version=1)
+        await asyncio.sleep(0)
+        prefetch.start("what is the launch date", kb_version=1)
+        await asyncio.sleep(0)
+        assert first.cancelled()
+        assert await prefetch.take("what is the", kb_version=1) is None
+        return calls
+
+    assert asyncio.run(run()) == ["what is the", "what is the launch date"]
+
+
+def test_a_failed_or_stale_prefetch_is_a_miss():
+    async def run():
+        failing, _ = prefetcher(fail=RuntimeError("embedding service down"))
+        failing.start("what is the launch date", kb_version=1)
+        failed = await failing.take("what is the launch date", kb_version=1)
+
+        stale, _ = prefetcher()
+        stale.max_age = 0.0
+        await stale.start("what is the launch date", kb_version=1)
+        await asyncio.sleep(0.01)
+        return failed, await stale.take("what is the launch date", kb_version=1)
+
+    assert asyncio.run(run()) == (None, None)
+
+
+def test_a_submitted_draft_reuses_the_prefetched_embedding_and_chunks(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        retrieved = []
+        retrieve = service._retrieve
+
+        async def counting_retrieve(user_input, *args, **kwargs):
+            retrieved.append(user_input)
+            return await retrieve(user_input, *args, **kwargs)
+        service._retrieve = counting_retrieve
+
+        await service.add_document("plan", "The launch is planned for March.")
+        await service.start_prefetch("When is the launch?")
+        sources = []
+        answer = "".join([piece async for piece in service.stream_query("When is the launch?", sources)])
+        used = list(retrieved)
+
+        # Ingesting after the prefetch makes its chunks stale
+        await service.start_prefetch("Who runs the launch?")
+        await service.add_document("team", "Ana runs the launch.")
+        "".join([piece async for piece in service.stream_query("Who runs the launch?")])
+        return answer, sources, used, retrieved, service.prefetch_stats()
+
+    answer, sources, used, retrieved, stats = asyncio.run(run())
+
+    assert answer and [d.metadata["title"] for d in sources] == ["plan"]
+    assert used == ["When is the launch?"]  # by the prefetch only
+    assert retrieved == used + ["Who runs the launch?"] * 2  # retrieved again after the ingest
+    assert (stats["submits"], stats["hits"]) == (2, 1)
@@ -0,0 +1,102 @@
+import asyncio
+
+from services.retrieval_filter import RetrievalFilter
+
+
+def test_only_the_most_recent_filter_caches_are_kept(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        service.max_query_caches = 3
+        first = service.query_cache_for(filters=RetrievalFilter(sources=["s0"]))
+        first.bump_version()
+        for i in range(1, 10):
+            service.query_cache_for(filters=RetrievalFilter(sources=[f"s{i}"]))
+        service.query_cache_for(filters=RetrievalFilter(sources=["s8"]))  # used again
+        service.query_cache_for(filters=RetrievalFilter(sources=["s10"]))
+
+        assert [f.sources for _, f in service._query_caches] == [{"s9"}, {"s8"}, {"s10"}]
+        # A cache made again does not reuse a version of the evicted one
+        again = service.query_cache_for(filters=RetrievalFilter(sources=["s0"]))
+        assert again is not first and again.kb_version > first.kb_version
+    asyncio.run(run())
+
+
+def test_misses_of_both_tiers_count_towards_the_hit_rate():
+    from services.query_cache import QueryCache
+
+    cache = QueryCache()
+    cache.put("what is the launch date", [1.0, 0.0], [], ["March"], 0.5, cache.kb_version)
+
+    assert cache.lookup_exact("What is the launch date?  ") is None  # punctuation differs
+    assert cache.lookup_exact("what is the launch date") is not None
+    assert cache.lookup_exact("who runs the project") is None  # no embedding: exact tier only
+    assert cache.lookup_exact("when is the launch") is None
+    assert cache.lookup_semantic([0.99, 0.01]) is not None
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["exact_misses"]) == (1, 3)
+    assert (stats["semantic_hits"], stats["semantic_misses"]) == (1, 0)
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 0.5
+
+
+async def ask(service, question, **kwargs):
+    sources = []
+    answer = "".join([piece async for piece in service.stream_query(question, sources, **kwargs)])
+    return answer, sources
+
+
+def test_repeated_and_reworded_questions_are_answered_from_the_cache(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        await service.add_document("plan", "The launch is planned for March.", "notes")
+        first = await ask(service, "When is the launch?")
+        exact = await ask(service, "when is the LAUNCH?")  # same normalized text
+        semantic = await ask(service, "When is the launch!")  # same words, other punctuation
+        return first, exact, semantic, service.chat_model.calls, service.query_cache.stats()
+
+    first, exact, semantic, model_calls, stats = asyncio.run(run())
+
+    assert exact == semantic == first
+    assert [d.metadata["title"] for d in first[1]] == ["plan"]
+    assert model_calls == 1
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_ingesting_into_a_searched_base_invalidates_its_answers(make_service):
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        service.create_knowledge_base("other")
+        await service.add_document("plan", "The launch is planned for March.")
+        await ask(service, "When is the launch?")
+        await ask(service, "When is the launch?", bases=["other"])
+        calls = [service.chat_model.calls]
+
+        # Only the answers over "other" depend on it
+        await service.add_document("memo", "The launch moved to April.", kb="other")
+        await ask(service, "When is the launch?")
+        await ask(service, "When is the launch?", bases=["other"])
+        calls.append(service.chat_model.calls)
+
+        await service.add_document("memo", "The launch moved to April.")
+        await ask(service, "When is the launch?")
+        await ask(service, "When is the launch?", bases=["other"])
+        calls.append(service.chat_model.calls)
+        return calls
+
+    assert asyncio.run(run()) == [2, 3, 4]
+
+
+def test_an_answer_generated_while_the_knowledge_base_changed_is_not_cached():
+    from services.query_cache import QueryCache
+
+    cache = QueryCache()
+    kb_version = cache.kb_version
+    cache.bump_version()
+    cache.put("when is the launch", [1.0, 0.0], [], ["March"], 0.5, kb_version)
+
+    assert cache.lookup_exact("when is the launch") is None
+    assert cache.stats()["entries"] == 0
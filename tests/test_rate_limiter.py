@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from services.fakes import ThrottlingError
+from services.rate_limiter import RateLimiter, is_retryable_error, is_throttling_error
+
+
+def limiter(**kwargs):
+    # No request budget to wait for, and retries a few ms apart
+    options = dict(requests_per_minute=60000, initial_concurrency=8, max_retries=3,
+                   base_delay=0.001, max_delay=0.005)
+    options.update(kwargs)
+    return RateLimiter(**options)
+
+
+def failing(errors, result="ok"):
+    calls = []
+
+    async def fn():
+        calls.append(time.monotonic())
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+
+def test_throttling_halves_the_concurrency_and_successes_raise_it_again():
+    rate_limiter = limiter()
+    fn, calls = failing([ThrottlingError()])
+
+    assert asyncio.run(rate_limiter.call(fn)) == "ok"
+
+    assert len(calls) == 2
+    assert rate_limiter.limit == pytest.approx(4 + 1 / 4)
+    assert rate_limiter.stats()["throttled"] == 1
+    assert rate_limiter.stats()["retries"] == 1
+
+
+def test_a_burst_of_429s_lowers_the_limit_once_per_cooldown():
+    rate_limiter = limiter(cooldown=60)
+    fn, _ = failing([ThrottlingError()] * 3)
+
+    asyncio.run(rate_limiter.call(fn))
+
+    assert rate_limiter.limit == pytest.approx(4 + 1 / 4)
+
+
+def test_retries_up_to_the_limit_then_raises():
+    rate_limiter = limiter(max_retries=3)
+    fn, calls = failing([ThrottlingError()] * 10)
+
+    with pytest.raises(ThrottlingError):
+        asyncio.run(rate_limiter.call(fn))
+
+    assert len(calls) == 4  # the first attempt and three retries
+    stats = rate_limiter.stats()
+    assert stats["retries"] == 3
+    assert stats["failures"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_non_retryable_errors_are_raised_at_once():
+    rate_limiter = limiter()
+    fn, calls = failing([ValueError("bad request")])
+
+    with pytest.raises(ValueError):
+        asyncio.run(rate_limiter.call(fn))
+
+    assert len(calls) == 1
+    assert rate_limiter.limit == 8
+
+
+def test_retry_after_is_honoured():
+    rate_limiter = limiter()
+    fn, calls = failing([ThrottlingError(retry_after=0.1)])
+
+    asyncio.run(rate_limiter.call(fn))
+
+    assert calls[1] - calls[0] >= 0.09  # the event loop may wake up a clock tick early
+
+
+@pytest.mark.parametrize("message", [
+    "HTTP 429", "Error code: 429 - quota exceeded", "status_code=429", "HTTP/1.1 429",
+    "Requests rate limit exceeded", "Throttling.RateQuota", "429 Too Many Requests",
+])
+def test_throttling_errors_are_recognised(message):
+    assert is_throttling_error(RuntimeError(message))
+
+
+@pytest.mark.parametrize("message", ["chunk 1429 failed", "document 429 is empty", "offset 4290"])
+def test_a_429_in_other_text_is_not_throttling(message):
+    error = ValueError(message)
+
+    assert not is_throttling_error(error)
+    assert not is_retryable_error(error)
+
+
+def test_an_error_that_merely_mentions_429_does_not_shrink_the_window():
+    rate_limiter = limiter()
+    fn, calls = failing([ValueError("chunk 1429 failed")])
+
+    with pytest.raises(ValueError):
+        asyncio.run(rate_limiter.call(fn))
+
+    assert len(calls) == 1
+    assert rate_limiter.limit == 8
+    assert rate_limiter.stats()["throttled"] == 0
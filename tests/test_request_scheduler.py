@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from services.fakes import ScriptedChatModel
+from services.request_scheduler import CANCELLED, DONE, RequestScheduler
+
+CANCEL_WITHIN = 0.1  # seconds from cancel() until the request has finished
+
+
+def slow_stream(closed, tokens=100, delay=1.0):
+    async def generate():
+        try:
+            for i in range(tokens):
+                yield f"t{i} "
+                await asyncio.sleep(delay)
+        finally:
+            closed.append(True)
+    return generate
+
+
+def other_tasks():
+    return asyncio.all_tasks() - {asyncio.current_task()}
+
+
+def test_cancel_is_prompt_and_leaves_nothing_running():
+    async def run():
+        scheduler = RequestScheduler(max_concurrent=2)
+        closed = []
+        request = scheduler.submit(slow_stream(closed))
+        stream = request.stream()
+        assert await stream.__anext__() == "t0 "
+
+        started = time.perf_counter()
+        request.cancel()
+        rest = [piece async for piece in stream]
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < CANCEL_WITHIN
+        assert rest == []
+        assert request.state == CANCELLED
+        assert closed == [True]  # the upstream generator was closed
+        await asyncio.sleep(0)
+        assert not other_tasks()
+        assert scheduler.stats()["cancelled"] == 1
+    asyncio.run(run())
+
+
+def test_queued_request_is_cancelled_before_it_starts():
+    async def run():
+        scheduler = RequestScheduler(max_concurrent=1)
+        first = scheduler.submit(slow_stream([], tokens=3, delay=0.01))
+        queued_closed = []
+        queued = scheduler.submit(slow_stream(queued_closed))
+        await asyncio.sleep(0)
+        queued.cancel()
+
+        assert await first.wait() == "t0 t1 t2 "
+        assert first.state == DONE
+        assert await queued.wait() == ""
+        assert queued.state == CANCELLED
+        assert queued.started is None and queued_closed == []
+        await asyncio.sleep(0)
+        assert not other_tasks()
+    asyncio.run(run())
+
+
+def test_superseding_request_abandons_the_previous_one():
+    async def run():
+        scheduler = RequestScheduler(max_concurrent=2)
+        old = scheduler.submit(slow_stream([]), key="chat")
+        await asyncio.sleep(0)
+        new = scheduler.submit(slow_stream([], tokens=2, delay=0.01), key="chat", supersede=True)
+
+        assert await new.wait() == "t0 t1 "
+        assert old.state == CANCELLED and old.cancel_reason == "superseded"
+        await asyncio.sleep(0)
+        assert not other_tasks()
+    asyncio.run(run())
+
+
+def test_cancelled_answer_closes_the_model_stream(make_service):
+    async def run():
+        chat_model = ScriptedChatModel(responses=[" ".join(f"token{i}" for i in range(200))], token_latency=0.05)
+        service = make_service(chat_model=chat_model)
+        await service.wait_ready()
+        await service.add_document("doc", "some text about the scheduler. " * 20, "test")
+        await asyncio.sleep(0)
+        baseline = len(other_tasks())
+
+        request = service.submit_query("what about the scheduler?")
+        received = 0
+        started = None
+        async for _ in request.stream():
+            received += 1
+            if received == 3:
+                started = time.perf_counter()
+                request.cancel()
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < CANCEL_WITHIN
+        assert request.state == CANCELLED
+        assert chat_model.open_streams == 0
+        assert chat_model.streamed_tokens < 10
+        await asyncio.sleep(0)
+        assert len(other_tasks()) <= baseline
+    asyncio.run(run())
+
+
+def test_cancel_during_a_pending_prefetch(make_service):
+    async def run():
+        chat_model = ScriptedChatModel(responses=["an answer " * 10])
+        service = make_service(chat_model=chat_model)
+        await service.wait_ready()
+        await service.add_document("doc", "some text about the scheduler. " * 20, "test")
+        retrieve = service.prefetcher.retrieve
+
+        async def slow_retrieve(draft, scope):
+            await asyncio.sleep(0.5)
+            return await retrieve(draft, scope)
+        service.prefetcher.retrieve = slow_retrieve
+
+        service.start_prefetch("what about the scheduler?")
+        request = service.submit_query("what about the scheduler?")
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        request.cancel()
+        assert [piece async for piece in request.stream()] == []
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < CANCEL_WITHIN
+        assert request.state == CANCELLED
+        assert chat_model.calls == 0
+        service.cancel_prefetch()
+    asyncio.run(run())
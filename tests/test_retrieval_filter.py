@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from services.document_catalog import make_doc_id
+from services.retrieval_filter import RetrievalFilter
+
+
+def test_a_filter_becomes_a_chroma_where_clause():
+    assert RetrievalFilter().where() is None
+    assert RetrievalFilter(sources=["mail", "notes"]).where() == {"source": {"$in": ["mail", "notes"]}}
+    assert RetrievalFilter(titles=["plan"], doc_ids=["abc"], file_types=["pdf", ".MD", "text/plain"],
+                           ingested_after=100.0, ingested_before="2030-01-01").where() == {"$and": [
+        {"doc_id": {"$in": sorted(["abc", make_doc_id("plan")])}},
+        {"mime_type": {"$in": ["application/pdf", "text/markdown", "text/plain"]}},
+        {"ingested_at": {"$gte": 100.0}},
+        {"ingested_at": {"$lt": datetime(2030, 1, 1).timestamp()}},
+    ]}
+
+
+def test_filters_from_batch_input():
+    assert RetrievalFilter.from_dict(None) is None
+    assert RetrievalFilter.from_dict({}) is None
+    assert RetrievalFilter.from_dict({"sources": ["notes"]}) == RetrievalFilter(sources={"notes"})
+    # An empty list is a condition (matching nothing), not a missing one
+    assert RetrievalFilter.from_dict({"sources": []}).where() == {"source": {"$in": []}}
+    with pytest.raises(ValueError):
+        RetrievalFilter.from_dict({"source": ["notes"]})
+
+    retrieval_filter = RetrievalFilter(titles=["plan"], ingested_after=5)
+    assert RetrievalFilter.from_dict(retrieval_filter.to_dict()) == retrieval_filter
+    assert len({retrieval_filter, RetrievalFilter(doc_ids=[make_doc_id("plan")], ingested_after=5.0)}) == 1
+
+
+async def filtered_service(make_service):
+    service = make_service()
+    await service.wait_ready()
+    await service.add_document("plan", "The launch is planned for March.", "notes")
+    await service.add_document("mail", "Re: the launch is planned for March, right?", "mail")
+    for i in range(20):
+        await service.add_document(f"other {i}", "Launch notes about the launch plan" + " and more" * i, "notes",
+                                   mime_type="text/markdown")
+    return service
+
+
+def test_filtered_retrieval_only_returns_matching_documents(make_service):
+    async def run():
+        service = await filtered_service(make_service)
+        embedding = await service._embed_query("When is the launch planned?")
+        results = {}
+        for name, retrieval_filter in {
+            "mail": RetrievalFilter(sources=["mail"]),
+            "plain notes": RetrievalFilter(sources=["notes"], file_types=["txt"]),
+            "future": RetrievalFilter(ingested_after=datetime(2100, 1, 1)),
+        }.items():
+            docs = await service._retrieve("When is the launch planned?", embedding, k=5, filters=retrieval_filter)
+            results[name] = [d.metadata["title"] for d in docs]
+        return results
+
+    assert asyncio.run(run()) == {"mail": ["mail"], "plain notes": ["plan"], "future": []}
+
+
+def test_small_filtered_sets_are_searched_exactly(make_service):
+    async def run():
+        service = await filtered_service(make_service)
+        base = await service._kb()
+        embedding = await service._embed_query("When is the launch planned?")
+        where = RetrievalFilter(file_types=["md"]).where()
+        exact = base.exact_search(embedding, 5, where)
+        hnsw = base.vector_store.similarity_search_by_vector_with_relevance_scores(embedding, 5, filter=where)
+
+        searches = []
+        exact_search = base.exact_search
+        base.exact_search = lambda *args: searches.append(args) or exact_search(*args)
+        await service._retrieve("launch", embedding, filters=RetrievalFilter(sources=["notes"]))
+        service.exact_search_limit = 5  # 21 chunks: the HNSW index instead
+        await service._retrieve("launch", embedding, filters=RetrievalFilter(sources=["notes"]))
+        return exact, hnsw, searches, base
+
+    exact, hnsw, searches, base = asyncio.run(run())
+
+    assert [d.id for d, _ in exact] == [d.id for d, _ in hnsw]
+    assert [distance for _, distance in exact] == pytest.approx([distance for _, distance in hnsw], abs=1e-4)
+    assert all(d.metadata["mime_type"] == "text/markdown" for d, _ in exact)
+    assert len(searches) == 1
+    assert len(base._exact_cache) == 2  # the filtered vectors are kept for the next query
+
+
+def test_cached_filtered_vectors_are_dropped_on_ingest(make_service):
+    async def run():
+        service = await filtered_service(make_service)
+        embedding = await service._embed_query("launch")
+        only_mail = RetrievalFilter(sources=["mail"])
+        before = await service._retrieve("launch", embedding, filters=only_mail)
+        await service.add_document("mail 2", "The launch slipped to April.", "mail")
+        after = await service._retrieve("launch", embedding, k=5, filters=only_mail)
+        return [d.metadata["title"] for d in before], sorted(d.metadata["title"] for d in after)
+
+    assert asyncio.run(run()) == (["mail"], ["mail", "mail 2"])
@@ -0,0 +1,25 @@
+from services.startup_profile import StartupProfile
+
+
+def test_nothing_is_recorded_after_startup_finishes():
+    profile = StartupProfile()
+    with profile.phase("open.chroma"):
+        pass
+    profile.mark("window.shown")
+    profile.finish("service.ready")
+
+    # e.g. another knowledge base opened later
+    with profile.phase("open.chroma"):
+        pass
+    profile.mark("late")
+
+    assert [p["phase"] for p in profile.phases()] == ["open.chroma", "window.shown", "service.ready"]
+
+
+def test_recording_is_capped_when_startup_never_finishes():
+    profile = StartupProfile(max_phases=10)
+    for _ in range(100):
+        with profile.phase("open.catalog"):
+            pass
+
+    assert len(profile.phases()) == 10
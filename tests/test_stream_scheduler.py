@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def app():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+def test_a_burst_of_tokens_is_one_view_update(app):
+    from PyQt5.QtTest import QTest
+    from ui.stream_scheduler import StreamUpdateScheduler
+
+    shown = []
+    scheduler = StreamUpdateScheduler(shown.append, interval_ms=20)
+    for i in range(500):
+        scheduler.append(f"t{i} ")
+    assert shown == []  # nothing is rendered from inside the stream
+
+    QTest.qWait(60)
+
+    assert shown == ["".join(f"t{i} " for i in range(500))]
+    assert scheduler.finish()["updates"] == 1  # nothing left to flush
+
+
+def test_updates_are_at_most_one_per_frame_and_finish_flushes_the_rest(app):
+    from PyQt5.QtTest import QTest
+    from ui.stream_scheduler import StreamUpdateScheduler
+
+    shown = []
+    scheduler = StreamUpdateScheduler(shown.append, interval_ms=50)
+    started = time.perf_counter()
+    tokens = 0
+    while time.perf_counter() - started < 0.5:
+        scheduler.append("x")
+        tokens += 1
+        QTest.qWait(2)
+    scheduler.append("end")
+    stats = scheduler.finish()
+
+    assert shown[-1] == "x" * tokens + "end"
+    assert stats["tokens"] == tokens + 1
+    # 0.5 s at one update per 50 ms frame, plus the final flush
+    assert len(shown) == stats["updates"] <= 0.5 / 0.05 + 2
@@ -0,0 +1,94 @@
+import asyncio
+import random
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from services.streaming_ingest import StreamingSplitter
+
+
+def paragraphs(seed, count):
+    # Short and over-long paragraphs, cut by a mix of separators
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "向量", "检索", "epsilon", "zeta"]
+    text = ""
+    for _ in range(count):
+        text += " ".join(rng.choice(words) for _ in range(rng.randint(3, 180)))
+        text += rng.choice(["\n\n", "\n", "\n\n\n", " ", "\n \n"])
+    return text
+
+
+def whole(text):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, add_start_index=True)
+    return [(d.metadata["start_index"], d.page_content) for d in splitter.create_documents([text])]
+
+
+def streamed(text, block_chars):
+    blocks = [text[i:i + block_chars] for i in range(0, len(text), block_chars)]
+    splitter = StreamingSplitter(StreamingSplitter.separator_for(blocks), chunk_size=500, chunk_overlap=50)
+    chunks = []
+    for block in blocks:
+        chunks.extend(splitter.feed(block))
+    chunks.extend(splitter.finish())
+    for start, end, chunk in chunks:
+        assert text[start:end] == chunk
+    return [(start, chunk) for start, _, chunk in chunks]
+
+
+@pytest.mark.parametrize("block_chars", [7, 4096, 1 << 16])
+def test_streamed_chunks_equal_the_whole_text_split(block_chars):
+    text = paragraphs(0, 600)
+    assert len(text) > 2 * (1 << 16)  # several blocks even at the largest size
+
+    assert streamed(text, block_chars) == whole(text)
+
+
+@pytest.mark.parametrize("text", [
+    "".join(f"line {i} " * 20 + "\n" for i in range(300)),  # no blank lines
+    " ".join("x" * (i % 700 + 1) for i in range(300)),  # words longer than a chunk
+    "abc" * 3000,  # no separator at all
+])
+def test_streamed_chunks_equal_the_whole_text_split_without_paragraphs(text):
+    assert streamed(text, 1000) == whole(text)
+
+
+def test_ingesting_a_large_file_keeps_peak_memory_bounded(make_service, tmp_path):
+    path = tmp_path / "large.txt"
+    with open(path, "w", encoding="utf-8") as f:
+        seed = 0
+        while f.tell() < 5 * 2 ** 20:
+            f.write(paragraphs(seed, 100))
+            seed += 1
+
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        base = await service._kb()
+        stored = []
+
+        # Only the streaming path is measured: the stores it writes to are
+        # counters here (their own memory is the knowledge base's, not the
+        # ingest's)
+        async def write(ids, texts, metadatas):
+            stored.extend(ids)
+        base.ingest_pipeline.run = write
+        base.lexical_index.add_many = lambda *args: None
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            extracted = await service.extract_file(str(path), executor=executor)
+        tracemalloc.start()
+        try:
+            chunks = await service.ingest_extracted("large", extracted)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            extracted.discard()
+        return chunks, len(stored), peak
+
+    chunks, stored, peak = asyncio.run(run())
+
+    assert chunks == stored > 10000
+    # The whole text alone would be more than this
+    assert peak < 5 * 2 ** 20
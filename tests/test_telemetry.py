@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+
+from services.telemetry import JsonlSink, RingBufferSink, Tracer, tracer
+
+
+def test_nested_spans_share_a_trace_and_record_errors():
+    local = Tracer()
+    sink = RingBufferSink()
+    local.add_sink(sink)
+
+    with local.span("outer", k=3) as outer:
+        with local.span("inner") as inner:
+            inner.set(chunks=2)
+        with pytest.raises(ValueError):
+            with local.span("failing"):
+                raise ValueError("bad")
+    local.record("measured", 0.25, parent=outer)
+
+    spans = {s["name"]: s for s in sink.spans()}
+    assert spans["inner"]["parent_id"] == spans["failing"]["parent_id"] == outer.id
+    assert {s["trace_id"] for s in spans.values()} == {outer.id}
+    assert spans["inner"]["chunks"] == 2 and spans["outer"]["k"] == 3
+    assert spans["failing"]["error"] == "ValueError"
+    assert spans["measured"]["duration_ms"] == 250.0
+
+
+def test_concurrent_tasks_keep_separate_traces():
+    local = Tracer()
+    sink = RingBufferSink()
+    local.add_sink(sink)
+
+    async def query(name):
+        with local.span(name) as root:
+            await asyncio.sleep(0.01)
+            with local.span(name + ".stage"):
+                await asyncio.sleep(0.01)
+        return root.trace_id
+
+    async def run():
+        return await asyncio.gather(query("a"), query("b"))
+
+    a, b = asyncio.run(run())
+
+    assert a != b
+    assert {s["name"]: s["trace_id"] for s in sink.spans()} == {"a": a, "a.stage": a, "b": b, "b.stage": b}
+
+
+def test_a_failing_sink_does_not_break_the_traced_code():
+    class Broken:
+        def export(self, span):
+            raise OSError("disk full")
+
+    local = Tracer()
+    sink = RingBufferSink()
+    local.add_sink(Broken())
+    local.add_sink(sink)
+
+    with local.span("work"):
+        pass
+
+    assert [s["name"] for s in sink.spans()] == ["work"]
+
+
+def test_rolling_latency_stats_per_span_name():
+    local = Tracer()
+    sink = RingBufferSink(maxlen=100)
+    local.add_sink(sink)
+    for ms in range(1, 151):
+        local.record("query.retrieve", ms / 1000)
+
+    stats = sink.stats()["query.retrieve"]
+
+    assert stats["count"] == 100  # only the buffered spans
+    assert (stats["p50"], stats["p95"], stats["last"]) == (101.0, 146.0, 150.0)
+    assert sink.stats(window=10)["query.retrieve"]["p50"] == 146.0
+
+
+def test_spans_are_logged_as_json_lines(tmp_path):
+    local = Tracer()
+    sink = JsonlSink(str(tmp_path / "logs" / "spans.jsonl"))
+    local.add_sink(sink)
+    with local.span("ingest.split", chunks=4):
+        pass
+    sink.close()
+
+    records = [json.loads(line) for line in (tmp_path / "logs" / "spans.jsonl").read_text("utf-8").splitlines()]
+    assert [(r["name"], r["chunks"]) for r in records] == [("ingest.split", 4)]
+
+
+def test_a_streamed_answer_records_each_stage(make_service):
+    sink = RingBufferSink()
+
+    async def run():
+        service = make_service()
+        await service.wait_ready()
+        await service.add_document("plan", "The launch is planned for March.")
+        tracer.add_sink(sink)
+        try:
+            for _ in range(2):
+                "".join([piece async for piece in service.stream_query("When is the launch?")])
+        finally:
+            tracer.remove_sink(sink)
+    asyncio.run(run())
+
+    roots = sink.spans("query.stream")
+    assert [r["cached"] for r in roots] == [False, True]
+    stages = [s["name"] for s in sink.spans() if s["trace_id"] == roots[0]["trace_id"]]
+    for stage in ("query.cache_lookup", "query.embed", "query.retrieve", "query.prompt",
+                  "query.first_token", "query.generate"):
+        assert stage in stages
+    cached_stages = {s["name"] for s in sink.spans() if s["trace_id"] == roots[1]["trace_id"]}
+    assert "query.generate" not in cached_stages
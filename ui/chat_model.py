@@ -1,19 +1,67 @@
-from PyQt5.QtCore import QAbstractListModel, Qt, QModelIndex, QSize, QRectF
+from PyQt5.QtCore import QAbstractListModel, Qt, QModelIndex, QSize, QRectF, QTimer, pyqtSignal
 from PyQt5.QtGui import QPainter, QColor, QFontMetrics, QTextDocument, QAbstractTextDocumentLayout, QPalette
 from PyQt5.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QStyle
+from collections import OrderedDict
+import itertools
+import time
+from services.telemetry import tracer
+from .markdown_stream import IncrementalMarkdownDocument
+
+# Extra data roles used by ChatDelegate's layout cache
+MessageIdRole = Qt.UserRole + 1
+VersionRole = Qt.UserRole + 2
+StreamingRole = Qt.UserRole + 3
+
+# Messages not stored in a ChatHistory get negative ids, so they never
+# collide with history ids in ChatDelegate's cache
+_local_ids = itertools.count(-1, -1)
+
+TITLE_CHARS = 60
 
 class ChatMessage:
-    def __init__(self, role, content):
+    def __init__(self, role, content, streaming=False, message_id=None):
+        # Stable for the lifetime of the message (the history id if stored)
+        self.id = message_id if message_id is not None else next(_local_ids)
         self.role = role  # "user" or "ai"
         self.content = content
+        self.version = 0  # bumped on every content change
+        self.streaming = streaming  # True while an answer is still arriving
+
+    def set_content(self, content):
+        self.content = content
+        self.version += 1
 
 class ChatModel(QAbstractListModel):
-    def __init__(self, parent=None):
+    """
+    Messages of one conversation. Without a `history` they only live in
+    memory. With a ChatHistory every message is stored and only a window of
+    the latest `window` messages is loaded: older pages are prepended through
+    canFetchMore/fetchMore once the view shows its top (set_top_visible),
+    and trim() unloads them again. Answers keep streaming into the history
+    when their conversation is switched away.
+    """
+    conversationChanged = pyqtSignal(int)  # created, or got a new question
+    messageFinished = pyqtSignal(int)  # a streaming message ended, shown or not
+
+    def __init__(self, history=None, window=50, parent=None):
         super().__init__(parent)
+        self.history = history
+        self.window = window
         self.messages = []
+        self.conversation_id = None  # None: not stored yet
+        self._has_older = False
+        self._top_visible = False
+        self._fetching = False
+        self._live = {}  # history id -> streaming ChatMessage, in any conversation
+        # Trailing flush, so the last tokens before a pause are written too
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        if history is not None:
+            self._flush_timer.setInterval(int(history.flush_interval * 1000))
+            self._flush_timer.timeout.connect(history.flush)
 
     def rowCount(self, parent=QModelIndex()):
-        return len(self.messages)
+        return 0 if parent.isValid() else len(self.messages)
 
     def data(self, index, role=Qt.DisplayRole):
         if not index.isValid() or index.row() >= len(self.messages):
@@ -24,30 +72,256 @@ class ChatModel(QAbstractListModel):
             return msg.content
         if role == Qt.UserRole:
             return msg.role
+        if role == MessageIdRole:
+            return msg.id
+        if role == VersionRole:
+            return msg.version
+        if role == StreamingRole:
+            return msg.streaming
         return None
 
-    def add_message(self, role, content):
+    def canFetchMore(self, parent=QModelIndex()):
+        # Views ask whenever the *last* row is visible, which in a chat is
+        # always; older messages are only fetched once the top is reached
+        return (not parent.isValid() and self._has_older and self._top_visible
+                and not self._fetching)
+
+    def fetchMore(self, parent=QModelIndex()):
+        """
+        Prepends the page of messages before the oldest loaded one. Runs
+        synchronously (an indexed read of one page), so the view can keep
+        its scroll position across the insert.
+        """
+        if not self.canFetchMore(parent):
+            return
+        self._fetching = True
+        try:
+            with tracer.span("ui.chat_fetch_older", loaded=len(self.messages)):
+                page, self._has_older = self.history.messages(
+                    self.conversation_id, before_id=self._oldest_id(), limit=self.window
+                )
+        finally:
+            self._fetching = False
+        if page:
+            self.beginInsertRows(QModelIndex(), 0, len(page) - 1)
+            self.messages[:0] = [self._message(row) for row in page]
+            self.endInsertRows()
+
+    def set_top_visible(self, visible):
+        self._top_visible = visible
+
+    def _oldest_id(self):
+        return next((m.id for m in self.messages if m.id > 0), None)
+
+    def _message(self, row):
+        # A stored answer still streaming is shown as its live message
+        live = self._live.get(row["id"])
+        if live is not None:
+            return live
+        return ChatMessage(row["role"], row["content"], message_id=row["id"])
+
+    def load_conversation(self, conversation_id):
+        """
+        Shows a stored conversation: loads its latest `window` messages
+        only, however long it is.
+        """
+        with tracer.span("ui.chat_load_conversation", conversation=conversation_id):
+            page, has_older = self.history.messages(conversation_id, limit=self.window)
+        self.beginResetModel()
+        self.conversation_id = conversation_id
+        self.messages = [self._message(row) for row in page]
+        self._has_older = has_older
+        self._top_visible = False
+        self._fetching = False
+        self.endResetModel()
+
+    def new_conversation(self):
+        """
+        Starts an empty conversation; it is stored with its first message.
+        """
+        self.beginResetModel()
+        self.conversation_id = None
+        self.messages = []
+        self._has_older = False
+        self._top_visible = False
+        self.endResetModel()
+
+    def trim(self):
+        """
+        Unloads the oldest messages once more than four windows are loaded,
+        keeping the latest `window` (called while the view is at the bottom).
+        """
+        excess = len(self.messages) - self.window
+        if self.history is None or self.conversation_id is None or len(self.messages) <= 4 * self.window:
+            return
+        self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+        del self.messages[:excess]
+        self._has_older = True
+        self.endRemoveRows()
+
+    def add_message(self, role, content, streaming=False, persist=True):
+        message_id = None
+        if self.history is not None and persist:
+            created = self.conversation_id is None
+            if created:
+                title = " ".join(content.split())[:TITLE_CHARS] if role == "user" else ""
+                self.conversation_id = self.history.create_conversation(title)
+            message_id = self.history.append_message(self.conversation_id, role, content, complete=not streaming)
+            if created or role == "user":
+                self.conversationChanged.emit(self.conversation_id)
+        message = ChatMessage(role, content, streaming, message_id)
+        if streaming and message_id is not None:
+            self._live[message_id] = message
         self.beginInsertRows(QModelIndex(), len(self.messages), len(self.messages))
-        self.messages.append(ChatMessage(role, content))
+        self.messages.append(message)
         self.endInsertRows()
+        return message.id
 
-    def update_last_message(self, content):
-        if not self.messages:
+    def row_of(self, message_id):
+        # Streaming messages are near the end, so search backwards
+        for row in range(len(self.messages) - 1, -1, -1):
+            if self.messages[row].id == message_id:
+                return row
+        return -1
+
+    def _find(self, message_id):
+        idx = self.row_of(message_id)
+        message = self.messages[idx] if idx >= 0 else self._live.get(message_id)
+        return idx, message
+
+    def update_message(self, message_id, content):
+        # The message may belong to a conversation that is not shown
+        idx, message = self._find(message_id)
+        if message is None:
             return
-        idx = len(self.messages) - 1
-        self.messages[idx].content = content
-        self.dataChanged.emit(self.index(idx), self.index(idx))
+        message.set_content(content)
+        if message_id in self._live:
+            self.history.update_message(message_id, content)
+            if not self._flush_timer.isActive():
+                self._flush_timer.start()
+        if idx >= 0:
+            self.dataChanged.emit(self.index(idx), self.index(idx))
+
+    def finish_message(self, message_id):
+        """
+        Marks a streaming message as complete; it is then rendered (and
+        cached) like any other message, and stored with its final text.
+        """
+        idx, message = self._find(message_id)
+        if message is None or not message.streaming:
+            return
+        message.streaming = False
+        message.version += 1
+        if self._live.pop(message_id, None) is not None:
+            self.history.finish_message(message_id, message.content)
+        if idx >= 0:
+            self.dataChanged.emit(self.index(idx), self.index(idx))
+        self.messageFinished.emit(message_id)
+
+    def update_last_message(self, content):
+        if self.messages:
+            self.update_message(self.messages[-1].id, content)
+
+    def finish_last_message(self):
+        if self.messages:
+            self.finish_message(self.messages[-1].id)
 
 class ChatDelegate(QStyledItemDelegate):
-    def __init__(self, parent=None):
+    """
+    Paints chat bubbles. Laid-out documents are cached per message, keyed on
+    (message id, content version, text width, font), so only rows whose content
+    or width changed are re-parsed and re-laid-out.
+    """
+    def __init__(self, parent=None, max_cache_entries=2000, max_cache_chars=4_000_000):
         super().__init__(parent)
-        self.doc = QTextDocument()
+        self.max_cache_entries = max_cache_entries
+        self.max_cache_chars = max_cache_chars
+        self._cache = OrderedDict()  # key -> (QTextDocument, chars)
+        self._cache_chars = 0
+        self._keys_by_message = {}  # message id -> keys currently cached
+        self._streams = {}  # message id -> IncrementalMarkdownDocument while streaming
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _layout(self, index, option, text_width):
+        """
+        Returns a QTextDocument with the message laid out at `text_width`.
+        """
+        text = index.data(Qt.DisplayRole) or ""
+        msg_id = index.data(MessageIdRole)
+
+        # The in-progress answer is rendered incrementally, not cached per version
+        if index.data(StreamingRole):
+            stream = self._streams.get(msg_id)
+            if stream is None:
+                stream = self._streams[msg_id] = IncrementalMarkdownDocument(option.font, text_width)
+            stream.set_text_width(text_width)
+            if stream.text != text:
+                stream.set_text(text)
+            return stream
+        self._streams.pop(msg_id, None)
+
+        key = (msg_id, index.data(VersionRole), int(text_width), option.font.key())
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached[0]
+
+        self.cache_misses += 1
+        doc = QTextDocument()
+        doc.setDefaultFont(option.font)
+        doc.setMarkdown(text)
+        doc.setTextWidth(text_width)
+
+        # Older versions of this message will never be painted again
+        for old_key in [k for k in self._keys_by_message.get(msg_id, ()) if k[1] != key[1]]:
+            self._evict(old_key)
+        self._keys_by_message.setdefault(msg_id, set()).add(key)
+
+        self._cache[key] = (doc, len(text))
+        self._cache_chars += len(text)
+        while self._cache and (len(self._cache) > self.max_cache_entries
+                               or self._cache_chars > self.max_cache_chars):
+            self._evict(next(iter(self._cache)))
+        return doc
+
+    def _evict(self, key):
+        cached = self._cache.pop(key, None)
+        if cached is None:
+            return
+        self._cache_chars -= cached[1]
+        keys = self._keys_by_message.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_message[key[0]]
+
+    def watch(self, model):
+        """
+        Drops the incremental documents of streaming answers once they are no
+        longer needed: when `model` shows another conversation (a stream
+        still running there gets a new document if it is shown again) and
+        when an answer finishes or is stopped, even out of view.
+        """
+        model.modelReset.connect(self._streams.clear)
+        model.messageFinished.connect(self.drop_stream)
+
+    def drop_stream(self, message_id):
+        self._streams.pop(message_id, None)
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._keys_by_message.clear()
+        self._streams.clear()
+        self._cache_chars = 0
 
     def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        started = time.perf_counter()
         painter.save()
         
         # Get data
-        text = index.data(Qt.DisplayRole)
         role = index.data(Qt.UserRole)
         
         # Layout Constants
@@ -57,14 +331,12 @@ class ChatDelegate(QStyledItemDelegate):
         bubble_padding = 10
         max_bubble_width = option.rect.width() * 0.7
         
-        # Setup Text Document
-        self.doc.setMarkdown(text if text else "")
-        self.doc.setDefaultFont(option.font)
-        self.doc.setTextWidth(max_bubble_width - bubble_padding * 2) 
+        # Setup Text Document (cached layout)
+        doc = self._layout(index, option, max_bubble_width - bubble_padding * 2)
 
         # Calculate Text Dimensions
-        doc_height = self.doc.size().height()
-        doc_width = self.doc.idealWidth()
+        doc_height = doc.size().height()
+        doc_width = doc.idealWidth()
         
         # Bubble Rect size
         bubble_w = doc_width + bubble_padding * 2
@@ -142,9 +414,15 @@ class ChatDelegate(QStyledItemDelegate):
         
         # Restore font for content
         painter.setFont(option.font)
-        self.doc.documentLayout().draw(painter, ctx)
+        if isinstance(doc, IncrementalMarkdownDocument):
+            doc.draw(painter, ctx)
+        else:
+            doc.documentLayout().draw(painter, ctx)
 
         painter.restore()
+        if index.data(StreamingRole):
+            # Paint cost of the growing answer row (layout + draw)
+            tracer.record("ui.paint_streaming", time.perf_counter() - started)
 
     def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex):
         text = index.data(Qt.DisplayRole)
@@ -157,10 +435,9 @@ class ChatDelegate(QStyledItemDelegate):
         bubble_padding = 10
         max_bubble_width = option.rect.width() * 0.7
         
-        self.doc.setMarkdown(text)
-        self.doc.setTextWidth(max_bubble_width - bubble_padding * 2)
+        doc = self._layout(index, option, max_bubble_width - bubble_padding * 2)
         
-        text_height = self.doc.size().height() + bubble_padding * 2
+        text_height = doc.size().height() + bubble_padding * 2
         total_height = max(text_height, avatar_size) + margin_v * 2 + 10 # +10 extra buffer
         
         return QSize(option.rect.width(), int(total_height))
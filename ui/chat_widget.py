@@ -1,30 +1,89 @@
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QListView, QLineEdit, QPushButton, QLabel
+    QWidget, QVBoxLayout, QHBoxLayout, QListView, QLineEdit, QPushButton, QLabel, QToolButton, QMenu
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, QPoint
 from qasync import asyncSlot
+import logging
+from services.telemetry import tracer
+from services.request_scheduler import CANCELLED
 from .chat_model import ChatModel, ChatDelegate
+from .conversation_model import ConversationModel, ConversationIdRole
+from .filter_dialog import FilterDialog
+from .stream_scheduler import StreamUpdateScheduler
+
+logger = logging.getLogger(__name__)
 
 class ChatWidget(QWidget):
-    def __init__(self, rag_service, parent=None):
+    def __init__(self, rag_service, frame_interval_ms=33, prefetch=False, prefetch_delay_ms=300,
+                 prefetch_min_chars=4, supersede=False, bases=None, history=None, parent=None):
         super().__init__(parent)
         self.rag_service = rag_service
+        # Optional ChatHistory: conversations are stored and listed in a
+        # sidebar; only the latest messages of the open one are loaded
+        self.history = history
+        self._scroll_anchor = None
+        # Streamed tokens are coalesced into at most one view update per frame
+        # (one StreamUpdateScheduler per answer being streamed)
+        self.frame_interval_ms = frame_interval_ms
+        self.last_stream_stats = None
+        # Answers run on the service's request scheduler, so the input stays
+        # usable while they stream; Stop cancels them. With `supersede`, a
+        # new question abandons the answers still in progress.
+        self.supersede = supersede
+        self.request_key = f"chat-{id(self)}"
+        self._requests = set()
+        # Knowledge bases this chat searches (picked from the header menu),
+        # and the RetrievalFilter narrowing them down (None: everything)
+        self.bases = list(bases or rag_service.default_bases)
+        self.filters = None
+        # Opt-in speculative retrieval: once typing pauses for
+        # `prefetch_delay_ms`, the draft is embedded and searched so the
+        # answer can start without waiting for retrieval
+        self.prefetch_enabled = prefetch
+        self.prefetch_min_chars = prefetch_min_chars
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(prefetch_delay_ms)
+        self.prefetch_timer.timeout.connect(self._prefetch_draft)
         self.init_ui()
         
     def init_ui(self):
-        layout = QVBoxLayout(self)
+        outer = QHBoxLayout(self)
+        if self.history is not None:
+            outer.addWidget(self._build_sidebar())
+        layout = QVBoxLayout()
+        outer.addLayout(layout, 1)
         
         # Header
         header = QLabel("AI Assistant")
         header.setStyleSheet("font-size: 16px; font-weight: bold; padding: 10px;")
-        layout.addWidget(header)
+        self.bases_btn = QToolButton()
+        self.bases_btn.setPopupMode(QToolButton.InstantPopup)
+        self.bases_menu = QMenu(self.bases_btn)
+        self.bases_menu.aboutToShow.connect(self._fill_bases_menu)
+        self.bases_btn.setMenu(self.bases_menu)
+        self._update_bases_button()
+        self.filter_btn = QToolButton()
+        self.filter_btn.clicked.connect(self.edit_filter)
+        self._update_filter_button()
+        header_layout = QHBoxLayout()
+        header_layout.addWidget(header)
+        header_layout.addStretch()
+        header_layout.addWidget(self.bases_btn)
+        header_layout.addWidget(self.filter_btn)
+        layout.addLayout(header_layout)
         
         # Chat List
         self.chat_view = QListView()
-        self.chat_model = ChatModel()
+        self.chat_model = ChatModel(self.history)
         self.delegate = ChatDelegate()
+        self.delegate.watch(self.chat_model)
         
         self.chat_view.setModel(self.chat_model)
+        self.chat_view.verticalScrollBar().valueChanged.connect(self._on_scroll)
+        self.chat_model.rowsAboutToBeInserted.connect(self._anchor_scroll)
+        self.chat_model.rowsInserted.connect(self._restore_scroll)
+        self.chat_model.conversationChanged.connect(self._conversation_changed)
         self.chat_view.setItemDelegate(self.delegate)
         self.chat_view.setSelectionMode(QListView.NoSelection)
         self.chat_view.setSpacing(10)
@@ -55,6 +114,8 @@ class ChatWidget(QWidget):
             }
         """)
         self.input_field.returnPressed.connect(self.send_message)
+        if self.prefetch_enabled:
+            self.input_field.textChanged.connect(self.prefetch_timer.start)
         
         self.send_btn = QPushButton("Send")
         self.send_btn.setStyleSheet("""
@@ -70,14 +131,109 @@ class ChatWidget(QWidget):
             }
         """)
         self.send_btn.clicked.connect(self.send_message)
+
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #c62828;
+                color: white;
+                border-radius: 20px;
+                padding: 10px 20px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #b71c1c;
+            }
+        """)
+        self.stop_btn.clicked.connect(self.stop_requests)
+        self.stop_btn.hide()
         
         input_layout.addWidget(self.input_field)
         input_layout.addWidget(self.send_btn)
+        input_layout.addWidget(self.stop_btn)
         
         layout.addLayout(input_layout)
         
         # Welcome message
-        self.chat_model.add_message("ai", "Welcome! I am your RAG Assistant。 Ask away!")
+        self._add_welcome()
+
+    def _add_welcome(self):
+        # Not stored: a conversation starts with the first question
+        self.chat_model.add_message("ai", "Welcome! I am your RAG Assistant。 Ask away!", persist=False)
+
+    def _build_sidebar(self):
+        sidebar = QWidget()
+        sidebar.setFixedWidth(200)
+        sidebar_layout = QVBoxLayout(sidebar)
+        sidebar_layout.setContentsMargins(0, 0, 0, 0)
+        new_btn = QPushButton("New conversation")
+        new_btn.clicked.connect(self.new_conversation)
+        self.conversation_model = ConversationModel(self.history)
+        self.conversation_view = QListView()
+        self.conversation_view.setModel(self.conversation_model)
+        self.conversation_view.setUniformItemSizes(True)
+        self.conversation_view.clicked.connect(
+            lambda index: self.open_conversation(index.data(ConversationIdRole))
+        )
+        sidebar_layout.addWidget(new_btn)
+        sidebar_layout.addWidget(self.conversation_view)
+        return sidebar
+
+    def open_conversation(self, conversation_id):
+        """
+        Switches to a stored conversation. Only its latest messages are
+        read; answers still streaming elsewhere keep being stored.
+        """
+        if conversation_id == self.chat_model.conversation_id:
+            return
+        self.chat_model.load_conversation(conversation_id)
+        self.chat_view.scrollToBottom()
+        self._on_scroll()
+        self._select_conversation()
+
+    def new_conversation(self):
+        if self.chat_model.conversation_id is None:
+            return
+        self.chat_model.new_conversation()
+        self._add_welcome()
+        self._select_conversation()
+
+    def _conversation_changed(self, conversation_id):
+        # New or newly active conversations move to the top of the list
+        self.conversation_model.refresh()
+        self._select_conversation()
+
+    def _select_conversation(self):
+        row = self.conversation_model.row_of(self.chat_model.conversation_id)
+        selection = self.conversation_view.selectionModel()
+        if row < 0:
+            selection.clearSelection()
+        else:
+            self.conversation_view.setCurrentIndex(self.conversation_model.index(row))
+
+    def _on_scroll(self, value=None):
+        bar = self.chat_view.verticalScrollBar()
+        at_top = bar.value() == bar.minimum()
+        self.chat_model.set_top_visible(at_top)
+        if at_top and self.chat_model.canFetchMore():
+            self.chat_model.fetchMore()
+        elif bar.value() == bar.maximum():
+            self.chat_model.trim()
+
+    def _anchor_scroll(self, parent, first, last):
+        # Older messages are prepended: remember the first visible row so
+        # the view does not jump
+        if first == 0 and self.chat_model.rowCount() > 0:
+            x = self.chat_view.viewport().width() // 2
+            top = next((i for i in (self.chat_view.indexAt(QPoint(x, y)) for y in range(0, 40, 5)) if i.isValid()),
+                       None)
+            self._scroll_anchor = top.row() if top is not None else 0
+
+    def _restore_scroll(self, parent, first, last):
+        if self._scroll_anchor is None:
+            return
+        row, self._scroll_anchor = self._scroll_anchor + last - first + 1, None
+        self.chat_view.scrollTo(self.chat_model.index(row), QListView.PositionAtTop)
 
     @asyncSlot()
     async def send_message(self):
@@ -85,37 +241,110 @@ class ChatWidget(QWidget):
         if not text:
             return
             
+        self.prefetch_timer.stop()
+
         # Add User Message
         self.chat_model.add_message("user", text)
         self.input_field.clear()
-        self.chat_view.scrollToBottom()
-        
-        # Disable input while processing
-        self.send_btn.setEnabled(False)
-        self.input_field.setEnabled(False)
-        
+
         # Add Empty AI Message placeholder
-        self.chat_model.add_message("ai", "Thinking...")
+        scheduler = self.rag_service.scheduler
+        waiting = not self.supersede and len(scheduler.requests()) >= scheduler.max_concurrent
+        message_id = self.chat_model.add_message("ai", "Queued..." if waiting else "Thinking...", streaming=True)
         self.chat_view.scrollToBottom()
-        
+
+        request = self.rag_service.submit_query(text, key=self.request_key, supersede=self.supersede,
+                                                bases=self.bases, filters=self.filters)
+        self._requests.add(request)
+        self._update_stop_button()
+
+        renderer = StreamUpdateScheduler(lambda t: self._render_stream(message_id, t), self.frame_interval_ms, self)
         try:
-            # Stream response
-            full_response = ""
-            # We'll rely on update_last_message to animate
-            first_chunk = True
-            
-            async for chunk in self.rag_service.stream_query(text):
-                if first_chunk:
-                    full_response = "" # Clear "Thinking..."
-                    first_chunk = False
-                
-                full_response += chunk
-                self.chat_model.update_last_message(full_response)
-                self.chat_view.scrollToBottom()
+            # Stream response; the renderer replaces the placeholder on its first flush
+            async for chunk in request.stream():
+                renderer.append(chunk)
+            self.last_stream_stats = renderer.finish()
+            if request.state == CANCELLED:
+                note = "*(superseded)*" if request.cancel_reason == "superseded" else "*(stopped)*"
+                self._render_stream(message_id, f"{renderer.text}\n\n{note}" if renderer.text else note)
+            logger.debug("Stream render stats: %s", self.last_stream_stats)
+            if self.prefetch_enabled:
+                logger.debug("Prefetch stats: %s", self.rag_service.prefetch_stats())
                 
         except Exception as e:
-            self.chat_model.update_last_message(f"Error: {str(e)}")
+            renderer.finish()
+            self.chat_model.update_message(message_id, f"Error: {str(e)}")
         finally:
-            self.send_btn.setEnabled(True)
-            self.input_field.setEnabled(True)
-            self.input_field.setFocus()
+            self.chat_model.finish_message(message_id)
+            renderer.deleteLater()
+            self._requests.discard(request)
+            self._update_stop_button()
+
+    def stop_requests(self):
+        """
+        Cancels this chat's answers that are still queued or streaming.
+        """
+        for request in list(self._requests):
+            request.cancel()
+
+    def _update_stop_button(self):
+        self.stop_btn.setVisible(bool(self._requests))
+
+    def _fill_bases_menu(self):
+        # Rebuilt on every open, so bases created meanwhile show up
+        self.bases_menu.clear()
+        for name in self.rag_service.knowledge_bases():
+            action = self.bases_menu.addAction(name)
+            action.setCheckable(True)
+            action.setChecked(name in self.bases)
+            action.toggled.connect(lambda checked, name=name: self.set_base_selected(name, checked))
+
+    def set_base_selected(self, name, selected):
+        """
+        Adds or removes a knowledge base from this chat's search; at least
+        one stays selected.
+        """
+        if selected and name not in self.bases:
+            self.bases.append(name)
+        elif not selected and name in self.bases and len(self.bases) > 1:
+            self.bases.remove(name)
+        self._update_bases_button()
+
+    def _update_bases_button(self):
+        self.bases_btn.setText("Search: " + ", ".join(self.bases))
+
+    @asyncSlot()
+    async def edit_filter(self):
+        """
+        Opens the filter dialog with the documents, sources and file types
+        of the selected bases.
+        """
+        try:
+            options = await self.rag_service.filter_options(self.bases)
+        except Exception as e:
+            logger.warning("Filter options unavailable: %r", e)
+            return
+        dialog = FilterDialog(options, self.filters, self)
+        dialog.accepted.connect(lambda: self.set_filter(dialog.retrieval_filter()))
+        dialog.finished.connect(dialog.deleteLater)
+        dialog.open()
+
+    def set_filter(self, retrieval_filter):
+        self.filters = retrieval_filter or None
+        self._update_filter_button()
+
+    def _update_filter_button(self):
+        self.filter_btn.setText("Filter: " + (self.filters.describe() if self.filters else "none"))
+
+    def _prefetch_draft(self):
+        draft = self.input_field.text().strip()
+        if len(draft) >= self.prefetch_min_chars:
+            self.rag_service.start_prefetch(draft, bases=self.bases, filters=self.filters)
+        else:
+            self.rag_service.cancel_prefetch()
+
+    def _render_stream(self, message_id, full_response):
+        with tracer.span("ui.stream_update", chars=len(full_response)):
+            self.chat_model.update_message(message_id, full_response)
+            if self.chat_model.row_of(message_id) >= 0:  # not in another conversation
+                self.chat_view.scrollToBottom()
@@ -0,0 +1,64 @@
+from PyQt5.QtCore import QAbstractListModel, Qt, QModelIndex
+
+# Data roles
+ConversationIdRole = Qt.UserRole + 1
+
+class ConversationModel(QAbstractListModel):
+    """
+    Stored conversations, most recently active first, fetched a page at a
+    time through canFetchMore/fetchMore as the view scrolls.
+    """
+
+    def __init__(self, history, page_size=50, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.page_size = page_size
+        self.conversations = []
+        self._exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.conversations)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.conversations):
+            return None
+        conversation = self.conversations[index.row()]
+        if role == Qt.DisplayRole:
+            return conversation['title'] or "New conversation"
+        if role == Qt.ToolTipRole:
+            return conversation['title']
+        if role == ConversationIdRole:
+            return conversation['id']
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        # An indexed read of one page; cheap enough for the UI thread
+        page = self.history.list_conversations(offset=len(self.conversations), limit=self.page_size)
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if page:
+            first = len(self.conversations)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self.conversations.extend(page)
+            self.endInsertRows()
+
+    def refresh(self):
+        """
+        Drops all loaded rows and fetches the first page again.
+        """
+        self.beginResetModel()
+        self.conversations = []
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def row_of(self, conversation_id):
+        for row, conversation in enumerate(self.conversations):
+            if conversation['id'] == conversation_id:
+                return row
+        return -1
@@ -0,0 +1,125 @@
+import mimetypes
+from datetime import datetime, time as dt_time, timedelta
+
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, QListWidget, QListWidgetItem, QLineEdit,
+    QCheckBox, QDateEdit, QDialogButtonBox, QPushButton
+)
+from PyQt5.QtCore import Qt, QDate
+
+from services.retrieval_filter import RetrievalFilter
+
+
+class FilterDialog(QDialog):
+    """
+    Edits the retrieval filter of a chat. Documents, sources and file types
+    are checkable lists (nothing checked: no condition on that field); the
+    ingestion date range has an optional start and end day, both inclusive.
+    `options` is RagService.filter_options() for the chat's bases.
+    """
+
+    def __init__(self, options, current=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Filter sources")
+        self.setMinimumSize(420, 560)
+        current = current or RetrievalFilter()
+        layout = QVBoxLayout(self)
+
+        documents_box = QGroupBox("Documents")
+        documents_layout = QVBoxLayout(documents_box)
+        self.document_search = QLineEdit()
+        self.document_search.setPlaceholderText("Find a document...")
+        self.document_search.setClearButtonEnabled(True)
+        self.document_search.textChanged.connect(self._filter_documents)
+        self.documents = self._checklist(options["documents"], current.doc_ids)
+        documents_layout.addWidget(self.document_search)
+        documents_layout.addWidget(self.documents)
+        layout.addWidget(documents_box, 2)
+
+        self.sources = self._checklist([(s, s) for s in options["sources"]], current.sources)
+        self.file_types = self._checklist(
+            [(t, f"{(mimetypes.guess_extension(t) or '').lstrip('.')} ({t})".lstrip()) for t in options["file_types"]],
+            current.file_types
+        )
+        for title, widget in (("Sources", self.sources), ("File types", self.file_types)):
+            box = QGroupBox(title)
+            QVBoxLayout(box).addWidget(widget)
+            layout.addWidget(box, 1)
+
+        dates_box = QGroupBox("Ingested")
+        dates_layout = QHBoxLayout(dates_box)
+        self.after_check, self.after_date = self._date_field("From", current.ingested_after, 0)
+        self.before_check, self.before_date = self._date_field("To", current.ingested_before, -1)
+        for widget in (self.after_check, self.after_date, self.before_check, self.before_date):
+            dates_layout.addWidget(widget)
+        layout.addWidget(dates_box)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear)
+        buttons.addButton(clear_btn, QDialogButtonBox.ResetRole)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    @staticmethod
+    def _checklist(entries, checked):
+        widget = QListWidget()
+        for value, label in entries:
+            item = QListWidgetItem(label)
+            item.setData(Qt.UserRole, value)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if checked and value in checked else Qt.Unchecked)
+            widget.addItem(item)
+        return widget
+
+    def _date_field(self, label, timestamp, day_offset):
+        check = QCheckBox(label)
+        edit = QDateEdit()
+        edit.setCalendarPopup(True)
+        edit.setDisplayFormat("yyyy-MM-dd")
+        edit.setDate(QDate.currentDate())
+        if timestamp is not None:
+            day = datetime.fromtimestamp(timestamp).date() + timedelta(days=day_offset)
+            edit.setDate(QDate(day.year, day.month, day.day))
+            check.setChecked(True)
+        edit.setEnabled(check.isChecked())
+        check.toggled.connect(edit.setEnabled)
+        return check, edit
+
+    def _filter_documents(self, text):
+        text = text.strip().lower()
+        for row in range(self.documents.count()):
+            item = self.documents.item(row)
+            item.setHidden(bool(text) and text not in item.text().lower())
+
+    @staticmethod
+    def _checked(widget):
+        values = [widget.item(row).data(Qt.UserRole) for row in range(widget.count())
+                  if widget.item(row).checkState() == Qt.Checked]
+        return values or None
+
+    @staticmethod
+    def _day_start(edit, day_offset=0):
+        day = edit.date().toPyDate() + timedelta(days=day_offset)
+        return datetime.combine(day, dt_time.min).timestamp()
+
+    def clear(self):
+        for widget in (self.documents, self.sources, self.file_types):
+            for row in range(widget.count()):
+                widget.item(row).setCheckState(Qt.Unchecked)
+        self.after_check.setChecked(False)
+        self.before_check.setChecked(False)
+
+    def retrieval_filter(self):
+        """
+        The edited filter, or None if it has no conditions.
+        """
+        return RetrievalFilter.from_dict({
+            "doc_ids": self._checked(self.documents),
+            "sources": self._checked(self.sources),
+            "file_types": self._checked(self.file_types),
+            # The end day is inclusive: the range ends at the next midnight
+            "ingested_after": self._day_start(self.after_date) if self.after_check.isChecked() else None,
+            "ingested_before": self._day_start(self.before_date, 1) if self.before_check.isChecked() else None,
+        })
@@ -0,0 +1,204 @@
+import asyncio
+from PyQt5.QtCore import QAbstractListModel, Qt, QModelIndex, QSize, QRect, pyqtSignal
+from PyQt5.QtGui import QPainter, QColor, QFont, QFontMetrics
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QStyle
+
+# Data roles
+DocIdRole = Qt.UserRole + 1
+SourceRole = Qt.UserRole + 2
+SummaryRole = Qt.UserRole + 3
+
+class KnowledgeModel(QAbstractListModel):
+    """
+    Document list backed by the service's catalog. Rows are fetched a page at a
+    time through canFetchMore/fetchMore as the view scrolls, and the search
+    filter is applied by the catalog query instead of hiding widgets.
+    """
+    loadFailed = pyqtSignal(str)
+
+    def __init__(self, rag_service, page_size=50, parent=None):
+        super().__init__(parent)
+        self.rag_service = rag_service
+        self.page_size = page_size
+        self.docs = []
+        self.filter_text = ""
+        self.kb = None  # knowledge base listed (None: the default one)
+        self._exhausted = False
+        self._fetching = False
+        self._generation = 0  # bumped on reset so late pages of an old filter are dropped
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.docs)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.docs):
+            return None
+        doc = self.docs[index.row()]
+        if role == Qt.DisplayRole:
+            return doc['title']
+        if role == DocIdRole:
+            return doc['doc_id']
+        if role == SourceRole:
+            return doc['source']
+        if role == SummaryRole:
+            return doc['summary']
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted and not self._fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        self._fetching = True
+        asyncio.ensure_future(self._fetch_page(self._generation))
+
+    async def _fetch_page(self, generation):
+        try:
+            page = await self.rag_service.get_all_documents(
+                offset=len(self.docs), limit=self.page_size, query=self.filter_text or None, kb=self.kb
+            )
+        except Exception as e:
+            if generation == self._generation:
+                self._fetching = False
+                self._exhausted = True
+                self.loadFailed.emit(str(e))
+            return
+        if generation != self._generation:
+            return
+
+        self._fetching = False
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if page:
+            first = len(self.docs)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self.docs.extend(page)
+            self.endInsertRows()
+
+    def set_filter(self, text):
+        self.filter_text = text.strip()
+        self.refresh()
+
+    def set_kb(self, kb):
+        self.kb = kb
+        self.refresh()
+
+    def refresh(self):
+        """
+        Drops all loaded rows and fetches the first page again.
+        """
+        self._generation += 1
+        self.beginResetModel()
+        self.docs = []
+        self._exhausted = False
+        self._fetching = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def _matches_filter(self, doc):
+        needle = self.filter_text.lower()
+        return not needle or any(needle in (doc[k] or "").lower() for k in ('title', 'source', 'summary'))
+
+    def upsert_document(self, doc):
+        """
+        Applies a saved document without rebuilding the list: updates its row
+        if loaded, otherwise appends it when the list is already complete
+        (new documents sort last).
+        """
+        for row, existing in enumerate(self.docs):
+            if existing['doc_id'] == doc['doc_id']:
+                self.docs[row] = doc
+                self.dataChanged.emit(self.index(row), self.index(row))
+                return
+        if self._exhausted and self._matches_filter(doc):
+            row = len(self.docs)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.docs.append(doc)
+            self.endInsertRows()
+
+class KnowledgeDelegate(QStyledItemDelegate):
+    """
+    Paints a document row (title, source, preview, separator) directly,
+    replacing the per-document DocumentCard widgets.
+    """
+    padding = 10
+    preview_limit = 300
+    preview_max_lines = 5
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.title_font = QFont()
+        self.title_font.setBold(True)
+        self.title_font.setPixelSize(14)
+        self.source_font = QFont()
+        self.source_font.setItalic(True)
+        self.source_font.setPixelSize(10)
+
+    def _preview(self, index):
+        text = index.data(SummaryRole) or ""
+        limit = self.preview_limit
+        return text[:limit] + "..." if len(text) > limit else text
+
+    def _layout(self, option, index):
+        """
+        Returns the rects (title, source, preview) for a row, relative to option.rect.
+        """
+        width = option.rect.width() - self.padding * 2
+        y = self.padding
+
+        title_h = QFontMetrics(self.title_font).height()
+        title_rect = QRect(self.padding, y, width, title_h)
+        y += title_h
+
+        source_rect = QRect()
+        if index.data(SourceRole):
+            source_h = QFontMetrics(self.source_font).height()
+            source_rect = QRect(self.padding, y, width, source_h)
+            y += source_h
+
+        y += 5  # preview margin-top
+        metrics = QFontMetrics(option.font)
+        preview = metrics.boundingRect(QRect(0, 0, width, 10000), Qt.TextWordWrap, self._preview(index))
+        max_height = metrics.lineSpacing() * self.preview_max_lines
+        preview_rect = QRect(self.padding, y, width, min(preview.height(), max_height))
+        return title_rect, source_rect, preview_rect
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        painter.save()
+        rect = option.rect
+
+        if option.state & QStyle.State_MouseOver:
+            painter.fillRect(rect, QColor("#fafafa"))
+
+        title_rect, source_rect, preview_rect = self._layout(option, index)
+        painter.translate(rect.topLeft())
+
+        painter.setFont(self.title_font)
+        painter.setPen(QColor("#9B59B6"))
+        painter.drawText(title_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                         QFontMetrics(self.title_font).elidedText(index.data(Qt.DisplayRole) or "", Qt.ElideRight, title_rect.width()))
+
+        if source_rect.isValid():
+            painter.setFont(self.source_font)
+            painter.setPen(QColor("#666"))
+            painter.drawText(source_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                             QFontMetrics(self.source_font).elidedText(index.data(SourceRole), Qt.ElideMiddle, source_rect.width()))
+
+        painter.setFont(option.font)
+        painter.setPen(QColor("#444"))
+        painter.setClipRect(preview_rect)
+        painter.drawText(preview_rect, Qt.TextWordWrap, self._preview(index))
+        painter.setClipping(False)
+
+        # Separator line
+        painter.setPen(QColor("#ddd"))
+        bottom = rect.height() - 1
+        painter.drawLine(self.padding, bottom, rect.width() - self.padding, bottom)
+
+        painter.restore()
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex):
+        _, _, preview_rect = self._layout(option, index)
+        # preview + margin-bottom + separator + padding
+        return QSize(option.rect.width(), preview_rect.bottom() + 10 + 1 + self.padding)
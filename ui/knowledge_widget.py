@@ -1,94 +1,81 @@
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem, 
+    QWidget, QVBoxLayout, QHBoxLayout, QListView,
     QLabel, QLineEdit, QTextEdit, QPushButton, QGroupBox, QMessageBox, QProgressBar,
-    QFileDialog, QFrame
+    QFileDialog, QFrame, QComboBox, QInputDialog
 )
 from PyQt5.QtCore import Qt, QTimer, QFileInfo
 from qasync import asyncSlot
 import asyncio
-
-class DocumentCard(QWidget):
-    def __init__(self, title, source, content_preview, parent=None):
-        super().__init__(parent)
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(10, 10, 10, 10)
-        
-        # Title
-        title_lbl = QLabel(title)
-        # 修改3: Title 使用淡紫色 (#9B59B6)
-        title_lbl.setStyleSheet("font-weight: bold; font-size: 14px; color: #9B59B6;")
-        layout.addWidget(title_lbl)
-        
-        # Source
-        if source:
-            src_lbl = QLabel(source)
-            src_lbl.setStyleSheet("color: #666; font-size: 10px; font-style: italic;")
-            layout.addWidget(src_lbl)
-            
-        # Preview
-        # 修改2: Preview 内容限定约5行 (Approx 200-300 chars, max-height 90px)
-        limit = 300
-        preview_text = content_preview[:limit] + "..." if len(content_preview) > limit else content_preview
-        prev_lbl = QLabel(preview_text)
-        prev_lbl.setWordWrap(True)
-        # Max height ~ 5 lines * 18px line-height
-        prev_lbl.setMaximumHeight(90)
-        prev_lbl.setStyleSheet("color: #444; margin-top: 5px; margin-bottom: 10px;")
-        layout.addWidget(prev_lbl)
-        
-        # Add Separator Line
-        line = QFrame()
-        line.setFrameShape(QFrame.HLine)
-        line.setFrameShadow(QFrame.Sunken)
-        line.setStyleSheet("background-color: #ddd;")
-        layout.addWidget(line)
-        
-        # Style the card (Remove box border to make it look like a list with separators)
-        self.setStyleSheet("""
-            DocumentCard {
-                background-color: transparent;
-            }
-        """)
+from .knowledge_model import KnowledgeModel, KnowledgeDelegate
 
 class KnowledgeWidget(QWidget):
     def __init__(self, rag_service, parent=None):
         super().__init__(parent)
         self.rag_service = rag_service
+        # An uploaded file's text stays spooled on disk; the editor only shows
+        # a preview of it (see browse_file)
+        self.pending_file = None
+        # Knowledge base shown in the list and saved into (None: the default one)
+        self.kb = None
         self.init_ui()
         
     def init_ui(self):
         main_layout = QVBoxLayout(self)
         
-        # 1. Header
+        # 1. Header, with the knowledge base being managed
         header = QLabel("Knowledge Base")
         header.setStyleSheet("font-size: 16px; font-weight: bold; margin-bottom: 10px;")
-        main_layout.addWidget(header)
+        self.kb_combo = QComboBox()
+        self.kb_combo.setStyleSheet("color: black; background-color: white; padding: 3px;")
+        self.kb_combo.addItems(self.rag_service.knowledge_bases())
+        self.kb_combo.currentTextChanged.connect(self.select_kb)
+        self.new_kb_btn = QPushButton("New")
+        self.new_kb_btn.setToolTip("Create a knowledge base")
+        self.new_kb_btn.clicked.connect(self.create_kb)
+        header_layout = QHBoxLayout()
+        header_layout.addWidget(header)
+        header_layout.addStretch()
+        header_layout.addWidget(self.kb_combo)
+        header_layout.addWidget(self.new_kb_btn)
+        main_layout.addLayout(header_layout)
         
-        # 2. Document List Area
-        self.doc_list = QListWidget()
+        # 2. Search + Document List Area
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search documents...")
+        self.search_input.setStyleSheet("color: black; background-color: white; border: 1px solid #ccc; padding: 5px;")
+        self.search_input.setClearButtonEnabled(True)
+        # Debounce typing so the catalog is queried once per pause, not per key
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(lambda: self.doc_model.set_filter(self.search_input.text()))
+        self.search_input.textChanged.connect(self.search_timer.start)
+        main_layout.addWidget(self.search_input)
+
+        # Model/delegate list: rows are painted, not one widget per document,
+        # and pages are fetched lazily as the list scrolls.
+        self.doc_list = QListView()
+        self.doc_model = KnowledgeModel(self.rag_service, parent=self)
+        self.doc_model.loadFailed.connect(
+            lambda msg: QMessageBox.critical(self, "Error", f"Failed to load documents: {msg}")
+        )
+        self.doc_list.setModel(self.doc_model)
+        self.doc_list.setItemDelegate(KnowledgeDelegate(self.doc_list))
         
         # 修改: 彻底禁用选中和焦点框，解决视觉错位问题
-        self.doc_list.setSelectionMode(QListWidget.NoSelection)
+        self.doc_list.setSelectionMode(QListView.NoSelection)
         self.doc_list.setFocusPolicy(Qt.NoFocus)
+        self.doc_list.setMouseTracking(True)  # hover highlight
 
-        # Style: 仅保留 Hover 效果
         self.doc_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: white;
                 border: none;
             }
-            QListWidget::item {
-                border: none;
-                padding: 0px;
-            }
-            QListWidget::item:hover {
-                background-color: #fafafa; /* 鼠标悬停时的极淡灰色 */
-            }
         """)
         # Enable smooth scrolling (pixel-based instead of item-based)
-        self.doc_list.setVerticalScrollMode(QListWidget.ScrollPerPixel)
+        self.doc_list.setVerticalScrollMode(QListView.ScrollPerPixel)
         self.doc_list.verticalScrollBar().setSingleStep(10) # Adjust scrolling speed
-        # 修改1: 增加 Document 之间的间隔 (10 -> 20) -> Adjusted to 0 for separator line style
         self.doc_list.setSpacing(0)
         main_layout.addWidget(self.doc_list)
         
@@ -114,7 +101,16 @@ class KnowledgeWidget(QWidget):
             QPushButton:hover { background-color: #e0e0e0; }
         """)
         self.upload_btn.clicked.connect(self.browse_file)
-        main_layout.addWidget(self.upload_btn)
+
+        # Folder Import Button (bulk ingest of a whole directory tree)
+        self.folder_btn = QPushButton("📁 Import Folder")
+        self.folder_btn.setStyleSheet(self.upload_btn.styleSheet())
+        self.folder_btn.clicked.connect(self.import_folder)
+
+        upload_layout = QHBoxLayout()
+        upload_layout.addWidget(self.upload_btn)
+        upload_layout.addWidget(self.folder_btn)
+        main_layout.addLayout(upload_layout)
         
         self.title_input = QLineEdit()
         self.title_input.setPlaceholderText("Document Title")
@@ -130,7 +126,18 @@ class KnowledgeWidget(QWidget):
         self.add_btn = QPushButton("Save")
         self.add_btn.setStyleSheet("background-color: #5c6bc0; color: white; padding: 8px;")
         self.add_btn.clicked.connect(self.add_document)
-        main_layout.addWidget(self.add_btn)
+
+        # Drops an uploaded file without saving it; only shown while one is pending
+        self.remove_file_btn = QPushButton("Remove File")
+        self.remove_file_btn.setToolTip("Discard the uploaded file and type or paste text instead")
+        self.remove_file_btn.setStyleSheet("background-color: #eee; color: #333; padding: 8px;")
+        self.remove_file_btn.clicked.connect(self.remove_pending_file)
+        self.remove_file_btn.setVisible(False)
+
+        save_layout = QHBoxLayout()
+        save_layout.addWidget(self.add_btn, 1)
+        save_layout.addWidget(self.remove_file_btn)
+        main_layout.addLayout(save_layout)
         
         self.progress = QProgressBar()
         self.progress.setVisible(False)
@@ -142,19 +149,28 @@ class KnowledgeWidget(QWidget):
         # Initial Load: Trigger after UI is ready
         QTimer.singleShot(100, self.load_documents)
         
-    @asyncSlot()
-    async def load_documents(self):
-        self.doc_list.clear()
+    def load_documents(self):
+        self.doc_model.refresh()
+
+    def select_kb(self, name):
+        if not name:
+            return
+        self.kb = name
+        self.doc_model.set_kb(name)
+
+    def create_kb(self):
+        name, ok = QInputDialog.getText(self, "New Knowledge Base", "Name (letters, digits, '-' or '_'):")
+        name = name.strip()
+        if not ok or not name:
+            return
         try:
-            docs = await self.rag_service.get_all_documents()
-            for doc in docs:
-                item = QListWidgetItem(self.doc_list)
-                # Use 'summary' instead of 'content'
-                card = DocumentCard(doc['title'], doc['source'], doc['summary'])
-                item.setSizeHint(card.sizeHint())
-                self.doc_list.setItemWidget(item, card)
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load documents: {str(e)}")
+            self.rag_service.create_knowledge_base(name)
+        except ValueError as e:
+            QMessageBox.warning(self, "Invalid Name", str(e))
+            return
+        if self.kb_combo.findText(name) < 0:
+            self.kb_combo.addItem(name)
+        self.kb_combo.setCurrentText(name)
 
     @asyncSlot()
     async def browse_file(self):
@@ -167,37 +183,126 @@ class KnowledgeWidget(QWidget):
             return
             
         self.upload_btn.setEnabled(False)
+        self.add_btn.setEnabled(False)
         self.upload_btn.setText("Parsing file...")
         self.progress.setRange(0, 0)
+        self.progress.setFormat("Parsing %p%")
         self.progress.setVisible(True)
         
         try:
-            # Parse file content
-            content = await self.rag_service.extract_text_from_file(file_path)
-            
-            # Auto-fill fields
-            file_info = QFileInfo(file_path)
-            self.title_input.setText(file_info.fileName())
-            # self.source_input.setText(file_path) # Removed
-            self.content_input.setPlainText(content)
-            
+            # Parse file content (spooled to disk page by page)
+            extracted = await self.rag_service.extract_file(file_path, progress_callback=self.update_fraction)
+            if not extracted.preview.strip():
+                extracted.discard()
+                raise ValueError("No text extracted")
+            self.set_pending_file(extracted)
+
         except Exception as e:
             QMessageBox.critical(self, "Parsing Error", f"Failed to parse file:\n{str(e)}")
         finally:
             self.upload_btn.setEnabled(True)
+            self.add_btn.setEnabled(True)
             self.upload_btn.setText("📂 Upload Local File (PDF, Docx, etc)")
             self.progress.setVisible(False)
+            self.progress.resetFormat()
+
+    def set_pending_file(self, extracted):
+        """
+        Makes a parsed file the text to save, replacing any earlier one.
+        """
+        self.clear_pending_file()
+        self.pending_file = extracted
+
+        # Auto-fill fields; large texts would freeze the editor, so it
+        # only shows the beginning
+        self.title_input.setText(QFileInfo(extracted.file_path).fileName())
+        preview = extracted.preview
+        if extracted.chars > len(preview):
+            preview += f"\n\n[Preview: {len(preview):,} of {extracted.chars:,} characters. The whole file is saved.]"
+        self.content_input.setPlainText(preview)
+        self.content_input.setReadOnly(True)
+        self.remove_file_btn.setVisible(True)
+
+    def clear_pending_file(self):
+        if self.pending_file is not None:
+            self.pending_file.discard()
+            self.pending_file = None
+            self.content_input.clear()
+            self.content_input.setReadOnly(False)
+            self.remove_file_btn.setVisible(False)
+
+    def remove_pending_file(self):
+        # The title is cleared too unless it was edited after the upload
+        if self.pending_file is not None and \
+                self.title_input.text() == QFileInfo(self.pending_file.file_path).fileName():
+            self.title_input.clear()
+        self.clear_pending_file()
+
+    @asyncSlot()
+    async def import_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder")
+        if not folder:
+            return
+
+        self.folder_btn.setEnabled(False)
+        self.upload_btn.setEnabled(False)
+        self.add_btn.setEnabled(False)
+        self.folder_btn.setText("Scanning folder...")
+        self.progress.setRange(0, 0)
+        self.progress.setVisible(True)
+
+        def on_file_done(done, total, entry):
+            self.folder_btn.setText(f"Importing {done}/{total}...")
+            self.update_progress(done, total)
+
+        try:
+            report = await self.rag_service.ingest_directory(folder, progress_callback=on_file_done, kb=self.kb)
+            failed = [r for r in report if r['status'] != 'ok']
+            chunks = sum(r['chunks'] for r in report)
+            message = f"Imported {len(report) - len(failed)} of {len(report)} files ({chunks} chunks)."
+            if failed:
+                details = "\n".join(f"{QFileInfo(r['path']).fileName()}: {r['error']}" for r in failed[:10])
+                if len(failed) > 10:
+                    details += f"\n... and {len(failed) - 10} more"
+                QMessageBox.warning(self, "Import Finished", f"{message}\n\nFailed:\n{details}")
+            else:
+                QMessageBox.information(self, "Import Finished", message)
+            self.load_documents()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to import folder: {str(e)}")
+        finally:
+            self.folder_btn.setEnabled(True)
+            self.upload_btn.setEnabled(True)
+            self.add_btn.setEnabled(True)
+            self.folder_btn.setText("📁 Import Folder")
+            self.progress.setVisible(False)
+
+    def update_progress(self, done, total):
+        # Switch from the indeterminate spinner to a real bar on the first batch
+        if self.progress.maximum() != total:
+            self.progress.setRange(0, total)
+        self.progress.setValue(done)
+
+    def update_fraction(self, done, total):
+        # Pages, bytes or characters can exceed the progress bar's int range
+        if self.progress.maximum() != 1000:
+            self.progress.setRange(0, 1000)
+        self.progress.setValue(int(done * 1000 / total) if total else 0)
 
     @asyncSlot()
     async def add_document(self):
         title = self.title_input.text().strip()
-        content = self.content_input.toPlainText().strip()
+        pending_file = self.pending_file
+        content = "" if pending_file else self.content_input.toPlainText().strip()
         
-        if not title or not content:
+        if not title or not (content or pending_file):
             QMessageBox.warning(self, "Invalid Input", "Title and Content are required.")
             return
             
+        kb = self.kb  # the selection may change while saving
         self.add_btn.setEnabled(False)
+        self.upload_btn.setEnabled(False)  # the spooled file is in use
+        self.remove_file_btn.setEnabled(False)
         self.progress.setRange(0, 0) # Indeterminate
         self.progress.setVisible(True)
         
@@ -207,18 +312,36 @@ class KnowledgeWidget(QWidget):
             # We can generate a quick summary here OR just truncate.
             # For true summary, we'd need an LLM call. Assuming simple truncation or service-side logic.
             # We'll pass empty source as it was removed from UI but API might need it.
-            count = await self.rag_service.add_document(title, content, source="Local/Manual")
+            if pending_file:
+                # Uploaded file: ingested from its spooled text, never loaded whole
+                self.progress.setFormat("Saving %p%")
+                count = await self.rag_service.ingest_extracted(
+                    title, pending_file, source=pending_file.file_path,
+                    progress_callback=self.update_fraction, kb=kb
+                )
+            else:
+                count = await self.rag_service.add_document(
+                    title, content, source="Local/Manual",
+                    progress_callback=self.update_progress, kb=kb
+                )
             QMessageBox.information(self, "Success", f"Added document with {count} chunks.")
             
             # Clear inputs
             self.title_input.clear()
+            if pending_file:
+                self.clear_pending_file()
             self.content_input.clear()
             
-            # Refresh list
-            await self.load_documents()
+            # Update just this row instead of reloading the list
+            doc = await self.rag_service.get_document(title, kb=kb)
+            if doc and kb == self.kb:
+                self.doc_model.upsert_document(doc)
             
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to add document: {str(e)}")
         finally:
             self.add_btn.setEnabled(True)
+            self.upload_btn.setEnabled(True)
+            self.remove_file_btn.setEnabled(True)
             self.progress.setVisible(False)
+            self.progress.resetFormat()
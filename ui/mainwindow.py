@@ -1,11 +1,13 @@
-from PyQt5.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QSplitter
+from PyQt5.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QSplitter, QDockWidget
 from PyQt5.QtCore import Qt
 
 from .chat_widget import ChatWidget
 from .knowledge_widget import KnowledgeWidget
+from .perf_panel import PerformancePanel
 
 class MainWindow(QMainWindow):
-    def __init__(self, rag_service):
+    def __init__(self, rag_service, span_buffer=None, show_perf_panel=False, prefetch=False, supersede=False,
+                 history=None):
         super().__init__()
         self.rag_service = rag_service
         self.setWindowTitle("Tongyi RAG Desktop")
@@ -21,7 +23,8 @@ class MainWindow(QMainWindow):
         splitter = QSplitter(Qt.Horizontal)
         
         # Left: Chat
-        self.chat_widget = ChatWidget(self.rag_service)
+        self.chat_widget = ChatWidget(self.rag_service, prefetch=prefetch, supersede=supersede,
+                                      history=history)
         splitter.addWidget(self.chat_widget)
         
         # Right: Knowledge Base
@@ -34,6 +37,17 @@ class MainWindow(QMainWindow):
         splitter.setCollapsible(1, False)
         
         main_layout.addWidget(splitter)
+
+        # Optional performance dock (View > Performance), fed by the session's
+        # span ring buffer
+        self.perf_dock = None
+        if span_buffer is not None:
+            self.perf_dock = QDockWidget("Performance", self)
+            self.perf_dock.setObjectName("perf_dock")
+            self.perf_dock.setWidget(PerformancePanel(span_buffer))
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.perf_dock)
+            self.perf_dock.setVisible(show_perf_panel)
+            self.menuBar().addMenu("View").addAction(self.perf_dock.toggleViewAction())
         
         # Apply strict styling
         self.setStyleSheet("""
@@ -0,0 +1,146 @@
+import re
+from PyQt5.QtCore import QSizeF
+from PyQt5.QtGui import QTextDocument, QFont
+
+_FENCE_RE = re.compile(r"^\s{0,3}(```|~~~)")
+_BULLET_RE = re.compile(r"^ ?[-*+]\s")
+_ORDERED_RE = re.compile(r"^\s{0,3}\d+[.)]\s")
+
+
+def split_completed_blocks(text, start=0):
+    """
+    Scans `text` from `start` (which must be a block boundary) and returns the
+    end offsets of markdown blocks that can no longer change as more text is
+    appended: paragraphs followed by a blank line, closed code fences and
+    top-level bullet items followed by the next item. Only lines terminated by
+    a newline are considered; the trailing partial line is always open.
+    Ordered lists stay open until a non-list block starts, because Qt 5 cannot
+    render a list that starts at a number other than 1.
+    """
+    boundaries = []
+    pos = start
+    in_fence = None  # the fence marker while inside a code block
+    block_kind = None  # None (empty), "para", "bullet" or "ordered"
+
+    while True:
+        nl = text.find("\n", pos)
+        if nl < 0:
+            break
+        line = text[pos:nl]
+        fence = _FENCE_RE.match(line)
+
+        if in_fence:
+            if fence and fence.group(1) == in_fence:
+                in_fence = None
+                boundaries.append(nl + 1)
+                block_kind = None
+        elif not line.strip():
+            if block_kind in ("para", "bullet"):
+                boundaries.append(nl + 1)
+                block_kind = None
+        else:
+            ordered = _ORDERED_RE.match(line)
+            indented = line.startswith(("  ", "\t"))
+            if block_kind == "ordered" and (ordered or indented):
+                pass
+            elif block_kind == "ordered" or (block_kind and (fence or ordered)):
+                # A different kind of block starts; close the previous one
+                boundaries.append(pos)
+                block_kind = None
+            elif block_kind == "bullet" and _BULLET_RE.match(line):
+                boundaries.append(pos)
+                block_kind = None
+
+            if fence:
+                in_fence = fence.group(1)
+                block_kind = "fence"
+            elif block_kind is None:
+                if ordered:
+                    block_kind = "ordered"
+                elif _BULLET_RE.match(line):
+                    block_kind = "bullet"
+                else:
+                    block_kind = "para"
+        pos = nl + 1
+    return boundaries
+
+
+class IncrementalMarkdownDocument:
+    """
+    Renders a markdown text that only ever grows (a streaming answer).
+    Completed blocks are parsed and laid out once as separate documents; only
+    the trailing open block is re-parsed on each update, so the per-update cost
+    stays flat as the answer grows.
+    """
+
+    def __init__(self, font, text_width, block_spacing=6, margin=4):
+        # `margin` matches QTextDocument's default documentMargin so the row
+        # does not jump when it is swapped for a normal document at the end
+        self.font = QFont(font)  # copy: the style option owning `font` is temporary
+        self.text_width = text_width
+        self.block_spacing = block_spacing
+        self.margin = margin
+        self.text = ""
+        self._committed = 0  # chars of `text` already in completed blocks
+        self._blocks = []  # laid-out QTextDocuments for completed blocks
+        self._height = 0.0
+        self._ideal_width = 0.0
+        self._tail = self._make_doc("")
+        self.blocks_parsed = 0
+
+    def _make_doc(self, markdown):
+        doc = QTextDocument()
+        doc.setDocumentMargin(0)
+        doc.setDefaultFont(self.font)
+        doc.setMarkdown(markdown)
+        doc.setTextWidth(self.text_width - 2 * self.margin)
+        return doc
+
+    def set_text(self, text):
+        if not text.startswith(self.text[:self._committed]):
+            # Not an append (e.g. the "Thinking..." placeholder was replaced)
+            self._blocks = []
+            self._committed = 0
+            self._height = 0.0
+            self._ideal_width = 0.0
+        self.text = text
+
+        start = self._committed
+        for end in split_completed_blocks(text, start):
+            block = text[start:end]
+            if block.strip():
+                doc = self._make_doc(block)
+                self._blocks.append(doc)
+                self._height += doc.size().height() + self.block_spacing
+                self._ideal_width = max(self._ideal_width, doc.idealWidth())
+                self.blocks_parsed += 1
+            start = end
+        self._committed = start
+        self._tail = self._make_doc(text[start:])
+
+    def set_text_width(self, text_width):
+        if text_width == self.text_width:
+            return
+        self.text_width = text_width
+        self._height = 0.0
+        self._ideal_width = 0.0
+        for doc in self._blocks:
+            doc.setTextWidth(text_width - 2 * self.margin)
+            self._height += doc.size().height() + self.block_spacing
+            self._ideal_width = max(self._ideal_width, doc.idealWidth())
+        self._tail.setTextWidth(text_width - 2 * self.margin)
+
+    def size(self):
+        return QSizeF(self.idealWidth(), self._height + self._tail.size().height() + 2 * self.margin)
+
+    def idealWidth(self):
+        return max(self._ideal_width, self._tail.idealWidth()) + 2 * self.margin
+
+    def draw(self, painter, ctx):
+        painter.save()
+        painter.translate(self.margin, self.margin)
+        for doc in self._blocks:
+            doc.documentLayout().draw(painter, ctx)
+            painter.translate(0, doc.size().height() + self.block_spacing)
+        self._tail.documentLayout().draw(painter, ctx)
+        painter.restore()
@@ -0,0 +1,71 @@
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QPushButton, QLabel
+)
+from PyQt5.QtCore import Qt, QTimer
+
+
+class PerformancePanel(QWidget):
+    """
+    Rolling p50/p95 latency per stage (span name) for the current session,
+    read from a telemetry RingBufferSink. Refreshes once a second while shown.
+    """
+    columns = ("Stage", "Count", "p50 ms", "p95 ms", "Last ms")
+
+    def __init__(self, span_buffer, window=200, refresh_ms=1000, parent=None):
+        super().__init__(parent)
+        self.span_buffer = span_buffer
+        self.window = window  # most recent spans per stage used for the percentiles
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+
+        self.table = QTableWidget(0, len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionMode(QTableWidget.NoSelection)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        footer = QHBoxLayout()
+        self.summary_label = QLabel(f"last {window} spans per stage")
+        self.summary_label.setStyleSheet("color: #666;")
+        clear_btn = QPushButton("Clear")
+        clear_btn.clicked.connect(self.clear)
+        footer.addWidget(self.summary_label)
+        footer.addStretch()
+        footer.addWidget(clear_btn)
+        layout.addLayout(footer)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(refresh_ms)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def clear(self):
+        self.span_buffer.clear()
+        self.refresh()
+
+    def refresh(self):
+        stats = self.span_buffer.stats(window=self.window)
+        self.table.setRowCount(len(stats))
+        for row, name in enumerate(sorted(stats)):
+            stage = stats[name]
+            values = (name, stage["count"], stage["p50"], stage["p95"], stage["last"])
+            for col, value in enumerate(values):
+                text = f"{value:.1f}" if isinstance(value, float) else str(value)
+                item = self.table.item(row, col)
+                if item is None:
+                    item = QTableWidgetItem()
+                    if col:
+                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                    self.table.setItem(row, col, item)
+                item.setText(text)
@@ -0,0 +1,63 @@
+import time
+from PyQt5.QtCore import QObject, QTimer
+
+
+class StreamUpdateScheduler(QObject):
+    """
+    Buffers streamed tokens and pushes the accumulated text to the view at most
+    once per frame interval, instead of re-rendering on every chunk.
+    Call finish() at the end of the stream to flush whatever is left.
+    """
+
+    def __init__(self, flush_callback, interval_ms=33, parent=None):
+        super().__init__(parent)
+        self.flush_callback = flush_callback
+        self.interval_ms = interval_ms
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self.reset()
+
+    def reset(self):
+        self._timer.stop()
+        self.text = ""
+        self._dirty = False
+        self._last_flush = 0.0
+        self._started = None
+        self.tokens = 0
+        self.updates = 0
+
+    def append(self, chunk):
+        if self._started is None:
+            self._started = time.perf_counter()
+        self.text += chunk
+        self.tokens += 1
+        self._dirty = True
+        if not self._timer.isActive():
+            # Flush right away if a frame has passed since the last update
+            since_last = (time.perf_counter() - self._last_flush) * 1000
+            self._timer.start(int(max(0, self.interval_ms - since_last)))
+
+    def flush(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._last_flush = time.perf_counter()
+        self.updates += 1
+        self.flush_callback(self.text)
+
+    def finish(self):
+        self._timer.stop()
+        self.flush()
+        return self.stats()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            "tokens": self.tokens,
+            "updates": self.updates,
+            "seconds": round(elapsed, 3),
+            "tokens_per_sec": round(self.tokens / elapsed, 1) if elapsed else 0.0,
+            "updates_per_sec": round(self.updates / elapsed, 1) if elapsed else 0.0,
+        }